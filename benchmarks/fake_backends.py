@@ -0,0 +1,297 @@
+"""
+Deterministic stand-ins for the model-backed step interpreters.
+
+Each fake subclasses the real interpreter and only replaces the model call
+(no downloads, no GPU): it sleeps for a configurable synthetic latency and
+returns outputs derived from a hash of its inputs, so the same program on the
+same images always produces the same result (model_id is 'fake', so persistent
+step caches never mix fake and real results). Parsing, state handling, box/mask
+post-processing and HTML rendering are the real code paths.
+
+    from engine.utils import ProgramInterpreter
+    from benchmarks.fake_backends import register_fake_step_interpreters
+
+    interpreter = ProgramInterpreter(
+        step_interpreters=register_fake_step_interpreters('nlvr', latency=0.05))
+"""
+import time
+import zlib
+import numpy as np
+from types import SimpleNamespace
+
+from engine.step_interpreters import (
+    VQAInterpreter, EvalInterpreter, ResultInterpreter, FindInterpreter, CountInterpreter,
+    FilterInterpreter, ExistsInterpreter, ChangeInterpreter, DiffInterpreter, LocInterpreter, Loc2Interpreter,
+    CropInterpreter, CropRightOfInterpreter, CropLeftOfInterpreter, CropFrontOfInterpreter,
+    CropInFrontOfInterpreter, CropInFrontInterpreter, CropBehindInterpreter, CropAheadInterpreter,
+    CropBelowInterpreter, CropAboveInterpreter, FaceDetInterpreter, SegmentInterpreter,
+    SelectInterpreter, ColorpopInterpreter, BgBlurInterpreter, ReplaceInterpreter, EmojiInterpreter,
+    ListInterpreter, ClassifyInterpreter, TagInterpreter)
+from engine.profiler import span
+
+COCO_CATEGORIES = ['person', 'car', 'dog', 'cat', 'chair', 'table', 'tree', 'sky', 'building', 'road']
+
+
+def seeded_rng(*keys):
+    """numpy RandomState seeded from the given values, stable across runs and processes"""
+    return np.random.RandomState(zlib.crc32(repr(keys).encode()))
+
+
+def image_key(img):
+    return (img.mode, img.size)
+
+
+class FakeModel:
+    """Sleeps for the synthetic latency inside a 'forward' span"""
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def forward(self):
+        with span('forward'):
+            if self.latency > 0:
+                time.sleep(self.latency)
+
+
+def fake_boxes(rng, img_size, n):
+    W, H = img_size
+    x1 = rng.randint(0, max(1, W // 2), n)
+    y1 = rng.randint(0, max(1, H // 2), n)
+    x2 = np.minimum(W - 1, x1 + rng.randint(8, max(9, W // 2), n))
+    y2 = np.minimum(H - 1, y1 + rng.randint(8, max(9, H // 2), n))
+    return np.stack([x1, y1, x2, y2], 1).tolist()
+
+
+class FakeVQAInterpreter(VQAInterpreter):
+    model_id = 'fake'
+    answers = ['yes', 'no', 'red', 'blue', 'white', 'black', '1', '2', '3']
+
+    def __init__(self, latency=0.0):
+        print(f'Registering {self.step_name} step (fake)')
+        self.model = FakeModel(latency)
+
+    def predict(self, img, question):
+        self.model.forward()
+        rng = seeded_rng(image_key(img), question)
+        return self.answers[rng.randint(len(self.answers))]
+
+    def predict_batch(self, imgs, questions):
+        self.model.forward()
+        answers, confidences = [], []
+        for img, question in zip(imgs, questions):
+            rng = seeded_rng(image_key(img), question)
+            answers.append(self.answers[rng.randint(len(self.answers))])
+            confidences.append(float(rng.uniform(0.2, 1.0)))
+        return answers, confidences
+
+
+class FakeFindInterpreter(FindInterpreter):
+    model_id = 'fake'
+    def __init__(self, latency=0.0, max_detections=4):
+        print(f'Registering {self.step_name} step (fake)')
+        self.model = FakeModel(latency)
+        self.max_detections = max_detections
+
+    def find(self, image, object_query):
+        if isinstance(object_query, str):
+            object_query = [object_query]
+        self.model.forward()
+        rng = seeded_rng(image_key(image), object_query)
+        n = rng.randint(0, self.max_detections + 1)
+        return [dict(box=box, category=object_query[rng.randint(len(object_query))],
+                     score=float(rng.uniform(0.1, 1.0)))
+                for box in fake_boxes(rng, image.size, n)]
+
+    def find_batch(self, images, object_query):
+        return [self.find(image, object_query) for image in images]
+
+
+class FakeBlipVQA:
+    def __init__(self, latency=0.0):
+        self.model = FakeModel(latency)
+
+    def ask(self, image, question):
+        self.model.forward()
+        return FakeVQAInterpreter.answers[seeded_rng(image_key(image), question).randint(2)]
+
+
+class FakeFilterInterpreter(FilterInterpreter):
+    model_id = 'fake'
+    def __init__(self, latency=0.0):
+        print(f'Registering {self.step_name} step (fake)')
+        self.vqa = FakeBlipVQA(latency)
+
+
+class FakeLocInterpreter(LocInterpreter):
+    model_id = 'fake'
+    def __init__(self, latency=0.0, thresh=0.1, nms_thresh=0.5, max_detections=8):
+        print(f'Registering {self.step_name} step (fake)')
+        self.model = FakeModel(latency)
+        self.thresh = thresh
+        self.nms_thresh = nms_thresh
+        self.max_detections = max_detections
+
+    def predict(self, img, obj_name):
+        self.model.forward()
+        rng = seeded_rng(image_key(img), obj_name)
+        n = rng.randint(0, self.max_detections + 1)
+        boxes = fake_boxes(rng, img.size, n)
+        scores = rng.uniform(0, 1, n).tolist()
+        return self.select_boxes(boxes, scores, img.size)
+
+
+class FakeLoc2Interpreter(FakeLocInterpreter, Loc2Interpreter):
+    pass
+
+
+class FakeSegmentInterpreter(SegmentInterpreter):
+    model_id = 'fake'
+    def __init__(self, latency=0.0, num_segments=6, map_size=(96, 128)):
+        print(f'Registering {self.step_name} step (fake)')
+        self.model = FakeModel(latency)
+        self.num_segments = num_segments
+        self.map_size = map_size
+
+    def pred_seg(self, img):
+        self.model.forward()
+        instance_map, segments_info = fake_panoptic(seeded_rng(image_key(img)), self.map_size, self.num_segments)
+        return self.instance_masks(instance_map, segments_info, dict(enumerate(COCO_CATEGORIES)), img.size)
+
+
+def fake_panoptic(rng, map_size, num_segments):
+    """Low-resolution instance map (H, W) of axis-aligned blobs plus MaskFormer-style segments_info"""
+    H, W = map_size
+    instance_map = np.zeros((H, W), dtype=np.int32)
+    segments_info = []
+    for inst_id in range(1, num_segments + 1):
+        y1, x1 = rng.randint(0, H - 4), rng.randint(0, W - 4)
+        y2, x2 = rng.randint(y1 + 4, H + 1), rng.randint(x1 + 4, W + 1)
+        instance_map[y1:y2, x1:x2] = inst_id
+    for inst_id in np.unique(instance_map):
+        if inst_id > 0:
+            segments_info.append(dict(id=int(inst_id), label_id=int(rng.randint(len(COCO_CATEGORIES)))))
+    return instance_map, segments_info
+
+
+class FakeClipMixin:
+    def similarity(self, images, text):
+        self.model.forward()
+        rng = seeded_rng([image_key(img) for img in images], text)
+        return rng.uniform(0, 1, (len(images), len(text))).astype(np.float32)
+
+
+class FakeSelectInterpreter(FakeClipMixin, SelectInterpreter):
+    model_id = 'fake'
+    def __init__(self, latency=0.0):
+        print(f'Registering {self.step_name} step (fake)')
+        self.model = FakeModel(latency)
+
+
+class FakeClassifyInterpreter(FakeClipMixin, ClassifyInterpreter):
+    model_id = 'fake'
+    def __init__(self, latency=0.0):
+        print(f'Registering {self.step_name} step (fake)')
+        self.model = FakeModel(latency)
+
+
+class FakeFaceDetector(FakeModel):
+    def detect(self, img):
+        self.forward()
+        rng = seeded_rng(img.shape)
+        H, W = img.shape[:2]
+        boxes = fake_boxes(rng, (W, H), rng.randint(0, 4))
+        return np.array([box + [rng.uniform(0.5, 1.0)] for box in boxes]).reshape(-1, 5)
+
+
+class FakeFaceDetInterpreter(FaceDetInterpreter):
+    model_id = 'fake'
+    def __init__(self, latency=0.0):
+        print(f'Registering {self.step_name} step (fake)')
+        self.model = FakeFaceDetector(latency)
+
+
+class FakeInpaintPipeline(FakeModel):
+    def __call__(self, prompt, image, mask_image, **kwargs):
+        self.forward()
+        return SimpleNamespace(images=[image.copy()])
+
+
+class FakeReplaceInterpreter(ReplaceInterpreter):
+    model_id = 'fake'
+    def __init__(self, latency=0.0):
+        print(f'Registering {self.step_name} step (fake)')
+        self.pipe = FakeInpaintPipeline(latency)
+
+
+class FakeListInterpreter(ListInterpreter):
+    model_id = 'fake'
+    def __init__(self, latency=0.0):
+        print(f'Registering {self.step_name} step (fake)')
+        self.model = FakeModel(latency)
+
+    def get_list(self, text, list_max):
+        self.model.forward()
+        return [f'{text} {i}' for i in range(int(list_max))]
+
+
+def register_fake_step_interpreters(dataset='nlvr', latency=0.0):
+    """
+    Same step sets as engine.step_interpreters.register_step_interpreters with every
+    model call replaced. latency is seconds per model call, either one number or a
+    dict of step name -> seconds (missing steps take 0).
+    """
+    if not isinstance(latency, dict):
+        latency = {step: latency for step in
+                   ['VQA', 'FIND', 'FILTER', 'LOC', 'FACEDET', 'SEG', 'SELECT', 'REPLACE', 'LIST', 'CLASSIFY']}
+    lat = lambda step: latency.get(step, 0.0)
+
+    if dataset=='nlvr':
+        find = FakeFindInterpreter(lat('FIND'))
+        return dict(
+            VQA=FakeVQAInterpreter(lat('VQA')),
+            EVAL=EvalInterpreter(),
+            RESULT=ResultInterpreter(),
+            FIND=find,
+            COUNT=CountInterpreter(),
+            FILTER=FakeFilterInterpreter(lat('FILTER')),
+            EXISTS=ExistsInterpreter(),
+            CHANGED=ChangeInterpreter(),
+            DIFF=DiffInterpreter(find)
+        )
+    elif dataset=='gqa':
+        return dict(
+            LOC=FakeLocInterpreter(lat('LOC')),
+            COUNT=CountInterpreter(),
+            CROP=CropInterpreter(),
+            CROP_RIGHTOF=CropRightOfInterpreter(),
+            CROP_LEFTOF=CropLeftOfInterpreter(),
+            CROP_FRONTOF=CropFrontOfInterpreter(),
+            CROP_INFRONTOF=CropInFrontOfInterpreter(),
+            CROP_INFRONT=CropInFrontInterpreter(),
+            CROP_BEHIND=CropBehindInterpreter(),
+            CROP_AHEAD=CropAheadInterpreter(),
+            CROP_BELOW=CropBelowInterpreter(),
+            CROP_ABOVE=CropAboveInterpreter(),
+            VQA=FakeVQAInterpreter(lat('VQA')),
+            EVAL=EvalInterpreter(),
+            RESULT=ResultInterpreter()
+        )
+    elif dataset=='imageEdit':
+        return dict(
+            FACEDET=FakeFaceDetInterpreter(lat('FACEDET')),
+            SEG=FakeSegmentInterpreter(lat('SEG')),
+            SELECT=FakeSelectInterpreter(lat('SELECT')),
+            COLORPOP=ColorpopInterpreter(),
+            BGBLUR=BgBlurInterpreter(),
+            REPLACE=FakeReplaceInterpreter(lat('REPLACE')),
+            EMOJI=EmojiInterpreter(),
+            RESULT=ResultInterpreter()
+        )
+    elif dataset=='okDet':
+        return dict(
+            FACEDET=FakeFaceDetInterpreter(lat('FACEDET')),
+            LIST=FakeListInterpreter(lat('LIST')),
+            CLASSIFY=FakeClassifyInterpreter(lat('CLASSIFY')),
+            RESULT=ResultInterpreter(),
+            TAG=TagInterpreter(),
+            LOC=FakeLoc2Interpreter(lat('LOC'), thresh=0.05, nms_thresh=0.3)
+        )
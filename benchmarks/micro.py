@@ -0,0 +1,226 @@
+"""
+Offline micro-benchmarks for the non-model hot paths.
+
+    python -m benchmarks.micro --out micro.json
+    python -m benchmarks.micro --sizes 512 1024 --filter heatmap --compare micro.json
+
+Model calls go through benchmarks.fake_backends (zero latency by default), so
+every number here is interpreter, parsing, post-processing or rendering time.
+Results are written as JSON together with the commit they were measured on;
+--compare prints the ratio against an earlier results file.
+"""
+import io
+import os
+import sys
+import json
+import time
+import timeit
+import argparse
+import platform
+import statistics
+import subprocess
+import contextlib
+import numpy as np
+from PIL import Image
+
+from engine.utils import ProgramInterpreter
+from engine.step_interpreters import parse_step, SegmentInterpreter
+from engine.nms import nms
+from vis_utils import html_embed_image, vis_masks
+from generate_heatmaps import compute_difference
+from benchmarks.fake_backends import register_fake_step_interpreters, fake_panoptic, seeded_rng, COCO_CATEGORIES
+
+DEFAULT_SIZES = [256, 512, 1024, 2048]
+
+STEPS = [
+    "ANSWER0=FIND(image=LEFT,object='cup')",
+    "ANSWER1=COUNT(region=ANSWER0)",
+    "ANSWER2=VQA(image=ANSWER0,question='What color is the cup?')",
+    "ANSWER3=EVAL(expr='{ANSWER1} > 2 and {ANSWER2} == \\'red\\'')",
+    "FINAL_RESULT=RESULT(var=ANSWER3)",
+]
+
+PROGRAM = """ANSWER0=FIND(image=LEFT,object='cup')
+ANSWER1=COUNT(region=ANSWER0)
+ANSWER2=FILTER(region=ANSWER0,attribute='red')
+ANSWER3=EXISTS(region=ANSWER2)
+ANSWER4=CHANGED(image=LEFT)
+ANSWER5=VQA(image=ANSWER4,question='What changed?')
+FINAL_RESULT=RESULT(var=ANSWER5)"""
+
+
+def synthetic_image(width, height, seed=0):
+    """Smooth random RGB image, compresses and diffs like a photo rather than noise"""
+    rng = np.random.RandomState(seed)
+    small = rng.randint(0, 256, (max(2, height // 32), max(2, width // 32), 3), dtype=np.uint8)
+    return Image.fromarray(small).resize((width, height), Image.BILINEAR)
+
+
+def synthetic_pair(width, height):
+    left = synthetic_image(width, height)
+    right = np.array(left)
+    y, x = height // 3, width // 3
+    right[y:y + height // 6, x:x + width // 6] = 255 - right[y:y + height // 6, x:x + width // 6]
+    return left, Image.fromarray(right)
+
+
+def sizes_wh(size):
+    """Long side -> (width, height) at 4:3"""
+    return size, size * 3 // 4
+
+
+def measure(fn, repeat=5, min_time=0.05):
+    """Per-call timings in ms; calls per repeat are picked so each repeat takes at least min_time"""
+    timer = timeit.Timer(fn)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2 if elapsed == 0 else max(2, int(min_time / elapsed) + 1)
+    runs = [t / number * 1000 for t in timer.repeat(repeat, number)]
+    return dict(min_ms=min(runs), median_ms=statistics.median(runs), mean_ms=statistics.mean(runs),
+                number=number, repeat=repeat)
+
+
+def bench_parse_step(sizes, repeat):
+    yield dict(name='parse_step', **measure(lambda: [parse_step(step) for step in STEPS], repeat),
+               params=dict(steps=len(STEPS)))
+
+
+def bench_nms(sizes, repeat):
+    for n in [10, 100, 1000]:
+        rng = seeded_rng('nms', n)
+        xy = rng.uniform(0, 900, (n, 2))
+        boxes = np.concatenate([xy, xy + rng.uniform(10, 120, (n, 2))], 1).tolist()
+        scores = rng.uniform(0, 1, n).tolist()
+        yield dict(name='nms', params=dict(boxes=n), **measure(lambda: nms(boxes, scores, 0.5), repeat))
+
+
+def bench_seg_postprocess(sizes, repeat):
+    seg = SegmentInterpreter.__new__(SegmentInterpreter)
+    id2label = dict(enumerate(COCO_CATEGORIES))
+    instance_map, segments_info = fake_panoptic(seeded_rng('seg'), (96, 128), 8)
+    for size in sizes:
+        img_size = sizes_wh(size)
+        yield dict(name='seg_instance_masks', params=dict(size=size, segments=len(segments_info)),
+                   **measure(lambda: seg.instance_masks(instance_map, segments_info, id2label, img_size), repeat))
+
+
+def bench_vis(sizes, repeat):
+    seg = SegmentInterpreter.__new__(SegmentInterpreter)
+    id2label = dict(enumerate(COCO_CATEGORIES))
+    instance_map, segments_info = fake_panoptic(seeded_rng('seg'), (96, 128), 4)
+    for size in sizes:
+        img = synthetic_image(*sizes_wh(size))
+        objs = seg.instance_masks(instance_map, segments_info, id2label, img.size)
+        labels = [obj['category'] for obj in objs]
+        yield dict(name='vis_masks', params=dict(size=size, masks=len(objs)),
+                   **measure(lambda: vis_masks(img, objs, labels), repeat))
+        # a fresh copy per call so the embed cache does not hide the encode cost
+        yield dict(name='html_embed_image', params=dict(size=size, cached=False),
+                   **measure(lambda: html_embed_image(img.copy(), 300), repeat))
+        yield dict(name='html_embed_image', params=dict(size=size, cached=True),
+                   **measure(lambda: html_embed_image(img, 300), repeat))
+
+
+def bench_heatmap(sizes, repeat):
+    for size in sizes:
+        left, right = synthetic_pair(*sizes_wh(size))
+        left, right = np.array(left), np.array(right)
+        yield dict(name='compute_difference', params=dict(size=size),
+                   **measure(lambda: compute_difference(left, right), repeat))
+
+
+def bench_interpreter(sizes, repeat):
+    with contextlib.redirect_stdout(io.StringIO()):
+        interpreter = ProgramInterpreter(
+            step_interpreters=register_fake_step_interpreters('nlvr', latency=0.0), verbose=False)
+    for size in sizes[:2]:
+        left, right = synthetic_pair(*sizes_wh(size))
+        run = lambda: interpreter.execute(PROGRAM, dict(LEFT=left, RIGHT=right))
+        run_inspect = lambda: interpreter.execute(PROGRAM, dict(LEFT=left, RIGHT=right), inspect=True)[2].html()
+        yield dict(name='interpreter', params=dict(size=size, steps=PROGRAM.count('\n') + 1, inspect=False),
+                   **measure(run, repeat))
+        yield dict(name='interpreter', params=dict(size=size, steps=PROGRAM.count('\n') + 1, inspect=True),
+                   **measure(run_inspect, repeat))
+
+
+BENCHMARKS = dict(
+    parse_step=bench_parse_step,
+    nms=bench_nms,
+    seg=bench_seg_postprocess,
+    vis=bench_vis,
+    heatmap=bench_heatmap,
+    interpreter=bench_interpreter,
+)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    import cv2
+    return dict(
+        commit=git_commit(),
+        time=time.strftime('%Y-%m-%dT%H:%M:%S'),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        cpu_count=os.cpu_count(),
+        numpy=np.__version__,
+        opencv=cv2.__version__,
+        pillow=Image.__version__)
+
+
+def result_key(result):
+    return result['name'] + json.dumps(result['params'], sort_keys=True)
+
+
+def run(names, sizes, repeat):
+    results = []
+    for name in names:
+        for result in BENCHMARKS[name](sizes, repeat):
+            results.append(result)
+            print(f"{result['name']:<20} {json.dumps(result['params']):<45} "
+                  f"{result['median_ms']:10.3f} ms", file=sys.stderr)
+    return dict(environment=environment(), results=results)
+
+
+def compare(report, baseline):
+    """Print median time ratios (current / baseline) for the benchmarks present in both"""
+    base = {result_key(r): r for r in baseline['results']}
+    print(f"vs {baseline['environment'].get('commit')}:")
+    for result in report['results']:
+        old = base.get(result_key(result))
+        if old is None:
+            continue
+        ratio = result['median_ms'] / old['median_ms'] if old['median_ms'] > 0 else float('inf')
+        print(f"{result['name']:<20} {json.dumps(result['params']):<45} "
+              f"{old['median_ms']:10.3f} -> {result['median_ms']:10.3f} ms  x{ratio:.2f}")
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Micro-benchmarks for the non-model hot paths')
+    parser.add_argument('--out', help='write results JSON here (default: stdout)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='image long sides')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--filter', nargs='+', choices=sorted(BENCHMARKS), help='only run these benchmarks')
+    parser.add_argument('--compare', help='earlier results JSON to compare against')
+    args = parser.parse_args()
+
+    report = run(args.filter or list(BENCHMARKS), args.sizes, args.repeat)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
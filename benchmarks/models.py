@@ -0,0 +1,255 @@
+"""
+CPU throughput sweep for the real models behind the step interpreters.
+
+    python -m benchmarks.models --out models.json
+    python -m benchmarks.models --models owlvit clip --batch-sizes 1 4 --threads 4 8 --precisions fp32 bf16
+
+For every model x torch thread count x precision x batch size this runs a few
+warm-up batches, then times --iters batches built from the images in assets/.
+It reports images/s, p50/p99 batch latency and the peak RSS seen while the
+configuration was running. Precisions:
+
+    fp32  the interpreters' default
+    bf16  torch.autocast('cpu', dtype=torch.bfloat16)
+    int8  torch.quantization.quantize_dynamic on nn.Linear (transformer models only)
+
+Weights are downloaded on first use, exactly as the interpreters do.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import contextlib
+import numpy as np
+import torch
+from PIL import Image
+
+from engine.profiler import host_memory
+from generate_heatmaps import find_image_pairs
+from benchmarks.micro import environment
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets')
+QUESTION = 'What is in the image?'
+QUERIES = ['a photo of a car', 'a photo of a person', 'a photo of a camel']
+
+
+def load_fixtures(size=640, assets_dir=ASSETS_DIR):
+    """The image-pair assets as RGB images resized to a common size (DSFD batches need equal shapes)"""
+    paths = [path for _, path1, path2 in find_image_pairs(assets_dir) for path in (path1, path2)]
+    if not paths:
+        raise FileNotFoundError(f'No fixture images found in {assets_dir}')
+    return [Image.open(p).convert('RGB').resize((size, size * 3 // 4), Image.BILINEAR) for p in paths]
+
+
+class PeakRSS:
+    """Samples the process RSS on a background thread and keeps the maximum"""
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, host_memory())
+
+    def __enter__(self):
+        self.peak = host_memory()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, host_memory())
+
+
+class ModelBench:
+    """One model as used by an interpreter: load() once, then run(images) on a batch"""
+    name = None
+    model_id = None
+    steps = []
+    precisions = ['fp32', 'bf16', 'int8']
+
+    def load(self):
+        raise NotImplementedError
+
+    def run(self, images):
+        raise NotImplementedError
+
+    def quantize(self):
+        self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class BlipVQABench(ModelBench):
+    name = 'blip_vqa'
+    model_id = 'Salesforce/blip-vqa-capfilt-large'
+    steps = ['VQA']
+
+    def load(self):
+        from transformers import AutoProcessor, BlipForQuestionAnswering
+        self.processor = AutoProcessor.from_pretrained(self.model_id)
+        self.model = BlipForQuestionAnswering.from_pretrained(self.model_id).eval()
+
+    def run(self, images):
+        inputs = self.processor(images, [QUESTION] * len(images), return_tensors='pt', padding=True)
+        outputs = self.model.generate(**inputs)
+        return self.processor.batch_decode(outputs, skip_special_tokens=True)
+
+
+class BlipBaseBench(BlipVQABench):
+    name = 'blip_base'
+    model_id = 'Salesforce/blip-vqa-base'
+    steps = ['FILTER']
+
+
+class OwlViTBench(ModelBench):
+    name = 'owlvit'
+    model_id = 'google/owlvit-large-patch14'
+    steps = ['FIND', 'LOC']
+
+    def load(self):
+        from transformers import OwlViTProcessor, OwlViTForObjectDetection
+        self.processor = OwlViTProcessor.from_pretrained(self.model_id)
+        self.model = OwlViTForObjectDetection.from_pretrained(self.model_id).eval()
+
+    def run(self, images):
+        inputs = self.processor(text=[QUERIES] * len(images), images=images, return_tensors='pt')
+        outputs = self.model(**inputs)
+        target_sizes = torch.Tensor([img.size[::-1] for img in images])
+        return self.processor.post_process_object_detection(outputs, threshold=0.1, target_sizes=target_sizes)
+
+
+class ClipBench(ModelBench):
+    name = 'clip'
+    model_id = 'openai/clip-vit-large-patch14'
+    steps = ['SELECT', 'CLASSIFY']
+
+    def load(self):
+        from transformers import CLIPProcessor, CLIPModel
+        self.processor = CLIPProcessor.from_pretrained(self.model_id)
+        self.model = CLIPModel.from_pretrained(self.model_id).eval()
+
+    def run(self, images):
+        inputs = self.processor(text=QUERIES, images=images, return_tensors='pt', padding=True)
+        return self.model(**inputs).logits_per_image.softmax(-1)
+
+
+class MaskFormerBench(ModelBench):
+    name = 'maskformer'
+    model_id = 'facebook/maskformer-swin-base-coco'
+    steps = ['SEG']
+
+    def load(self):
+        from transformers import MaskFormerFeatureExtractor, MaskFormerForInstanceSegmentation
+        self.processor = MaskFormerFeatureExtractor.from_pretrained(self.model_id)
+        self.model = MaskFormerForInstanceSegmentation.from_pretrained(self.model_id).eval()
+
+    def run(self, images):
+        inputs = self.processor(images=images, return_tensors='pt')
+        outputs = self.model(**inputs)
+        return self.processor.post_process_panoptic_segmentation(outputs)
+
+
+class DSFDBench(ModelBench):
+    name = 'dsfd'
+    model_id = 'DSFDDetector'
+    steps = ['FACEDET']
+    precisions = ['fp32', 'bf16']  # all convolutions, dynamic int8 quantization does not apply
+
+    def load(self):
+        import face_detection
+        self.model = face_detection.build_detector(
+            self.model_id, confidence_threshold=.5, nms_iou_threshold=.3, device=torch.device('cpu'))
+
+    def run(self, images):
+        return self.model.batched_detect(np.stack([np.array(img) for img in images]))
+
+
+MODELS = {bench.name: bench for bench in
+          [BlipVQABench, BlipBaseBench, OwlViTBench, ClipBench, MaskFormerBench, DSFDBench]}
+
+
+def precision_context(precision):
+    if precision == 'bf16':
+        return torch.autocast('cpu', dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+
+def sweep_model(bench, fixtures, batch_sizes, threads, precisions, iters, warmup):
+    print(f'Loading {bench.name} ({bench.model_id})', file=sys.stderr)
+    bench.load()
+    fp32_model = getattr(bench, 'model', None)
+
+    for precision in precisions:
+        if precision not in bench.precisions:
+            print(f'{bench.name}: skipping unsupported precision {precision}', file=sys.stderr)
+            continue
+        bench.model = fp32_model
+        if precision == 'int8':
+            bench.quantize()
+
+        for num_threads in threads:
+            torch.set_num_threads(num_threads)
+            for batch_size in batch_sizes:
+                batches = [[fixtures[(i * batch_size + j) % len(fixtures)] for j in range(batch_size)]
+                           for i in range(warmup + iters)]
+                latencies = []
+                with PeakRSS() as rss, torch.inference_mode(), precision_context(precision):
+                    for i, batch in enumerate(batches):
+                        start = time.perf_counter()
+                        bench.run(batch)
+                        if i >= warmup:
+                            latencies.append(time.perf_counter() - start)
+
+                latencies = np.array(latencies) * 1000
+                result = dict(
+                    model=bench.name,
+                    model_id=bench.model_id,
+                    steps=bench.steps,
+                    precision=precision,
+                    threads=num_threads,
+                    batch_size=batch_size,
+                    iters=iters,
+                    images_per_s=batch_size * iters / (latencies.sum() / 1000),
+                    p50_ms=float(np.percentile(latencies, 50)),
+                    p99_ms=float(np.percentile(latencies, 99)),
+                    peak_rss_mb=rss.peak / 2**20)
+                print(f"{bench.name:<11} {precision:<5} threads={num_threads:<3} batch={batch_size:<3} "
+                      f"{result['images_per_s']:8.2f} img/s  p50 {result['p50_ms']:9.1f} ms  "
+                      f"p99 {result['p99_ms']:9.1f} ms  rss {result['peak_rss_mb']:8.0f} MB", file=sys.stderr)
+                yield result
+
+    bench.model = None
+    fp32_model = None
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='CPU throughput sweep for the interpreter models')
+    parser.add_argument('--out', help='write results JSON here (default: stdout)')
+    parser.add_argument('--models', nargs='+', choices=sorted(MODELS), default=list(MODELS))
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--threads', type=int, nargs='+', default=sorted({1, 4, os.cpu_count() or 1}))
+    parser.add_argument('--precisions', nargs='+', choices=['fp32', 'bf16', 'int8'], default=['fp32', 'bf16', 'int8'])
+    parser.add_argument('--iters', type=int, default=10, help='timed batches per configuration')
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--image-size', type=int, default=640, help='long side the fixtures are resized to')
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.image_size)
+    results = []
+    for name in args.models:
+        results += list(sweep_model(
+            MODELS[name](), fixtures, args.batch_sizes, args.threads, args.precisions, args.iters, args.warmup))
+
+    report = dict(environment=dict(environment(), torch=torch.__version__, device='cpu',
+                                   fixtures=len(fixtures), image_size=args.image_size),
+                  results=results)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
@@ -1,11 +1,18 @@
 from PIL import Image
 from engine.utils import ProgramInterpreter
 from engine.step_interpreters import register_step_interpreters 
+from engine.streaming import StreamingPipeline, iter_json_strings, iter_sse_content
+from engine.image_store import default_store
+from engine.step_cache import StepCache
+from engine.validate import ProgramValidator, DEFAULT_INIT_VARS
+from engine.program_templates import TemplateProgramGenerator, is_pair_program
+from generate_heatmaps import compute_difference, encode_png
 
 import base64
 import requests
 import json
 import os
+import time
 from config import OPENAI_API_KEY
 
 register_step_interpreters()
@@ -40,27 +47,25 @@ GPT_TASK_PROMPT = (
 
 
 def encode_image_to_base64(image_path):
+    # In-memory PNG bytes (e.g. generate_heatmaps.encode_png) skip the disk round-trip
+    if isinstance(image_path, bytes):
+        return base64.b64encode(image_path).decode('utf-8')
     with open(image_path, 'rb') as f:
         return base64.b64encode(f.read()).decode('utf-8')
 
-def get_comparison_questions(img1_path, img2_path, diff_path):
+def build_vision_payload(prompt, img1_path, img2_path, diff_path):
     img1_b64 = encode_image_to_base64(img1_path)
     img2_b64 = encode_image_to_base64(img2_path)
     diff_b64 = encode_image_to_base64(diff_path)
 
-    headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json"
-    }
-
-    payload = {
+    return {
         "model": "gpt-4o",
         "max_tokens": 1000,
         "messages": [
             {
                 "role": "user",
                 "content": [
-                    {"type": "text", "text": GPT_TASK_PROMPT},
+                    {"type": "text", "text": prompt},
                     {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img1_b64}"}},
                     {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img2_b64}"}},
                     {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{diff_b64}"}}
@@ -69,6 +74,13 @@ def get_comparison_questions(img1_path, img2_path, diff_path):
         ]
     }
 
+def get_comparison_questions(img1_path, img2_path, diff_path):
+    headers = {
+        "Authorization": f"Bearer {OPENAI_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    payload = build_vision_payload(GPT_TASK_PROMPT, img1_path, img2_path, diff_path)
+
     res = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
     if res.status_code != 200:
         raise RuntimeError(f"OpenAI API error: {res.status_code} - {res.text}")
@@ -86,8 +98,8 @@ def get_comparison_questions(img1_path, img2_path, diff_path):
         print(f"Failed to parse GPT response: {e}")
         return []
 
-def get_follow_up_qs(img1_path, img2_path, diff_path, parent_q):
-    FOLLOW_UP_PROMPT = f"""
+def build_follow_up_prompt(parent_q):
+    return f"""
     "You are given two images of the same scene and a difference heatmap. "
     "The difference heatmap is a binary image where white pixels indicate regions of change. "
     "You are also given these high-level questions about differences between the images:
@@ -129,32 +141,15 @@ def get_follow_up_qs(img1_path, img2_path, diff_path, parent_q):
         "parent_question_1": ["refined_1", "refined_2", "refined_3"],
         "parent_question_2": ["refined_1", "refined_2"]
    "}}"
-    
+
 """
-    img1_b64 = encode_image_to_base64(img1_path)
-    img2_b64 = encode_image_to_base64(img2_path)
-    diff_b64 = encode_image_to_base64(diff_path)
 
+def get_follow_up_qs(img1_path, img2_path, diff_path, parent_q):
     headers = {
         "Authorization": f"Bearer {OPENAI_API_KEY}",
         "Content-Type": "application/json"
     }
-
-    payload = {
-        "model": "gpt-4o",
-        "max_tokens": 1000,
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": FOLLOW_UP_PROMPT},
-                    {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img1_b64}"}},
-                    {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img2_b64}"}},
-                    {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{diff_b64}"}}
-                ]
-            }
-        ]
-    }
+    payload = build_vision_payload(build_follow_up_prompt(parent_q), img1_path, img2_path, diff_path)
 
     res = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
     if res.status_code != 200:
@@ -173,7 +168,27 @@ def get_follow_up_qs(img1_path, img2_path, diff_path, parent_q):
         print(f"Failed to parse GPT response: {e}")
         return []
 
-    
+def stream_vision_questions(prompt, img1_path, img2_path, diff_path):
+    """Yield (parent, question) pairs as soon as each question string is complete in the streamed response"""
+    headers = {
+        "Authorization": f"Bearer {OPENAI_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    payload = build_vision_payload(prompt, img1_path, img2_path, diff_path)
+    payload["stream"] = True
+
+    with requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload, stream=True) as res:
+        if res.status_code != 200:
+            raise RuntimeError(f"OpenAI API error: {res.status_code} - {res.text}")
+        yield from iter_json_strings(iter_sse_content(res))
+
+def stream_comparison_questions(img1_path, img2_path, diff_path):
+    for _, question in stream_vision_questions(GPT_TASK_PROMPT, img1_path, img2_path, diff_path):
+        yield question
+
+def stream_follow_up_qs(img1_path, img2_path, diff_path, parent_q):
+    yield from stream_vision_questions(build_follow_up_prompt(parent_q), img1_path, img2_path, diff_path)
+
 
 def clean_program(content):
     lines = content.strip().split("\n")
@@ -183,16 +198,20 @@ def clean_program(content):
         lines = lines[:-1]
     return "\n".join(lines).strip()
 
-def generate_symbolic_program(question, image_side):
+def generate_symbolic_program(question, image_side, feedback=None):
     prompt = f"""
 Generate a VisProg program to answer the question. Use ONLY these functions:
 - VQA(image=..., question=...)
 - FIND(image=..., object=...)
 - COUNT(region=...)
 - EXISTS(region=...)
+- CHANGED(image=...)
+- DIFF(object=...)
 - RESULT(var=...)
 
 IMPORTANT:
+- CHANGED(image=...) returns the regions of the image that changed; pass them as image=... to FIND or VQA to look only at changed areas.
+- DIFF(object=...) finds the object in both images at once and returns the instances that were added, removed or moved (DIFF0_ADDED, DIFF0_REMOVED and DIFF0_MOVED hold each kind). For presence or count questions use DIFF instead of FIND; such a program does not use the Image, and its result must say whether the images differ, e.g. EXISTS(region=DIFF0).
 - If the question can be answered using VQA, use VQA(image=..., question=...) first.
 - Each question should have only one object as subject; Break queries with multiple subject 
     down to multiple questions. 
@@ -206,6 +225,8 @@ IMPORTANT:
 Question: {question}
 Image: {image_side}
 """.strip()
+    if feedback:
+        prompt += "\n\nYour previous program for this question was invalid:\n" + "\n".join(feedback) + "\nReturn a corrected program."
 
     headers = {
         "Authorization": f"Bearer {OPENAI_API_KEY}",
@@ -225,13 +246,34 @@ Image: {image_side}
 
     return clean_program(res.json()['choices'][0]['message']['content'])
 
+# Common question shapes are answered by local templates; the rest go to GPT-4
+program_generator = TemplateProgramGenerator(fallback=generate_symbolic_program)
+
+def run_question(interpreter, state, prog_left, prog_right=None):
+    """
+    (left_ans, right_ans, different) for one question. Without prog_right, prog_left
+    is a DIFF program over both images: it runs once and its result is whether they
+    differ (both answers None). Otherwise the two sides run through execute_pair.
+    """
+    norm = lambda s: str(s).strip().lower()
+    if prog_right is None:
+        answer, _, _ = interpreter.execute(prog_left, state, inspect=True, scoped=True)
+        return None, None, norm(answer) not in ('false', 'no', '0', '')
+    (left_ans, _, _), (right_ans, _, _) = interpreter.execute_pair(prog_left, prog_right, state, inspect=True)
+    return left_ans, right_ans, norm(left_ans) != norm(right_ans)
+
+def print_answers(left_ans, right_ans, different):
+    if left_ans is not None or right_ans is not None:
+        print(f"\nLEFT : {left_ans}")
+        print(f"RIGHT: {right_ans}")
+    print(f"➤ Different? → {'Yes' if different else 'No'}")
+
 def execute_visprog_symbolic_followup(img1_path, img2_path, questions):
-    interpreter = ProgramInterpreter(dataset='nlvr')
-    img_left = Image.open(img1_path).convert("RGB")
-    img_right = Image.open(img2_path).convert("RGB")
-    img_left.thumbnail((640, 640), Image.Resampling.LANCZOS)
-    img_right.thumbnail((640, 640), Image.Resampling.LANCZOS)
-    state = {"LEFT": img_left, "RIGHT": img_right}
+    interpreter = ProgramInterpreter(dataset='nlvr', step_cache=StepCache())
+    validator = ProgramValidator(interpreter.step_interpreters, init_vars=DEFAULT_INIT_VARS + ('IMAGE_PLACEHOLDER',))
+    img_left = default_store.get(img1_path, size=(640, 640))
+    img_right = default_store.get(img2_path, size=(640, 640))
+    state = {"LEFT": img_left, "RIGHT": img_right}  # shared, read-only; each program runs on a scoped overlay
 
     difference_counter = 0
     print("\n🔎 Executing Symbolic Programs via VisProg\n" + "="*60)
@@ -241,76 +283,227 @@ def execute_visprog_symbolic_followup(img1_path, img2_path, questions):
             letter = chr(97 + j)
             print(f"\n→ Question {i}{letter}: {q}")
             try:
-                prog_template = generate_symbolic_program(q, "IMAGE_PLACEHOLDER")
-                prog_L = prog_template.replace("IMAGE_PLACEHOLDER", "LEFT")
-                prog_R = prog_template.replace("IMAGE_PLACEHOLDER", "RIGHT")
-                # prog_L = generate_symbolic_program(q, "LEFT")
-                # prog_R = generate_symbolic_program(q, "RIGHT")
+                prog_template = validator.check(
+                    program_generator(q, "IMAGE_PLACEHOLDER"),
+                    regenerate=lambda prog, errors: generate_symbolic_program(q, "IMAGE_PLACEHOLDER", feedback=errors))
+                if is_pair_program(prog_template):
+                    print("[BOTH IMAGES DSL]")
+                    print(prog_template)
+                    prog_L, prog_R = prog_template, None
+                else:
+                    prog_L = prog_template.replace("IMAGE_PLACEHOLDER", "LEFT")
+                    prog_R = prog_template.replace("IMAGE_PLACEHOLDER", "RIGHT")
+                    # prog_L = generate_symbolic_program(q, "LEFT")
+                    # prog_R = generate_symbolic_program(q, "RIGHT")
+
+                    print("[LEFT DSL]")
+                    print(prog_L)
+                    print("\n[RIGHT DSL]")
+                    print(prog_R)
+                # A side pair stops after FIND with NO_DIFFERENCE on both sides when no box touches a changed pixel
+                left_ans, right_ans, different = run_question(interpreter, state, prog_L, prog_R)
+
+                print_answers(left_ans, right_ans, different)
+                if different:
+                    difference_counter += 1
 
-                print("[LEFT DSL]")
-                print(prog_L)
-                left_ans, _, _ = interpreter.execute(prog_L, state, inspect=True)
+            except Exception as e:
+                print(f"Error: {e}")
 
-                print("\n[RIGHT DSL]")
-                print(prog_R)
-                right_ans, _, _ = interpreter.execute(prog_R, state, inspect=True)
+    print("\nTOTAL DIFFERENCES FOUND:", difference_counter)
+    cache = interpreter.step_cache
+    print(f"Reused {cache.hits} of {cache.hits + cache.misses} model steps")
+    print(program_generator.summary())
+    
+def execute_visprog_symbolic_tree(img1_path, img2_path, questions, max_differences=None, time_budget=None,
+                                  min_confidence=0.5):
+    """
+    Pruned version of execute_visprog_symbolic_followup. Every parent question is first
+    asked directly of both images in one batched VQA pass; only parents whose answers
+    differ, or where either answer has confidence below min_confidence, get their
+    follow-up programs generated and executed (differing parents first). The search
+    stops after max_differences differences or time_budget seconds.
+    """
+    interpreter = ProgramInterpreter(dataset='nlvr', step_cache=StepCache())
+    validator = ProgramValidator(interpreter.step_interpreters, init_vars=DEFAULT_INIT_VARS + ('IMAGE_PLACEHOLDER',))
+    img_left = default_store.get(img1_path, size=(640, 640))
+    img_right = default_store.get(img2_path, size=(640, 640))
+    state = {"LEFT": img_left, "RIGHT": img_right}  # shared, read-only; each program runs on a scoped overlay
+    norm = lambda s: str(s).strip().lower()
+    start = time.perf_counter()
+
+    parents = list(questions)
+    answers, confidences = interpreter.step_interpreters['VQA'].predict_batch(
+        [img_left, img_right] * len(parents), [q for q in parents for _ in range(2)])
+    frontier = []
+    print("\n🔎 Checking parent questions on both images\n" + "="*60)
+    for i, parent_question in enumerate(parents):
+        left_ans, right_ans = answers[2 * i], answers[2 * i + 1]
+        confidence = min(confidences[2 * i], confidences[2 * i + 1])
+        differ = norm(left_ans) != norm(right_ans)
+        print(f"\n→ {parent_question}\n  LEFT: {left_ans}  RIGHT: {right_ans}  (confidence {confidence:.2f})")
+        if differ or confidence < min_confidence:
+            frontier.append((not differ, confidence, parent_question))
+        else:
+            print(f"  pruned {len(questions[parent_question])} follow-up questions")
+    frontier.sort(key=lambda item: (item[0], -item[1]))
+
+    def budget_left():
+        if max_differences is not None and difference_counter >= max_differences:
+            return False
+        if time_budget is not None and time.perf_counter() - start > time_budget:
+            print("Time budget reached")
+            return False
+        return True
 
-                print(f"\nLEFT : {left_ans}")
-                print(f"RIGHT: {right_ans}")
-                norm = lambda s: str(s).strip().lower()
-                print(f"➤ Different? → {'Yes' if norm(left_ans) != norm(right_ans) else 'No'}")
-                if norm(left_ans) != norm(right_ans):
+    difference_counter = 0
+    executed = 0
+    print("\n🔎 Executing Symbolic Programs via VisProg\n" + "="*60)
+    for uncertain, _, parent_question in frontier:
+        if not budget_left():
+            break
+        print(f"\n→ Expanding: {parent_question}" + (" (uncertain)" if uncertain else ""))
+        for q in questions[parent_question]:
+            if not budget_left():
+                break
+            print(f"\n→ Question: {q}")
+            try:
+                prog_template = validator.check(
+                    program_generator(q, "IMAGE_PLACEHOLDER"),
+                    regenerate=lambda prog, errors: generate_symbolic_program(q, "IMAGE_PLACEHOLDER", feedback=errors))
+                print(prog_template)
+                if is_pair_program(prog_template):
+                    left_ans, right_ans, different = run_question(interpreter, state, prog_template)
+                else:
+                    left_ans, right_ans, different = run_question(
+                        interpreter, state, prog_template.replace("IMAGE_PLACEHOLDER", "LEFT"),
+                        prog_template.replace("IMAGE_PLACEHOLDER", "RIGHT"))
+                executed += 1
+
+                print_answers(left_ans, right_ans, different)
+                if different:
                     difference_counter += 1
 
             except Exception as e:
                 print(f"Error: {e}")
 
+    total = sum(len(follow_ups) for follow_ups in questions.values())
     print("\nTOTAL DIFFERENCES FOUND:", difference_counter)
-    
+    print(f"Executed {executed} of {total} follow-up questions in {time.perf_counter() - start:.1f}s")
+    cache = interpreter.step_cache
+    print(f"Reused {cache.hits} of {cache.hits + cache.misses} model steps")
+    print(program_generator.summary())
+
 def execute_visprog_symbolic(img1_path, img2_path, questions):
-    interpreter = ProgramInterpreter(dataset='nlvr')
-    img_left = Image.open(img1_path).convert("RGB")
-    img_right = Image.open(img2_path).convert("RGB")
-    img_left.thumbnail((640, 640), Image.Resampling.LANCZOS)
-    img_right.thumbnail((640, 640), Image.Resampling.LANCZOS)
-    state = {"LEFT": img_left, "RIGHT": img_right}
+    interpreter = ProgramInterpreter(dataset='nlvr', step_cache=StepCache())
+    validator = ProgramValidator(interpreter.step_interpreters, init_vars=DEFAULT_INIT_VARS + ('IMAGE_PLACEHOLDER',))
+    img_left = default_store.get(img1_path, size=(640, 640))
+    img_right = default_store.get(img2_path, size=(640, 640))
+    state = {"LEFT": img_left, "RIGHT": img_right}  # shared, read-only; each program runs on a scoped overlay
 
     difference_counter = 0
     print("\n🔎 Executing Symbolic Programs via VisProg\n" + "="*60)
     for i, question in enumerate(questions, 1):
         print(f"\n→ Question {i}: {question}")
         try:
-            prog_L = generate_symbolic_program(question, "LEFT")
-            prog_R = generate_symbolic_program(question, "RIGHT")
-
-            print("[LEFT DSL]")
-            print(prog_L)
-            left_ans, _, _ = interpreter.execute(prog_L, state, inspect=True)
-
-            print("\n[RIGHT DSL]")
-            print(prog_R)
-            right_ans, _, _ = interpreter.execute(prog_R, state, inspect=True)
-
-            print(f"\nLEFT : {left_ans}")
-            print(f"RIGHT: {right_ans}")
-            norm = lambda s: str(s).strip().lower()
-            print(f"➤ Different? → {'Yes' if norm(left_ans) != norm(right_ans) else 'No'}")
-            if norm(left_ans) != norm(right_ans):
+            prog_L = validator.check(
+                program_generator(question, "LEFT"),
+                regenerate=lambda prog, errors: generate_symbolic_program(question, "LEFT", feedback=errors))
+            if is_pair_program(prog_L):
+                # A DIFF program already covers both images
+                print("[BOTH IMAGES DSL]")
+                print(prog_L)
+                prog_R = None
+            else:
+                prog_R = validator.check(
+                    program_generator(question, "RIGHT"),
+                    regenerate=lambda prog, errors: generate_symbolic_program(question, "RIGHT", feedback=errors))
+
+                print("[LEFT DSL]")
+                print(prog_L)
+                print("\n[RIGHT DSL]")
+                print(prog_R)
+            left_ans, right_ans, different = run_question(interpreter, state, prog_L, prog_R)
+
+            print_answers(left_ans, right_ans, different)
+            if different:
                 difference_counter += 1
 
         except Exception as e:
             print(f"Error: {e}")
 
     print("\nTOTAL DIFFERENCES FOUND:", difference_counter)
+    cache = interpreter.step_cache
+    print(f"Reused {cache.hits} of {cache.hits + cache.misses} model steps")
+    print(program_generator.summary())
+
+def execute_visprog_symbolic_streaming(img1_path, img2_path, diff_path, follow_up=True, num_workers=4, max_pending=8):
+    """
+    Same search as execute_visprog_symbolic(_followup), but questions are parsed from
+    the streamed GPT response, programs are generated by num_workers threads as soon as
+    each question arrives, and ready programs are executed while generation continues.
+    """
+    interpreter = ProgramInterpreter(dataset='nlvr', step_cache=StepCache())
+    validator = ProgramValidator(interpreter.step_interpreters, init_vars=DEFAULT_INIT_VARS + ('IMAGE_PLACEHOLDER',))
+    img_left = default_store.get(img1_path, size=(640, 640))
+    img_right = default_store.get(img2_path, size=(640, 640))
+    state = {"LEFT": img_left, "RIGHT": img_right}  # shared, read-only; each program runs on a scoped overlay
+
+    def questions():
+        if follow_up:
+            parent_qs = list(stream_comparison_questions(img1_path, img2_path, diff_path))
+            yield from stream_follow_up_qs(img1_path, img2_path, diff_path, parent_qs)
+        else:
+            for q in stream_comparison_questions(img1_path, img2_path, diff_path):
+                yield None, q
+
+    def generate(item):
+        _, q = item
+        # Invalid programs are repaired or regenerated here, before any model runs
+        return validator.check(
+            program_generator(q, "IMAGE_PLACEHOLDER"),
+            regenerate=lambda prog, errors: generate_symbolic_program(q, "IMAGE_PLACEHOLDER", feedback=errors))
+
+    def execute(item, prog_template):
+        if is_pair_program(prog_template):
+            return (prog_template,) + run_question(interpreter, state, prog_template)
+        prog_L = prog_template.replace("IMAGE_PLACEHOLDER", "LEFT")
+        prog_R = prog_template.replace("IMAGE_PLACEHOLDER", "RIGHT")
+        return (prog_template,) + run_question(interpreter, state, prog_L, prog_R)
+
+    pipeline = StreamingPipeline(generate, execute, num_workers=num_workers, max_pending=max_pending)
+    difference_counter = 0
+    start = time.perf_counter()
+    print("\n🔎 Executing Symbolic Programs via VisProg (streaming)\n" + "="*60)
+    for i, ((parent_question, q), output, error) in enumerate(pipeline.run(questions()), 1):
+        print(f"\n→ Question {i}: {q}" + (f" (from: {parent_question})" if parent_question else ""))
+        if error is not None:
+            print(f"Error: {error}")
+            continue
+
+        prog_template, left_ans, right_ans, different = output
+        print(prog_template)
+        print_answers(left_ans, right_ans, different)
+        if different:
+            difference_counter += 1
+            if difference_counter == 1:
+                print(f"(first difference after {time.perf_counter() - start:.1f}s)")
+
+    print("\nTOTAL DIFFERENCES FOUND:", difference_counter)
+    cache = interpreter.step_cache
+    print(f"Reused {cache.hits} of {cache.hits + cache.misses} model steps")
+    print(program_generator.summary())
 
 # Example usage:
 img1_path = "assets/parking_lot1.png"
 img2_path = "assets/parking_lot2.png"
-diff_path = "assets/difference_heatmap_5.png"
+# The binary change mask is computed in-process and sent as PNG bytes, no heatmap file round-trip
+diff_path = encode_png(compute_difference(img1_path, img2_path)['masks'][0.3])
 
-questions = get_comparison_questions(img1_path, img2_path, diff_path)
-specific_qs = get_follow_up_qs(img1_path, img2_path, diff_path, questions)
-execute_visprog_symbolic_followup(img1_path, img2_path, specific_qs)
+# questions = get_comparison_questions(img1_path, img2_path, diff_path)
+# specific_qs = get_follow_up_qs(img1_path, img2_path, diff_path, questions)
+# execute_visprog_symbolic_followup(img1_path, img2_path, specific_qs)
+execute_visprog_symbolic_streaming(img1_path, img2_path, diff_path, follow_up=True)
 
 """
     🔎 Executing Symbolic Programs via VisProg
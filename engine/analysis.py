@@ -0,0 +1,75 @@
+import functools
+
+from .step_interpreters import parse_step, DiffInterpreter
+from .expr import referenced_vars
+
+# Arguments whose value carries image provenance: regions from FIND/CHANGED record the
+# variable they were found in and later steps crop from state[region['image']]
+IMAGE_ARGS = ('image', 'region')
+
+
+class CompiledProgram:
+    """
+    A program parsed once, with the variables each step defines and reads.
+
+    A step reads a variable when an argument names a variable defined by an earlier
+    step, when an EVAL expression mentions it, when it is the <VAR>_IMAGE
+    companion that LOC stores next to a box variable the step reads, or when an image
+    the step's regions were cropped from was itself a program variable.
+
+    dead_after[i] lists the variables nothing after step i reads, excluding the final
+    step's output. Initial-state variables are never listed.
+    """
+    def __init__(self, prog_str):
+        self.prog_str = prog_str
+        self.steps = [parse_step(instruction) for instruction in prog_str.split('\n')]
+        self.defines = []
+        self.uses = []
+
+        defined = set()
+        carried = dict()  # variable -> program variables its regions may point back into
+        for step in self.steps:
+            outputs = {step['output_var']}
+            if step['step_name'].startswith('LOC'):
+                outputs.add(step['output_var'] + '_IMAGE')
+            if step['step_name'] == 'DIFF':
+                outputs |= {step['output_var'] + suffix for suffix in DiffInterpreter.side_outputs}
+
+            uses = set()
+            provenance = set()
+            for arg, value in step['args'].items():
+                if not isinstance(value, str):
+                    continue
+                names = referenced_vars(value) if step['step_name'] == 'EVAL' and arg == 'expr' else [value]
+                for name in names:
+                    if name not in defined:
+                        continue
+                    uses.add(name)
+                    uses |= carried.get(name, set())
+                    if name + '_IMAGE' in defined:
+                        uses.add(name + '_IMAGE')
+                    if arg in IMAGE_ARGS:
+                        provenance |= {name} | carried.get(name, set())
+
+            for output in outputs:
+                carried[output] = provenance
+            self.defines.append(outputs)
+            self.uses.append(uses)
+            defined |= outputs
+
+        last = dict()
+        for i, (outputs, uses) in enumerate(zip(self.defines, self.uses)):
+            for name in outputs | uses:
+                last[name] = i
+        keep = self.defines[-1] if self.defines else set()
+
+        self.dead_after = [[] for _ in self.steps]
+        for name, i in last.items():
+            if name not in keep:
+                self.dead_after[i].append(name)
+
+
+@functools.lru_cache(maxsize=256)
+def compile_program(prog_str):
+    """Cached CompiledProgram for a program string"""
+    return CompiledProgram(prog_str)
@@ -1,6 +1,7 @@
 import torch
 from transformers import BlipProcessor, BlipForQuestionAnswering
 from PIL import Image
+from .profiler import span
 
 class BlipVQA:
     def __init__(self, device=None):
@@ -10,7 +11,8 @@ class BlipVQA:
         self.model.eval()
 
     def ask(self, image: Image.Image, question: str) -> str:
-        inputs = self.processor(image, question, return_tensors="pt").to(self.device)
-        with torch.no_grad():
+        with span('preprocess'):
+            inputs = self.processor(image, question, return_tensors="pt").to(self.device)
+        with span('forward'), torch.no_grad():
             out = self.model.generate(**inputs)
         return self.processor.decode(out[0], skip_special_tokens=True)
@@ -0,0 +1,162 @@
+import io
+import ast
+import operator
+import tokenize
+import functools
+
+BIN_OPS = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+    ast.Div: operator.truediv, ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod,
+    ast.BitAnd: operator.and_, ast.BitOr: operator.or_, ast.BitXor: operator.xor,
+}
+UNARY_OPS = {ast.Not: operator.not_, ast.USub: operator.neg, ast.UAdd: operator.pos}
+COMPARE_OPS = {
+    ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt, ast.LtE: operator.le,
+    ast.Gt: operator.gt, ast.GtE: operator.ge, ast.In: lambda a, b: a in b,
+    ast.NotIn: lambda a, b: a not in b, ast.Is: operator.is_, ast.IsNot: operator.is_not,
+}
+FUNCTIONS = dict(len=len, abs=abs, min=min, max=max, int=int, float=float, str=str, bool=bool)
+CONSTANTS = {'True': True, 'False': False, 'None': None}
+
+
+def coerce(value):
+    """How EVAL sees a state value: 'yes'/'no' become booleans, decimal strings integers"""
+    if isinstance(value, str):
+        if value in ['yes', 'no']:
+            return value == 'yes'
+        if value.isdecimal():
+            return int(value)
+    return value
+
+
+def _source(expr):
+    """
+    Python source for an EVAL expression: an expression that is itself a quoted string
+    literal (double-quoted by the program generator) is unwrapped, and the xor keyword
+    becomes != at token level, so 'xor' inside string literals is left alone.
+    """
+    expr = expr.strip()
+    try:
+        inner = ast.literal_eval(expr)
+        if isinstance(inner, str):
+            expr = inner.strip()
+    except (ValueError, SyntaxError):
+        pass
+    if 'xor' not in expr:
+        return expr
+    try:
+        tokens = [(tok.type, '!=' if tok.type == tokenize.NAME and tok.string == 'xor' else tok.string)
+                  for tok in tokenize.generate_tokens(io.StringIO(expr).readline)]
+        return tokenize.untokenize(tokens)
+    except (tokenize.TokenError, SyntaxError):
+        return expr
+
+
+class Expression:
+    """
+    An EVAL expression such as "{ANSWER0} and not {ANSWER1} xor {ANSWER2} > 2" compiled
+    once into nested closures. {VAR} (a one-element set display) and bare names are
+    variable references; calling the expression with lookup(name) reads only the
+    variables it needs, by reference: and/or, chained comparisons and conditional
+    expressions short-circuit exactly like Python. Only literals, boolean, arithmetic
+    and comparison operators and a few pure builtins are allowed.
+    """
+    def __init__(self, expr):
+        self.expr = expr
+        try:
+            tree = ast.parse(_source(expr), mode='eval')
+        except SyntaxError as e:
+            raise ValueError(f"[EVAL] Could not parse expression '{expr}': {e}")
+        self.names = []
+        self._fn = self._compile(tree.body)
+
+    def __call__(self, lookup):
+        return self._fn(lookup)
+
+    def _compile(self, node):
+        if isinstance(node, ast.Constant):
+            value = node.value
+            return lambda lookup: value
+
+        if isinstance(node, ast.Set) and len(node.elts) == 1 and isinstance(node.elts[0], ast.Name):
+            node = node.elts[0]
+        if isinstance(node, ast.Name):
+            name = node.id
+            if name in CONSTANTS:
+                value = CONSTANTS[name]
+                return lambda lookup: value
+            if name not in self.names:
+                self.names.append(name)
+            return lambda lookup: lookup(name)
+
+        if isinstance(node, ast.BoolOp):
+            operands = [self._compile(value) for value in node.values]
+            if isinstance(node.op, ast.And):
+                def bool_and(lookup):
+                    for operand in operands:
+                        value = operand(lookup)
+                        if not value:
+                            return value
+                    return value
+                return bool_and
+            def bool_or(lookup):
+                for operand in operands:
+                    value = operand(lookup)
+                    if value:
+                        return value
+                return value
+            return bool_or
+
+        if isinstance(node, ast.IfExp):
+            test, body, orelse = self._compile(node.test), self._compile(node.body), self._compile(node.orelse)
+            return lambda lookup: body(lookup) if test(lookup) else orelse(lookup)
+
+        if isinstance(node, ast.Compare):
+            left = self._compile(node.left)
+            ops = [COMPARE_OPS[type(op)] for op in node.ops]
+            rights = [self._compile(comparator) for comparator in node.comparators]
+            if len(ops) == 1:
+                op, right = ops[0], rights[0]
+                return lambda lookup: op(left(lookup), right(lookup))
+            def compare(lookup):
+                a = left(lookup)
+                for op, right in zip(ops, rights):
+                    b = right(lookup)
+                    if not op(a, b):
+                        return False
+                    a = b
+                return True
+            return compare
+
+        if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPS:
+            op, operand = UNARY_OPS[type(node.op)], self._compile(node.operand)
+            return lambda lookup: op(operand(lookup))
+
+        if isinstance(node, ast.BinOp) and type(node.op) in BIN_OPS:
+            op, left, right = BIN_OPS[type(node.op)], self._compile(node.left), self._compile(node.right)
+            return lambda lookup: op(left(lookup), right(lookup))
+
+        if isinstance(node, (ast.Tuple, ast.List)):
+            elts = [self._compile(elt) for elt in node.elts]
+            return lambda lookup: [elt(lookup) for elt in elts]
+
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS \
+                and not node.keywords:
+            fn, args = FUNCTIONS[node.func.id], [self._compile(arg) for arg in node.args]
+            return lambda lookup: fn(*[arg(lookup) for arg in args])
+
+        raise ValueError(f"[EVAL] Unsupported expression '{ast.unparse(node)}' in '{self.expr}'")
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_expression(expr):
+    """Compiled Expression for an EVAL expression text, cached by text"""
+    return Expression(expr)
+
+
+def referenced_vars(expr):
+    """Variables an EVAL expression can read, in order of first appearance"""
+    try:
+        return list(compile_expression(expr).names)
+    except ValueError:
+        return []  # EVAL itself reports the bad expression when it runs
@@ -0,0 +1,85 @@
+import os
+import pickle
+import hashlib
+import threading
+import weakref
+import numpy as np
+from PIL import Image
+
+
+class ContentHasher:
+    """
+    Stable content digests for program state values, the same across runs and processes.
+
+    Images hash their mode, size and pixels, arrays their dtype, shape and bytes, and
+    image paths the bytes of the file. Lists, tuples and dicts (e.g. FIND regions with
+    their masks) hash their items. Digests of images and arrays are remembered for as
+    long as the object is alive, so a shared LEFT image is read once per process.
+    """
+    def __init__(self):
+        self._memo = dict()  # id(value) -> (weakref, digest)
+        self._files = dict()  # (abspath, mtime) -> digest
+        self._lock = threading.Lock()
+
+    def _memoized(self, value, compute):
+        key = id(value)
+        with self._lock:
+            entry = self._memo.get(key)
+        if entry is not None and entry[0]() is value:
+            return entry[1]
+        digest = compute(value)
+        ref = weakref.ref(value, lambda _, key=key: self._memo.pop(key, None))
+        with self._lock:
+            self._memo[key] = (ref, digest)
+        return digest
+
+    def _image(self, img):
+        h = hashlib.blake2b(digest_size=16)
+        h.update(repr((img.mode, img.size)).encode())
+        h.update(img.tobytes())
+        return h.hexdigest()
+
+    def _array(self, arr):
+        h = hashlib.blake2b(digest_size=16)
+        h.update(repr((arr.dtype.str, arr.shape)).encode())
+        h.update(np.ascontiguousarray(arr).tobytes())
+        return h.hexdigest()
+
+    def _file(self, path):
+        path = os.path.abspath(path)
+        key = (path, os.stat(path).st_mtime_ns)
+        digest = self._files.get(key)
+        if digest is None:
+            h = hashlib.blake2b(digest_size=16)
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    h.update(chunk)
+            digest = self._files[key] = h.hexdigest()
+        return digest
+
+    def digest(self, value):
+        if value is None or isinstance(value, (bool, int, float)):
+            return repr(value)
+        if isinstance(value, str):
+            if os.path.isfile(value):
+                return 'file:' + self._file(value)
+            return repr(value)
+        if isinstance(value, Image.Image):
+            return 'image:' + self._memoized(value, self._image)
+        if isinstance(value, np.ndarray):
+            return 'array:' + self._memoized(value, self._array)
+        if isinstance(value, np.generic):
+            return repr(value.item())
+        if isinstance(value, (list, tuple)):
+            return '[' + ','.join(self.digest(item) for item in value) + ']'
+        if isinstance(value, dict):
+            items = sorted((repr(k), self.digest(v)) for k, v in value.items())
+            return '{' + ','.join(f'{k}:{v}' for k, v in items) + '}'
+        return 'pickle:' + hashlib.blake2b(pickle.dumps(value), digest_size=16).hexdigest()
+
+    def __call__(self, value):
+        """Hex digest of a state value"""
+        return hashlib.blake2b(self.digest(value).encode(), digest_size=16).hexdigest()
+
+
+content_hash = ContentHasher()
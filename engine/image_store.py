@@ -0,0 +1,138 @@
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from PIL import Image
+
+from .profiler import span, count
+
+
+class ImageStore:
+    """
+    Decodes each image source once and caches the forms steps ask for.
+
+        store.get('camel1.png')                    # full-resolution RGB
+        store.get('camel1.png', mode='L')          # grayscale
+        store.get('camel1.png', size=(640, 640))   # RGB fitted inside 640x640
+
+    Sources are file paths or PIL images. Paths are keyed by absolute path and
+    modification time, so an edited file is decoded again; images are keyed by
+    identity and their derived forms are dropped when the image is collected.
+    A resized form of a JPEG path is decoded with PIL draft mode, straight at the
+    smallest DCT scale that still covers the requested size.
+
+    Steps look the store up with image_store(state): an 'IMAGE_STORE' entry in
+    program state wins, otherwise the module-wide default_store is shared by
+    every program running on the same images.
+
+    The least recently used forms are evicted once the cache holds more than
+    max_entries images or more than max_bytes of decoded pixels (width * height *
+    bands); the most recent form is always kept, however large.
+    """
+    def __init__(self, max_entries=64, max_bytes=1 << 30):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._cache = OrderedDict()  # (source key, mode, size) -> PIL image, least recently used first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _source_key(self, source):
+        if isinstance(source, Image.Image):
+            return ('image', id(source))
+        path = os.path.abspath(os.fspath(source))
+        return ('path', path, os.stat(path).st_mtime_ns)
+
+    @staticmethod
+    def _size_of(img):
+        return img.width * img.height * len(img.getbands())
+
+    def _pop(self, key):
+        self.nbytes -= self._size_of(self._cache.pop(key))
+
+    def _lookup(self, key):
+        with self._lock:
+            img = self._cache.get(key)
+            if img is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+            return img
+
+    def _insert(self, key, img, source):
+        with self._lock:
+            self.misses += 1
+            if key in self._cache:
+                self._pop(key)
+            self._cache[key] = img
+            self.nbytes += self._size_of(img)
+            while len(self._cache) > 1 and (len(self._cache) > self.max_entries or self.nbytes > self.max_bytes):
+                self._pop(next(iter(self._cache)))
+        if isinstance(source, Image.Image):
+            weakref.finalize(source, self._forget, key[0])
+
+    def _forget(self, source_key):
+        with self._lock:
+            for key in [k for k in self._cache if k[0] == source_key]:
+                self._pop(key)
+
+    def _decode(self, source, mode, size):
+        if isinstance(source, Image.Image):
+            img = source
+        else:
+            img = Image.open(source)
+            if size is not None:
+                img.draft(mode, size)  # no-op for anything but JPEG
+        if img.mode != mode:
+            img = img.convert(mode)
+        if size is not None and (img.width > size[0] or img.height > size[1]):
+            img = img.copy() if img is source else img
+            img.thumbnail(size, Image.Resampling.LANCZOS)
+        elif img is not source:
+            img.load()
+        return img
+
+    def get(self, source, mode='RGB', size=None):
+        """
+        source: file path or PIL image
+        mode: PIL mode of the returned image
+        size: optional (width, height) bound; the image is shrunk to fit inside it
+            keeping its aspect ratio, never enlarged
+
+        The returned image is shared with later callers; copy it before drawing on it.
+        """
+        size = tuple(size) if size is not None else None
+        if isinstance(source, Image.Image) and source.mode == mode and size is None:
+            return source
+
+        key = (self._source_key(source), mode, size)
+        img = self._lookup(key)
+        if img is not None:
+            count('image_cache_hit')
+            return img
+
+        count('image_cache_miss')
+        with span('load_image'):
+            img = self._decode(source, mode, size)
+        self._insert(key, img, source)
+        return img
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.nbytes = 0
+
+
+default_store = ImageStore()
+
+
+def image_store(state):
+    """The ImageStore for a program state: state['IMAGE_STORE'] if set, else the shared default"""
+    return state.get('IMAGE_STORE') or default_store
+
+
+def load_image(state, value, mode='RGB'):
+    """Resolve a state value (image or path) to a decoded PIL image through the state's store"""
+    if isinstance(value, (str, os.PathLike, Image.Image)):
+        return image_store(state).get(value, mode=mode)
+    raise ValueError(f"Expected an image or an image path, got: {type(value)}")
@@ -0,0 +1,183 @@
+import threading
+from collections import OrderedDict
+
+from .profiler import span, count
+
+
+class OpenAIBackend:
+    """Chat-completions backend; one request per prompt"""
+    def __init__(self, api_key, project=None, model="gpt-3.5-turbo", max_tokens=1024):
+        from openai import OpenAI
+        self.client = OpenAI(api_key=api_key, project=project)
+        self.model = model
+        self.max_tokens = max_tokens
+
+    def complete(self, prompts):
+        outputs = []
+        for prompt in prompts:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0,
+                max_tokens=self.max_tokens
+            )
+            outputs.append(response.choices[0].message.content.strip())
+        return outputs
+
+
+def common_prefix(a, b):
+    """Longest common prefix of two prompts, cut after its last newline"""
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return a[:a.rfind('\n', 0, n) + 1]
+
+
+def expand_cache(past_key_values, batch_size):
+    """Copy of a batch-1 KV cache repeated batch_size times (tuple or Cache object)"""
+    legacy = past_key_values.to_legacy_cache() if hasattr(past_key_values, 'to_legacy_cache') else past_key_values
+    expanded = tuple(tuple(t.expand(batch_size, *t.shape[1:]).contiguous() for t in layer) for layer in legacy)
+    if hasattr(past_key_values, 'to_legacy_cache'):
+        return type(past_key_values).from_legacy_cache(expanded)
+    return expanded
+
+
+class LocalLMBackend:
+    """
+    Greedy program generation with a local causal LM through transformers, on CPU by
+    default.
+
+    The few-shot examples are the same for every question, so the KV cache of the
+    shared prompt prefix is computed once and reused: within a batch the prefix is
+    the prompts' common prefix, across calls it is the common prefix with the previous
+    prompt (cut at a line boundary). Only the question suffixes are run through the
+    model per call, batch_size at a time, left-padded behind the shared prefix with an
+    attention mask and explicit position ids. Generation stops at max_new_tokens, EOS
+    or any of the stop strings (the start of the next example).
+    """
+    def __init__(self, model_name, device='cpu', max_new_tokens=256, batch_size=8,
+                 stop=('\n\n', '\nStatement:', '\nQuestion:', '\nInstruction:'),
+                 min_prefix_chars=64, max_prefixes=4, torch_dtype=None):
+        import torch
+        from transformers import AutoTokenizer, AutoModelForCausalLM
+        self.torch = torch
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        if self.tokenizer.pad_token_id is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch_dtype).to(device)
+        self.model.eval()
+        self.device = device
+        self.max_new_tokens = max_new_tokens
+        self.batch_size = batch_size
+        self.stop = stop
+        self.min_prefix_chars = min_prefix_chars
+        self.max_prefixes = max_prefixes
+        self._prefixes = OrderedDict()  # prefix text -> (prefix ids, batch-1 KV cache)
+        self._last_prompt = None
+        self._lock = threading.Lock()
+
+    def split(self, prompts):
+        """(prefix, suffixes) with the prefix shared by all prompts"""
+        candidates = list(self._prefixes) + ([self._last_prompt] if self._last_prompt else [])
+        prefix = ''
+        if len(prompts) > 1:
+            prefix = prompts[0]
+            for prompt in prompts[1:]:
+                prefix = common_prefix(prefix, prompt)
+        for candidate in candidates:
+            shared = candidate if candidate in self._prefixes else common_prefix(candidate, prompts[0])
+            if len(shared) > len(prefix) and all(p.startswith(shared) for p in prompts):
+                prefix = shared
+        # Every row needs at least one suffix token to predict from
+        while prefix and any(len(p) == len(prefix) for p in prompts):
+            prefix = prefix[:prefix.rfind('\n', 0, len(prefix) - 1) + 1]
+        if len(prefix) < self.min_prefix_chars:
+            prefix = ''
+        self._last_prompt = prompts[-1]
+        return prefix, [p[len(prefix):] for p in prompts]
+
+    def prefix_cache(self, prefix):
+        entry = self._prefixes.get(prefix)
+        if entry is not None:
+            self._prefixes.move_to_end(prefix)
+            count('prefix_cache_hit')
+            return entry
+        count('prefix_cache_miss')
+        ids = self.tokenizer(prefix, return_tensors='pt').input_ids.to(self.device)
+        with span('prefill'):
+            past = self.model(input_ids=ids, use_cache=True).past_key_values
+        self._prefixes[prefix] = entry = (ids, past)
+        while len(self._prefixes) > self.max_prefixes:
+            self._prefixes.popitem(last=False)
+        return entry
+
+    def complete(self, prompts):
+        with self._lock, self.torch.inference_mode():
+            prefix, suffixes = self.split(list(prompts))
+            outputs = []
+            for start in range(0, len(suffixes), self.batch_size):
+                outputs += self.generate(prefix, suffixes[start:start + self.batch_size])
+            return outputs
+
+    def generate(self, prefix, suffixes):
+        torch = self.torch
+        tokenizer = self.tokenizer
+        batch_size = len(suffixes)
+
+        # Left-pad the suffixes so every row's last token is at the end of the batch
+        encoded = [tokenizer(s, add_special_tokens=not prefix).input_ids for s in suffixes]
+        width = max(len(ids) for ids in encoded)
+        input_ids = torch.full((batch_size, width), tokenizer.pad_token_id, dtype=torch.long)
+        suffix_mask = torch.zeros((batch_size, width), dtype=torch.long)
+        for i, ids in enumerate(encoded):
+            if ids:
+                input_ids[i, width - len(ids):] = torch.tensor(ids)
+                suffix_mask[i, width - len(ids):] = 1
+
+        if prefix:
+            prefix_ids, past = self.prefix_cache(prefix)
+            prefix_len = prefix_ids.shape[1]
+            past = expand_cache(past, batch_size)
+        else:
+            prefix_len, past = 0, None
+        attention_mask = torch.cat([torch.ones((batch_size, prefix_len), dtype=torch.long), suffix_mask], 1)
+        # Positions continue after the prefix and skip the padding
+        position_ids = prefix_len + (suffix_mask.cumsum(1) - 1).clamp(min=0)
+
+        input_ids = input_ids.to(self.device)
+        attention_mask = attention_mask.to(self.device)
+        position_ids = position_ids.to(self.device)
+        generated = [[] for _ in range(batch_size)]
+        texts = [''] * batch_size
+        finished = [False] * batch_size
+        with span('decode'):
+            for _ in range(self.max_new_tokens):
+                out = self.model(input_ids=input_ids, attention_mask=attention_mask, position_ids=position_ids,
+                                 past_key_values=past, use_cache=True)
+                past = out.past_key_values
+                next_tokens = out.logits[:, -1].argmax(-1)
+                for i, token in enumerate(next_tokens.tolist()):
+                    if finished[i]:
+                        continue
+                    if token == tokenizer.eos_token_id:
+                        finished[i] = True
+                        continue
+                    generated[i].append(token)
+                    texts[i] = tokenizer.decode(generated[i], skip_special_tokens=True)
+                    if any(stop in texts[i] for stop in self.stop):
+                        finished[i] = True
+                if all(finished):
+                    break
+                input_ids = next_tokens[:, None]
+                attention_mask = torch.cat([attention_mask, attention_mask.new_ones((batch_size, 1))], 1)
+                position_ids = position_ids[:, -1:] + 1
+        count('generated_tokens', sum(len(g) for g in generated))
+
+        outputs = []
+        for text in texts:
+            for stop in self.stop:
+                text = text.split(stop)[0]
+            outputs.append(text.strip())
+        return outputs
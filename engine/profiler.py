@@ -0,0 +1,222 @@
+import os
+import sys
+import json
+import time
+import threading
+import contextlib
+from collections import defaultdict
+
+_local = threading.local()
+
+
+def active_profiler():
+    """Profiler attached to the step currently running on this thread, if any"""
+    return getattr(_local, 'profiler', None)
+
+
+@contextlib.contextmanager
+def span(name):
+    """
+    Time a phase of the current step, e.g. span('preprocess') or span('forward').
+    A no-op when no profiler is attached.
+    """
+    profiler = active_profiler()
+    if profiler is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.add_span(name, start, time.perf_counter())
+
+
+def count(name, n=1):
+    """Bump a counter of the current step, e.g. count('cache_hit'). A no-op when no profiler is attached."""
+    profiler = active_profiler()
+    if profiler is not None:
+        profiler.add_count(name, n)
+
+
+def host_memory():
+    """Current resident set size in bytes (peak RSS where /proc is unavailable)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def device_memory():
+    """Bytes currently allocated by torch on the default CUDA device, 0 without CUDA"""
+    torch = sys.modules.get('torch')
+    if torch is not None and torch.cuda.is_available():
+        return torch.cuda.memory_allocated()
+    return 0
+
+
+class Profiler:
+    """
+    Per-step and per-program profiler for ProgramInterpreter.
+
+        profiler = Profiler().attach(interpreter)
+        interpreter.execute(prog, state)
+        print(profiler.summary())
+        profiler.save_chrome_trace('trace.json')  # open in chrome://tracing or Perfetto
+
+    Each step records wall time, host/device memory deltas, the time spent in
+    span()s opened by the interpreters (preprocess, forward, load_image) and any
+    count()ers (cache_hit, cache_miss).
+
+    Steps may nest on one thread (execute_lazy runs a producer step inside the step
+    that reads its output): open steps form a stack, spans and counts go to the
+    innermost one, and a step's wall time excludes the steps nested in it.
+    """
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self.events = []
+        self.steps = []
+        self.programs = []
+        self._lock = threading.Lock()
+        self._open = dict()  # thread id -> dict(program=..., steps=[open steps, innermost last])
+
+    def attach(self, interpreter):
+        interpreter.pre_program_hooks.append(self.pre_program)
+        interpreter.post_program_hooks.append(self.post_program)
+        interpreter.pre_step_hooks.append(self.pre_step)
+        interpreter.post_step_hooks.append(self.post_step)
+        return self
+
+    def detach(self, interpreter):
+        interpreter.pre_program_hooks.remove(self.pre_program)
+        interpreter.post_program_hooks.remove(self.post_program)
+        interpreter.pre_step_hooks.remove(self.pre_step)
+        interpreter.post_step_hooks.remove(self.post_step)
+
+    def _ts(self, t):
+        return (t - self.origin) * 1e6
+
+    def _event(self, name, cat, start, end, args=None):
+        event = dict(name=name, cat=cat, ph='X', ts=self._ts(start), dur=(end - start) * 1e6,
+                     pid=self.pid, tid=threading.get_ident())
+        if args:
+            event['args'] = args
+        with self._lock:
+            self.events.append(event)
+
+    def _current(self):
+        return self._open.setdefault(threading.get_ident(), dict(steps=[]))
+
+    def _step(self):
+        steps = self._current()['steps']
+        return steps[-1] if steps else None
+
+    def pre_program(self, prog):
+        self._current()['program'] = dict(start=time.perf_counter(), num_steps=0)
+
+    def post_program(self, prog, output):
+        program = self._current().pop('program', None)
+        if program is None:
+            return
+        end = time.perf_counter()
+        record = dict(wall=end - program['start'], num_steps=program['num_steps'])
+        with self._lock:
+            self.programs.append(record)
+        self._event('program', 'program', program['start'], end, dict(num_steps=program['num_steps']))
+
+    def pre_step(self, prog_step, step_name):
+        self._current()['steps'].append(dict(
+            name=step_name,
+            prog_str=prog_step.prog_str,
+            spans=defaultdict(float),
+            counts=defaultdict(int),
+            host_mem=host_memory(),
+            device_mem=device_memory(),
+            start=time.perf_counter(),
+            nested=0.0))
+        _local.profiler = self
+
+    def post_step(self, prog_step, step_name, output):
+        end = time.perf_counter()
+        current = self._current()
+        if not current['steps']:
+            return
+        step = current['steps'].pop()
+        if current['steps']:
+            current['steps'][-1]['nested'] += end - step['start']
+        else:
+            _local.profiler = None
+        if 'program' in current:
+            current['program']['num_steps'] += 1
+
+        record = dict(
+            name=step['name'],
+            wall=end - step['start'] - step['nested'],
+            spans=dict(step['spans']),
+            counts=dict(step['counts']),
+            host_mem_delta=host_memory() - step['host_mem'],
+            device_mem_delta=device_memory() - step['device_mem'],
+            failed=output is None)
+        with self._lock:
+            self.steps.append(record)
+        self._event(step['name'], 'step', step['start'], end, dict(
+            step=step['prog_str'],
+            host_mem_delta=record['host_mem_delta'],
+            device_mem_delta=record['device_mem_delta'],
+            **record['counts']))
+
+    def add_span(self, name, start, end):
+        step = self._step()
+        if step is not None:
+            step['spans'][name] += end - start
+        self._event(name, 'span', start, end)
+
+    def add_count(self, name, n=1):
+        step = self._step()
+        if step is not None:
+            step['counts'][name] += n
+
+    def chrome_trace(self):
+        """Chrome trace-event JSON object (chrome://tracing, Perfetto)"""
+        with self._lock:
+            return dict(traceEvents=list(self.events), displayTimeUnit='ms')
+
+    def save_chrome_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+        return path
+
+    def summary(self):
+        """Per-step-kind table of call counts, times (ms), memory deltas (MB) and counters"""
+        with self._lock:
+            steps = list(self.steps)
+            programs = list(self.programs)
+
+        by_name = defaultdict(list)
+        for step in steps:
+            by_name[step['name']].append(step)
+        span_names = sorted({name for step in steps for name in step['spans']})
+        count_names = sorted({name for step in steps for name in step['counts']})
+
+        header = ['step', 'calls', 'total', 'mean'] + span_names + ['host_mem', 'dev_mem'] + count_names
+        rows = []
+        for name, records in sorted(by_name.items(), key=lambda kv: -sum(r['wall'] for r in kv[1])):
+            total = sum(r['wall'] for r in records)
+            row = [name, len(records), f'{total * 1000:.1f}', f'{total * 1000 / len(records):.1f}']
+            row += [f"{sum(r['spans'].get(s, 0) for r in records) * 1000:.1f}" for s in span_names]
+            row += [f"{sum(r['host_mem_delta'] for r in records) / 2**20:+.1f}",
+                    f"{sum(r['device_mem_delta'] for r in records) / 2**20:+.1f}"]
+            row += [sum(r['counts'].get(c, 0) for r in records) for c in count_names]
+            rows.append([str(v) for v in row])
+
+        widths = [max(len(h), *(len(r[i]) for r in rows)) if rows else len(h) for i, h in enumerate(header)]
+        lines = ['  '.join(h.ljust(w) for h, w in zip(header, widths))]
+        lines += ['  '.join(v.ljust(w) for v, w in zip(row, widths)) for row in rows]
+        if programs:
+            total = sum(p['wall'] for p in programs)
+            lines.append(f'{len(programs)} programs, {total * 1000:.1f} ms total, '
+                         f'{total * 1000 / len(programs):.1f} ms mean')
+        return '\n'.join(lines)
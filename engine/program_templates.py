@@ -0,0 +1,148 @@
+import re
+import threading
+
+from .step_interpreters import parse_step
+
+# Longest object phrase a template passes to FIND; longer ones go to the fallback
+MAX_OBJECT_WORDS = 5
+
+# Object phrases FIND cannot look for: comparisons and abstract heads ("Is there a
+# difference between ...", "Are there more cars ...", "Is there anything missing?")
+NON_OBJECT_WORDS = frozenset("""
+more fewer less most least same different difference differences change changes changed
+anything something nothing everything missing added removed new other another
+""".split())
+
+# A preposition means a qualified phrase ("change in the sky", "cup on the table")
+# that one FIND query would get wrong
+PREPOSITIONS = frozenset("""
+in on at of to from by with without between among near next beside behind above below
+under over inside outside into onto across along around against within through toward towards
+""".split())
+
+ATTRIBUTES = r'colou?r|shape|material|pattern|texture|size|brand|type|kind'
+DETERMINERS = r'(?:the|a|an|any|some)\s+'
+TRAILERS = r'(?:\s+(?:visible|present|shown|there|in the (?:image|picture|photo|scene)))*'
+
+VQA_TEMPLATE = """ANSWER0=VQA(image={image},question={question})
+FINAL_RESULT=RESULT(var=ANSWER0)"""
+
+# Count and presence questions compare both images in one DIFF step, so these programs
+# name no image side and are run once per question. Their result is whether the
+# images differ: the number of objects changed, or the object is in one image only.
+# Persisting and moved objects are in both images, removed ones only in LEFT and
+# added ones only in RIGHT.
+COUNT_TEMPLATE = """DIFF0=DIFF(object={object})
+ANSWER0=COUNT(region=DIFF0_REMOVED)
+ANSWER1=COUNT(region=DIFF0_ADDED)
+ANSWER2=EVAL(expr="{{ANSWER0}} != {{ANSWER1}}")
+FINAL_RESULT=RESULT(var=ANSWER2)"""
+
+EXISTS_TEMPLATE = """DIFF0=DIFF(object={object})
+ANSWER0=COUNT(region=DIFF0_PERSISTING)
+ANSWER1=COUNT(region=DIFF0_MOVED)
+ANSWER2=COUNT(region=DIFF0_REMOVED)
+ANSWER3=COUNT(region=DIFF0_ADDED)
+ANSWER4=EVAL(expr="({{ANSWER0}} + {{ANSWER1}} + {{ANSWER2}} > 0) != ({{ANSWER0}} + {{ANSWER1}} + {{ANSWER3}} > 0)")
+FINAL_RESULT=RESULT(var=ANSWER4)"""
+
+TEMPLATES = [
+    # What color is the umbrella? / What is the shape of the object near the door?
+    ('attribute', re.compile(
+        rf'^what\s+(?:(?:{ATTRIBUTES})\s+(?:is|are)\s+|(?:is|are)\s+the\s+(?:{ATTRIBUTES})\s+of\s+)'
+        rf'(?:{DETERMINERS})?(?P<object>.+?){TRAILERS}$'), VQA_TEMPLATE),
+    # How many dogs are there? / How many people are visible?
+    ('count', re.compile(
+        rf'^how\s+many\s+(?P<object>.+?)\s+(?:are|is)\s+(?:there|visible|present|shown)'
+        rf'(?:\s+in the (?:image|picture|photo|scene))?$'), COUNT_TEMPLATE),
+    # Is there a car? / Are there any birds visible?
+    ('exists', re.compile(
+        rf'^(?:is|are)\s+there\s+(?:{DETERMINERS})?(?P<object>.+?){TRAILERS}$'), EXISTS_TEMPLATE),
+]
+
+
+def normalize_question(question):
+    return ' '.join(question.strip().rstrip('?.!').lower().split())
+
+
+def is_pair_program(prog_str):
+    """Whether a program compares both images itself in a DIFF step, so it runs once per question"""
+    for line in prog_str.split('\n'):
+        if not line.strip():
+            continue
+        try:
+            if parse_step(line.strip(), partial=True)['step_name'] == 'DIFF':
+                return True
+        except (ValueError, AttributeError, IndexError):
+            continue  # not a step line; the validator reports it
+    return False
+
+
+def is_plain_object(phrase):
+    """Whether an object phrase is a short plain noun phrase FIND can look for"""
+    words = phrase.split()
+    return 0 < len(words) <= MAX_OBJECT_WORDS and not any(
+        word in NON_OBJECT_WORDS or word in PREPOSITIONS for word in words)
+
+
+class TemplateProgramGenerator:
+    """
+    Program generator for the common question shapes, with no LLM round trip:
+
+        What color is the X?      ->  VQA on image_side
+        How many X are there?     ->  DIFF -> COUNT the removed and the added X
+        Is there a X?             ->  DIFF -> X in one image only
+
+    The DIFF programs look at LEFT and RIGHT together and ignore image_side (see
+    is_pair_program).
+
+    Called like generate_symbolic_program(question, image_side); a question that no
+    template matches, or whose object phrase is not a plain noun phrase (longer than
+    MAX_OBJECT_WORDS, a comparison or abstract word such as "difference" or "more",
+    or a prepositional qualifier), goes to fallback(question, image_side, **kwargs).
+    Regeneration requests (feedback=...) always go to the fallback. hits, misses and
+    hit_rate() report how often the templates answered.
+    """
+    def __init__(self, fallback=None, templates=TEMPLATES):
+        self.fallback = fallback
+        self.templates = templates
+        self.hits = dict()  # template name -> count
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def match(self, question, image_side):
+        """(template name, program) for a question, or None"""
+        text = normalize_question(question)
+        for name, pattern, template in self.templates:
+            m = pattern.match(text)
+            if m is None:
+                continue
+            obj = m.group('object')
+            if '{object}' in template and not is_plain_object(obj):
+                return None
+            return name, template.format(image=image_side, question=repr(question.strip()), object=repr(obj))
+        return None
+
+    def __call__(self, question, image_side, **kwargs):
+        matched = None if kwargs.get('feedback') else self.match(question, image_side)
+        with self._lock:
+            if matched is not None:
+                self.hits[matched[0]] = self.hits.get(matched[0], 0) + 1
+            else:
+                self.misses += 1
+        if matched is not None:
+            return matched[1]
+        if self.fallback is None:
+            raise ValueError(f"No program template matches '{question}' and there is no fallback generator")
+        return self.fallback(question, image_side, **kwargs)
+
+    def hit_rate(self):
+        hits = sum(self.hits.values())
+        total = hits + self.misses
+        return hits / total if total else 0.0
+
+    def summary(self):
+        hits = sum(self.hits.values())
+        by_template = ', '.join(f'{name}={n}' for name, n in sorted(self.hits.items()))
+        return (f'Templates answered {hits} of {hits + self.misses} questions '
+                f'({100 * self.hit_rate():.0f}%)' + (f': {by_template}' if by_template else ''))
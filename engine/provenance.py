@@ -0,0 +1,80 @@
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+
+from .expr import referenced_vars
+from .fingerprint import content_hash
+from .step_cache import normalize_arg
+from .result_cache import implicit_inputs
+
+
+class Provenance:
+    """
+    Step values of earlier executions of a program, keyed by provenance fingerprint,
+    for ProgramInterpreter.execute(..., provenance=...).
+
+    A step's fingerprint hashes its step name, its normalized constant args, and the
+    fingerprints of the values it reads: a program variable contributes the fingerprint
+    of the step that produced it, an initial-state value (LEFT, RIGHT, ...) its content
+    hash. Variable names do not enter it, so when a program is regenerated after a
+    failure or edited in a notebook, every step whose own text and upstream steps are
+    unchanged gets its previous value back, and only the changed steps and their
+    dependants run again.
+
+    last_run lists (step, fingerprint, reused) for the most recent execution.
+    """
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._values = OrderedDict()  # fingerprint -> (output, side outputs, render)
+        self._lock = threading.Lock()
+        self.last_run = []
+
+    def fingerprint(self, parse_result, state, var_fps):
+        def var_fp(name):
+            if name not in var_fps:
+                var_fps[name] = content_hash(state[name])  # initial-state value
+            return var_fps[name]
+
+        args = []
+        for arg, value in sorted(parse_result['args'].items()):
+            if isinstance(value, str) and value in state:
+                args.append((arg, 'var', var_fp(value)))
+            else:
+                args.append((arg, 'const', repr(normalize_arg(value))))
+            if parse_result['step_name'] == 'EVAL' and arg == 'expr':
+                args.extend((name, 'var', var_fp(name)) for name in referenced_vars(value) if name in state)
+        implicit = [(name, var_fp(name)) for name in implicit_inputs(parse_result, state)]
+        key = (parse_result['step_name'], args, implicit)
+        return hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest()
+
+    def get(self, fingerprint):
+        """(output, side outputs, render) recorded for fingerprint, or None"""
+        with self._lock:
+            entry = self._values.get(fingerprint)
+            if entry is None:
+                return None
+            self._values.move_to_end(fingerprint)
+        output, side_outputs, render = entry
+        # Consumers may mutate region lists in place; hand out copies
+        if isinstance(output, (list, dict)):
+            output = copy.deepcopy(output)
+        return output, side_outputs, render
+
+    def put(self, fingerprint, output, side_outputs, render):
+        if isinstance(output, (list, dict)):
+            output = copy.deepcopy(output)
+        with self._lock:
+            self._values[fingerprint] = (output, side_outputs, render)
+            self._values.move_to_end(fingerprint)
+            while len(self._values) > self.max_entries:
+                self._values.popitem(last=False)
+
+    @property
+    def reused(self):
+        return sum(reused for _, _, reused in self.last_run)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+        self.last_run = []
@@ -0,0 +1,248 @@
+import os
+import time
+import zlib
+import pickle
+import sqlite3
+import hashlib
+import threading
+import functools
+import numpy as np
+from PIL import Image
+
+from .profiler import count
+from .image_store import load_image
+from .fingerprint import content_hash
+from .step_cache import CACHED_STEPS, IMPLICIT_INPUTS, normalize_arg
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS steps (
+    key TEXT PRIMARY KEY,
+    step_name TEXT,
+    value BLOB,
+    size INTEGER,
+    last_used REAL
+)
+"""
+
+
+def implicit_inputs(parse_result, state):
+    """
+    State variables a step reads without naming them in its args: the images its
+    region args were cropped from, LEFT for FILTER, LEFT/RIGHT/DIFF_MASK for CHANGED and
+    LEFT/RIGHT for DIFF.
+    """
+    step_name = parse_result['step_name']
+    if step_name == 'CHANGED':
+        return [name for name in ('LEFT', 'RIGHT', 'DIFF_MASK') if name in state]
+    if step_name == 'DIFF':
+        return [name for name in ('LEFT', 'RIGHT') if name in state]
+    names = ['LEFT'] if step_name == 'FILTER' else []
+    for value in parse_result['args'].values():
+        if not (isinstance(value, str) and value in state and isinstance(state[value], list)):
+            continue
+        for region in state[value]:
+            if isinstance(region, dict) and 'image' in region:
+                names.append(region['image'])
+            else:
+                names.extend(IMPLICIT_INPUTS)  # no recorded source; any base image may be used
+    return sorted(name for name in set(names) if name in state)
+
+
+def holds_pixels(value):
+    """Whether a render argument is or contains an image or a 2-D+ array"""
+    if isinstance(value, Image.Image) or (isinstance(value, np.ndarray) and value.ndim >= 2):
+        return True
+    if isinstance(value, (list, tuple)):
+        return any(holds_pixels(item) for item in value)
+    if isinstance(value, dict):
+        return any(holds_pixels(item) for item in value.values())
+    return False
+
+
+class Ref(tuple):
+    """A render argument stored by reference: ('output',), ('side', suffix), ('state', name) or ('image', name)"""
+
+
+class PersistentStepCache:
+    """
+    On-disk step-result cache for ProgramInterpreter(step_cache=...), shared across runs
+    and processes through one SQLite file.
+
+    A step's key is a hash of its step name, the interpreter's model_id, its args
+    lower-cased and whitespace-normalized, and the content hashes (see
+    engine.fingerprint) of the state values its args name and of its implicit inputs.
+    Re-running a benchmark after a prompt change therefore only executes the steps
+    whose question, object or inputs actually changed.
+
+    Values (outputs with their regions and masks, LOC's <output_var>_IMAGE side outputs
+    and the arguments of the step's deferred html) are pickled and zlib-compressed.
+    Images and arrays among the html arguments are stored as references to the output,
+    a side output or the input state variable they came from and rebound on a hit; an
+    html that needs any other pixels (e.g. a VQA region crop) is not stored, and a hit
+    then renders as None. When the file grows past max_bytes the least recently used
+    entries are evicted. Bump version to invalidate everything written before.
+    """
+    def __init__(self, path, max_bytes=2 << 30, steps=CACHED_STEPS, version=1):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.steps = set(steps)
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(SCHEMA)
+        self._db.execute('CREATE INDEX IF NOT EXISTS steps_last_used ON steps (last_used)')
+        # Running total of this process's view of the file; recounted before evicting,
+        # since other processes may write to it too
+        self._total = self._count_bytes()
+
+    def _count_bytes(self):
+        return self._db.execute('SELECT COALESCE(SUM(size), 0) FROM steps').fetchone()[0]
+
+    def key(self, parse_result, state, interpreter=None):
+        args = []
+        for arg, value in sorted(parse_result['args'].items()):
+            if isinstance(value, str) and value in state:
+                args.append((arg, 'var', content_hash(state[value])))
+            else:
+                args.append((arg, 'const', repr(normalize_arg(value))))
+        implicit = [(name, content_hash(state[name])) for name in implicit_inputs(parse_result, state)]
+        model_id = getattr(interpreter, 'model_id', type(interpreter).__name__)
+        key = (self.version, parse_result['step_name'], model_id, args, implicit)
+        return hashlib.blake2b(repr(key).encode(), digest_size=20).hexdigest()
+
+    def _render_spec(self, render, interpreter, output, side_outputs, parse_result, state):
+        """
+        (method name, args, keywords) of a deferred html, which is a partial of one of
+        the interpreter's methods, with its pixel arguments replaced by Refs; None if
+        some pixels have nowhere to be found again
+        """
+        if isinstance(render, str):
+            return render
+        if not (isinstance(render, functools.partial) and getattr(render.func, '__self__', None) is interpreter):
+            return None
+        refs = {id(output): Ref(('output',))}
+        refs.update((id(value), Ref(('side', suffix))) for suffix, value in side_outputs.items())
+        names = implicit_inputs(parse_result, state) + [
+            value for value in parse_result['args'].values() if isinstance(value, str) and value in state]
+        for name in names:
+            value = state[name]
+            if isinstance(value, (str, os.PathLike)) and os.path.isfile(value):
+                refs.setdefault(id(load_image(state, value)), Ref(('image', name)))
+            else:
+                refs.setdefault(id(value), Ref(('state', name)))
+
+        store = lambda value: refs.get(id(value), value) if holds_pixels(value) else value
+        args = tuple(store(arg) for arg in render.args)
+        keywords = {key: store(value) for key, value in render.keywords.items()}
+        if holds_pixels(args) or holds_pixels(keywords):
+            return None
+        return render.func.__name__, args, keywords
+
+    def _dumps(self, output, side_outputs, render_spec):
+        try:
+            return zlib.compress(pickle.dumps((output, side_outputs, render_spec), pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            try:
+                return zlib.compress(pickle.dumps((output, side_outputs, None), pickle.HIGHEST_PROTOCOL))
+            except Exception:
+                return None  # not picklable; the step simply is not cached
+
+    def _loads(self, blob, interpreter, state):
+        output, side_outputs, render_spec = pickle.loads(zlib.decompress(blob))
+        render = render_spec
+        if isinstance(render_spec, tuple):
+            def load(value):
+                if not isinstance(value, Ref):
+                    return value
+                kind, *name = value
+                if kind == 'output':
+                    return output
+                if kind == 'side':
+                    return side_outputs[name[0]]
+                if kind == 'image':
+                    return load_image(state, state[name[0]])
+                return state[name[0]]
+            name, args, keywords = render_spec
+            render = functools.partial(getattr(interpreter, name), *map(load, args),
+                                       **{key: load(value) for key, value in keywords.items()})
+        return output, side_outputs, render
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute('SELECT value FROM steps WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                self._db.execute('UPDATE steps SET last_used = ? WHERE key = ?', (time.time(), key))
+        return row[0] if row is not None else None
+
+    def put(self, key, step_name, blob):
+        with self._lock:
+            old = self._db.execute('SELECT size FROM steps WHERE key = ?', (key,)).fetchone()
+            self._db.execute(
+                'INSERT OR REPLACE INTO steps (key, step_name, value, size, last_used) VALUES (?, ?, ?, ?, ?)',
+                (key, step_name, blob, len(blob), time.time()))
+            self._total += len(blob) - (old[0] if old is not None else 0)
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        self._total = self._count_bytes()
+        if self._total <= self.max_bytes:
+            return
+        victims = []
+        for key, size in self._db.execute('SELECT key, size FROM steps ORDER BY last_used'):
+            if self._total <= self.max_bytes * 0.9:
+                break
+            victims.append((key,))
+            self._total -= size
+        self._db.executemany('DELETE FROM steps WHERE key = ?', victims)
+
+    def execute(self, parse_result, state, run, interpreter=None, inspect=False):
+        """Same contract as StepCache.execute; results persist in the SQLite file"""
+        output_var = parse_result['output_var']
+        key = self.key(parse_result, state, interpreter)
+        blob = self.get(key)
+        if blob is not None:
+            try:
+                output, side_outputs, render = self._loads(blob, interpreter, state)
+            except Exception:
+                blob = None  # written by incompatible code; recompute and overwrite
+        if blob is not None and inspect and render is None:
+            blob = None  # stored without a render; run again for the html
+        if blob is not None:
+            count('disk_cache_hit')
+            with self._lock:
+                self.hits += 1
+            state[output_var] = output
+            for suffix, value in side_outputs.items():
+                state[output_var + suffix] = value
+            return output, render
+
+        count('disk_cache_miss')
+        with self._lock:
+            self.misses += 1
+        before = {name: id(value) for name, value in state.items() if name.startswith(output_var + '_')}
+        result = run()
+        output, render = result if isinstance(result, tuple) else (result, None)
+        side_outputs = {name[len(output_var):]: value for name, value in state.items()
+                        if name.startswith(output_var + '_') and before.get(name) != id(value)}
+        render_spec = self._render_spec(render, interpreter, output, side_outputs, parse_result, state)
+        blob = self._dumps(output, side_outputs, render_spec)
+        if blob is not None:
+            self.put(key, parse_result['step_name'], blob)
+        return output, render
+
+    def size(self):
+        """(number of entries, total compressed bytes)"""
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM steps').fetchone()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute('DELETE FROM steps')
+            self._total = 0
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,158 @@
+import copy
+import itertools
+import threading
+import weakref
+from collections import OrderedDict
+
+from .profiler import count
+from .fingerprint import content_hash
+
+# Model-backed steps; the rest are cheaper to recompute than to key
+CACHED_STEPS = ('VQA', 'FIND', 'LOC', 'FILTER', 'SEG', 'SELECT', 'CLASSIFY', 'FACEDET', 'CHANGED', 'DIFF', 'REPLACE', 'LIST')
+
+# Read by steps without being named in their args: region lists crop from their source
+# image, FILTER always looks at LEFT, CHANGED diffs LEFT against RIGHT or DIFF_MASK, DIFF
+# detects in LEFT and RIGHT
+IMPLICIT_INPUTS = ('LEFT', 'RIGHT', 'IMAGE', 'DIFF_MASK')
+
+
+def normalize_arg(value):
+    if isinstance(value, str):
+        return ' '.join(value.lower().split())
+    return value
+
+
+class ValueTokens:
+    """
+    Hashable identity tokens for state values. A value keeps its token for as long as it
+    is alive, and alias() gives another object the token of its original. Primitive
+    values are their own token. Lists, tuples and dicts cannot be weakly referenced and
+    holding them would keep every region list alive, so they are tokened by content
+    hash instead; a region list handed out by the step cache is a deep copy and so keys
+    downstream steps exactly like the list it was copied from.
+    """
+    def __init__(self):
+        self._tokens = dict()  # id(value) -> (weakref, token)
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def token(self, value):
+        if value is None or isinstance(value, (str, int, float, bool)):
+            return ('const', type(value).__name__, value)
+        if isinstance(value, (list, tuple, dict)):
+            return ('content', content_hash(value))
+        with self._lock:
+            entry = self._tokens.get(id(value))
+            if entry is not None:
+                ref, token = entry
+                if ref() is value:
+                    return token
+            token = ('value', next(self._counter))
+        self.alias(value, token)
+        return token
+
+    def alias(self, value, token):
+        if value is None or isinstance(value, (str, int, float, bool, list, tuple, dict)):
+            return
+        key = id(value)
+        try:
+            ref = weakref.ref(value, lambda _, key=key: self._tokens.pop(key, None))
+        except TypeError:
+            return  # not weakly referenceable; token() gives it a fresh token each time
+        with self._lock:
+            self._tokens[key] = (ref, token)
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+
+
+class StepCache:
+    """
+    Session-wide common-subexpression table for ProgramInterpreter(step_cache=...).
+
+    A step's key is (step name, its args lower-cased and whitespace-normalized, the
+    identity tokens of the state values its args name, and the tokens of the implicit
+    inputs LEFT/RIGHT/IMAGE/DIFF_MASK). Any later step with the same key, in the same
+    or another program, gets the stored value back without running the model. List and
+    dict outputs are returned as copies so a consumer mutating them cannot corrupt the
+    table; the copies share the original's token.
+    """
+    def __init__(self, steps=CACHED_STEPS, max_entries=4096):
+        self.steps = set(steps)
+        self.max_entries = max_entries
+        self.tokens = ValueTokens()
+        self._table = OrderedDict()  # key -> (output, side outputs, render)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, parse_result, state):
+        args = []
+        for arg, value in sorted(parse_result['args'].items()):
+            if isinstance(value, str) and value in state:
+                args.append((arg, 'var', self.tokens.token(state[value])))
+            else:
+                args.append((arg, 'const', normalize_arg(value)))
+        implicit = tuple((name, self.tokens.token(state[name])) for name in IMPLICIT_INPUTS if name in state)
+        return (parse_result['step_name'], tuple(args), implicit)
+
+    def _copy(self, value, token):
+        if isinstance(value, (list, dict)):
+            value = copy.deepcopy(value)
+            self.tokens.alias(value, token)
+        return value
+
+    def execute(self, parse_result, state, run, interpreter=None, inspect=False):
+        """
+        Run a step through the table. run() executes the step for real and returns what
+        the step interpreter returns; its output and any extra <output_var>* entries it
+        wrote into state (e.g. LOC's <output_var>_IMAGE) are replayed on a hit. interpreter
+        is the step's interpreter; the in-memory table lives no longer than it and ignores it.
+        With inspect=True an entry stored without a render (the step first ran without
+        inspect) counts as a miss, and the step runs again to produce its html.
+        """
+        output_var = parse_result['output_var']
+        try:
+            key = self.key(parse_result, state)
+            hash(key)
+        except TypeError:
+            return run()  # unhashable constant arg
+
+        with self._lock:
+            entry = self._table.get(key)
+            if entry is not None and inspect and entry[2] is None:
+                entry = None
+            if entry is not None:
+                self._table.move_to_end(key)
+                self.hits += 1
+        if entry is not None:
+            count('cse_hit')
+            output, side_outputs, render = entry
+            output = self._copy(output, key)
+            state[output_var] = output
+            for suffix, value in side_outputs.items():
+                state[output_var + suffix] = value
+            return output, render
+
+        count('cse_miss')
+        before = {name: id(value) for name, value in state.items() if name.startswith(output_var + '_')}
+        result = run()
+        output, render = result if isinstance(result, tuple) else (result, None)
+        side_outputs = {name[len(output_var):]: value for name, value in state.items()
+                        if name.startswith(output_var + '_') and before.get(name) != id(value)}
+
+        self.tokens.alias(output, key)
+        with self._lock:
+            self.misses += 1
+            self._table[key] = (output, side_outputs, render)
+            while len(self._table) > self.max_entries:
+                self._table.popitem(last=False)
+        output = self._copy(output, key)
+        state[output_var] = output
+        return output, render
+
+    def clear(self):
+        with self._lock:
+            self._table.clear()
+        self.tokens.clear()
@@ -1,3 +1,4 @@
+import re
 import cv2
 import os
 import torch
@@ -14,9 +15,14 @@ from transformers import (ViltProcessor, ViltForQuestionAnswering,
     MaskFormerFeatureExtractor, MaskFormerForInstanceSegmentation,
     CLIPProcessor, CLIPModel, AutoProcessor, BlipForQuestionAnswering)
 from diffusers import StableDiffusionInpaintPipeline
+from scipy.optimize import linear_sum_assignment
 
 from .nms import nms
+from .profiler import span, count
+from .image_store import load_image
+from .expr import compile_expression, coerce
 from vis_utils import html_embed_image, html_colored_span, vis_masks
+from generate_heatmaps import compute_difference, difference_regions, scale_regions
 import ast
 
 def parse_step(step_str, partial=False):
@@ -102,6 +108,8 @@ def html_colored_span(content, color):
     
 class EvalInterpreter():
     step_name = 'EVAL'
+    signature = ('expr',)  # keyword args, in positional order
+    var_args = ()  # args that name program variables
 
     def __init__(self):
         print(f'Registering {self.step_name} step')
@@ -110,7 +118,7 @@ class EvalInterpreter():
         parse_result = parse_step(prog_step.prog_str)
         step_name = parse_result['step_name']
         output_var = parse_result['output_var']
-        step_input = eval(parse_result['args']['expr'])
+        step_input = parse_result['args']['expr']
         assert(step_name==self.step_name)
         return step_input, output_var
     
@@ -123,35 +131,31 @@ class EvalInterpreter():
         return f"""<div>{var_name}={step_name}({expr}="{eval_expression}")={step_name}({expr}="{step_input}")={output}</div>"""
 
     def execute(self,prog_step,inspect=False):
-        step_input, output_var = self.parse(prog_step)
-        prog_state = dict()
-        for var_name,var_value in prog_step.state.items():
-            if isinstance(var_value,str):
-                if var_value in ['yes','no']:
-                    prog_state[var_name] = var_value=='yes'
-                elif var_value.isdecimal():
-                    prog_state[var_name] = var_value
-                else:
-                    prog_state[var_name] = f"'{var_value}'"
-            else:
-                prog_state[var_name] = var_value
-        
-        eval_expression = step_input
-
-        if 'xor' in step_input:
-            step_input = step_input.replace('xor','!=')
-
-        step_input = step_input.format(**prog_state)
-        step_output = eval(step_input)
+        eval_expression, output_var = self.parse(prog_step)
+
+        # The expression is compiled once per text and reads only the variables it needs,
+        # by reference; with a lazily evaluated state the steps behind skipped operands never run
+        used = dict()
+        def lookup(var_name):
+            if var_name not in prog_step.state:
+                raise KeyError(f"[EVAL] Variable '{var_name}' not found in state")
+            used[var_name] = coerce(prog_step.state[var_name])
+            return used[var_name]
+
+        step_output = compile_expression(eval_expression)(lookup)
         prog_step.state[output_var] = step_output
         if inspect:
-            html_str = self.html(eval_expression, step_input, step_output, output_var)
+            step_input = re.sub(
+                r'\{(\w+)\}', lambda m: repr(used[m.group(1)]) if m.group(1) in used else m.group(1), eval_expression)
+            html_str = functools.partial(self.html, eval_expression, step_input, step_output, output_var)
             return step_output, html_str
 
         return step_output, None
     
 class ResultInterpreter():
     step_name = 'RESULT'
+    signature = ('var',)
+    var_args = ('var',)
     
     def __init__(self):
         print(f'Registering {self.step_name} step')
@@ -178,7 +182,7 @@ class ResultInterpreter():
         prog_step.state[output_var] = result_value
         
         if inspect:
-            html_str = self.html(var_name, output_var, result_value)
+            html_str = functools.partial(self.html, var_name, output_var, result_value)
             return result_value, html_str
         else:
             return result_value, None
@@ -195,13 +199,16 @@ class ResultInterpreter():
 
 class VQAInterpreter():
     step_name = 'VQA'
+    signature = ('image', 'question')
+    var_args = ('image',)
+    model_id = "Salesforce/blip-vqa-capfilt-large"
     
     def __init__(self):
         print(f'Registering {self.step_name} step')
         self.device = "cuda:0" if torch.cuda.is_available() else "cpu"
-        self.processor = AutoProcessor.from_pretrained("Salesforce/blip-vqa-capfilt-large")
+        self.processor = AutoProcessor.from_pretrained(self.model_id)
         self.model = BlipForQuestionAnswering.from_pretrained(
-            "Salesforce/blip-vqa-capfilt-large").to(self.device)
+            self.model_id).to(self.device)
         self.model.eval()
     
     def parse(self, prog_step):
@@ -215,12 +222,33 @@ class VQAInterpreter():
         return img_var, question, output_var
     
     def predict(self, img, question):
-        encoding = self.processor(img, question, return_tensors='pt')
-        encoding = {k: v.to(self.device) for k, v in encoding.items()}
-        with torch.no_grad():
+        with span('preprocess'):
+            encoding = self.processor(img, question, return_tensors='pt')
+            encoding = {k: v.to(self.device) for k, v in encoding.items()}
+        with span('forward'), torch.no_grad():
             outputs = self.model.generate(**encoding)
         
         return self.processor.decode(outputs[0], skip_special_tokens=True)
+
+    def predict_batch(self, imgs, questions):
+        """
+        Answers for many (image, question) pairs in one forward pass, with confidences:
+        the probability of each greedy answer (product of its token probabilities).
+        """
+        with span('preprocess'):
+            encoding = self.processor(imgs, questions, return_tensors='pt', padding=True)
+            encoding = {k: v.to(self.device) for k, v in encoding.items()}
+        with span('forward'), torch.no_grad():
+            outputs = self.model.generate(**encoding, output_scores=True, return_dict_in_generate=True)
+
+        tokens = outputs.sequences[:, -len(outputs.scores):]
+        log_probs = torch.stack(outputs.scores, 1).log_softmax(-1)
+        token_log_probs = log_probs.gather(-1, tokens[..., None])[..., 0]
+        pad_token_id = self.processor.tokenizer.pad_token_id
+        token_log_probs = token_log_probs.masked_fill(tokens == pad_token_id, 0.0)
+        confidences = token_log_probs.sum(1).exp().tolist()
+        answers = self.processor.batch_decode(outputs.sequences, skip_special_tokens=True)
+        return answers, confidences
     
     def html(self, img, question, answer, output_var):
         step_name = html_step_name(self.step_name)
@@ -230,9 +258,13 @@ class VQAInterpreter():
         image_arg = html_arg_name('image')
         question_arg = html_arg_name('question')
         return f"""<div>{output_var}={step_name}({image_arg}={img_str},&nbsp;{question_arg}='{question}')={answer}</div>"""
+
+    def html_crop(self, img, box, question, answer, output_var):
+        return self.html(img.crop(box), question, answer, output_var)
     
     def execute(self, prog_step, inspect=False):
         img_var, question, output_var = self.parse(prog_step)
+        crop_box = None
         
         # CRITICAL FIX: Resolve the image variable first
         # Check if img_var is a variable name in the program state
@@ -247,48 +279,31 @@ class VQAInterpreter():
                 raise ValueError("VQA received an empty region list.")
             region = image_or_regions[0]
             
-            # Get base image from state
-            base_image = prog_step.state.get("LEFT", None)
+            # Get base image from state (regions from CHANGED record their source image)
+            base_image = prog_step.state.get(region.get("image", "LEFT") if isinstance(region, dict) else "LEFT", None)
             if base_image is None:
                 raise ValueError("No base image found in program state.")
             
-            # If base_image is still a string, convert it to PIL Image
-            if isinstance(base_image, str):
-                try:
-                    base_image = Image.open(base_image).convert('RGB')
-                    # Update the state with the loaded image
-                    prog_step.state["LEFT"] = base_image
-                except Exception as e:
-                    raise ValueError(f"Could not load image from path '{base_image}': {e}")
+            try:
+                base_image = load_image(prog_step.state, base_image)
+            except Exception as e:
+                raise ValueError(f"Could not load image from path '{base_image}': {e}")
             
             # Crop the region
             if isinstance(region, dict) and "box" in region:
                 x1, y1, x2, y2 = region["box"]
-                image_or_regions = base_image.crop((x1, y1, x2, y2))
+                crop_box = (x1, y1, x2, y2)
+                image_or_regions = base_image.crop(crop_box)
             else:
                 raise ValueError(f"Invalid region format: {region}")
         
         # Handle direct image references (not from FIND)
         elif isinstance(image_or_regions, str):
-            # Try to get from state first
-            if image_or_regions in prog_step.state:
-                image_obj = prog_step.state[image_or_regions]
-                if isinstance(image_obj, str):
-                    # It's a file path, load it
-                    try:
-                        image_or_regions = Image.open(image_obj).convert('RGB')
-                        # Update state with loaded image
-                        prog_step.state[img_var] = image_or_regions
-                    except Exception as e:
-                        raise ValueError(f"Could not load image from path '{image_obj}': {e}")
-                else:
-                    image_or_regions = image_obj
-            else:
-                # Assume it's a file path
-                try:
-                    image_or_regions = Image.open(image_or_regions).convert('RGB')
-                except Exception as e:
-                    raise ValueError(f"Could not load image from path '{img_var}': {e}")
+            # A path, either held by the image variable or given directly
+            try:
+                image_or_regions = load_image(prog_step.state, image_or_regions)
+            except Exception as e:
+                raise ValueError(f"Could not load image from path '{image_or_regions}': {e}")
         
         # Final check: ensure we have a PIL Image
         if not isinstance(image_or_regions, Image.Image):
@@ -299,7 +314,11 @@ class VQAInterpreter():
         prog_step.state[output_var] = answer
 
         if inspect:
-            html_str = self.html(image_or_regions, question, answer, output_var)
+            if crop_box is not None:
+                # Crop again when rendered, so the deferred html only holds the base image
+                html_str = functools.partial(self.html_crop, base_image, crop_box, question, answer, output_var)
+            else:
+                html_str = functools.partial(self.html, image_or_regions, question, answer, output_var)
             return answer, html_str
         return answer, None
 
@@ -308,15 +327,19 @@ class VQAInterpreter():
 
 class LocInterpreter():
     step_name = 'LOC'
+    signature = ('image', 'object')
+    var_args = ('image',)
+    model_id = "google/owlvit-large-patch14"
 
     def __init__(self,thresh=0.1,nms_thresh=0.5):
         print(f'Registering {self.step_name} step')
         self.device = "cuda:0" if torch.cuda.is_available() else "cpu"
         self.processor = OwlViTProcessor.from_pretrained(
-            "google/owlvit-large-patch14")
+            self.model_id)
         self.model = OwlViTForObjectDetection.from_pretrained(
-            "google/owlvit-large-patch14").to(self.device)
+            self.model_id).to(self.device)
         self.model.eval()
+        self.model_id = f'{self.model_id}(thresh={thresh},nms_thresh={nms_thresh})'
         self.thresh = thresh
         self.nms_thresh = nms_thresh
 
@@ -339,12 +362,13 @@ class LocInterpreter():
         return [x1,y1,x2,y2]
 
     def predict(self,img,obj_name):
-        encoding = self.processor(
-            text=[[f'a photo of {obj_name}']], 
-            images=img,
-            return_tensors='pt')
-        encoding = {k:v.to(self.device) for k,v in encoding.items()}
-        with torch.no_grad():
+        with span('preprocess'):
+            encoding = self.processor(
+                text=[[f'a photo of {obj_name}']], 
+                images=img,
+                return_tensors='pt')
+            encoding = {k:v.to(self.device) for k,v in encoding.items()}
+        with span('forward'), torch.no_grad():
             outputs = self.model(**encoding)
             for k,v in outputs.items():
                 if v is not None:
@@ -355,6 +379,10 @@ class LocInterpreter():
         boxes, scores = results[0]["boxes"], results[0]["scores"]
         boxes = boxes.cpu().detach().numpy().tolist()
         scores = scores.cpu().detach().numpy().tolist()
+        return self.select_boxes(boxes,scores,img.size)
+
+    def select_boxes(self,boxes,scores,img_size):
+        """Threshold, clip and nms raw detections"""
         if len(boxes)==0:
             return []
 
@@ -363,7 +391,7 @@ class LocInterpreter():
         selected_scores = []
         for i in range(len(scores)):
             if scores[i] > self.thresh:
-                coord = self.normalize_coord(boxes[i],img.size)
+                coord = self.normalize_coord(boxes[i],img_size)
                 selected_boxes.append(coord)
                 selected_scores.append(scores[i])
 
@@ -428,7 +456,7 @@ class LocInterpreter():
         prog_step.state[output_var] = bboxes
         prog_step.state[output_var+'_IMAGE'] = box_img
         if inspect:
-            html_str = self.html(img, box_img, output_var, obj_name)
+            html_str = functools.partial(self.html, img, box_img, output_var, obj_name)
             return bboxes, html_str
 
         return bboxes, None
@@ -436,6 +464,9 @@ class LocInterpreter():
 
 class Loc2Interpreter(LocInterpreter):
 
+    def html_boxes(self,img,bboxes,output_var,obj_name):
+        return self.html(img, self.box_image(img, bboxes, highlight_best=False), output_var, obj_name)
+
     def execute(self,prog_step,inspect=False):
         img_var,obj_name,output_var = self.parse(prog_step)
         img = prog_step.state[img_var]
@@ -450,8 +481,7 @@ class Loc2Interpreter(LocInterpreter):
         prog_step.state[output_var] = objs
 
         if inspect:
-            box_img = self.box_image(img, bboxes, highlight_best=False)
-            html_str = self.html(img, box_img, output_var, obj_name)
+            html_str = functools.partial(self.html_boxes, img, bboxes, output_var, obj_name)
             return bboxes, html_str
 
         return objs, None
@@ -459,6 +489,8 @@ class Loc2Interpreter(LocInterpreter):
 
 class CountInterpreter():
     step_name = 'COUNT'
+    signature = ('region',)
+    var_args = ('region',)
 
     def __init__(self):
         print(f'Registering {self.step_name} step')
@@ -491,7 +523,7 @@ class CountInterpreter():
 
         prog_step.state[output_var] = count
         if inspect:
-            html_str = self.html(region_var, output_var, count)
+            html_str = functools.partial(self.html, region_var, output_var, count)
             return count, html_str
         return count, None
 
@@ -499,6 +531,8 @@ class CountInterpreter():
 
 class CropInterpreter():
     step_name = 'CROP'
+    signature = ('image', 'box')
+    var_args = ('image', 'box')
 
     def __init__(self):
         print(f'Registering {self.step_name} step')
@@ -549,7 +583,7 @@ class CropInterpreter():
         prog_step.state[output_var] = out_img
         if inspect:
             box_img = prog_step.state[box_var+'_IMAGE']
-            html_str = self.html(img, out_img, output_var, box_img)
+            html_str = functools.partial(self.html, img, out_img, output_var, box_img)
             return out_img, html_str
 
         return out_img, None
@@ -581,7 +615,7 @@ class CropRightOfInterpreter(CropInterpreter):
         prog_step.state[output_var] = out_img
         if inspect:
             box_img = prog_step.state[box_var+'_IMAGE']
-            html_str = self.html(img, out_img, output_var, box_img)
+            html_str = functools.partial(self.html, img, out_img, output_var, box_img)
             return out_img, html_str
 
         return out_img, None
@@ -613,7 +647,7 @@ class CropLeftOfInterpreter(CropInterpreter):
         prog_step.state[output_var] = out_img
         if inspect:
             box_img = prog_step.state[box_var+'_IMAGE']
-            html_str = self.html(img, out_img, output_var, box_img)
+            html_str = functools.partial(self.html, img, out_img, output_var, box_img)
             return out_img, html_str
 
         return out_img, None
@@ -645,7 +679,7 @@ class CropAboveInterpreter(CropInterpreter):
         prog_step.state[output_var] = out_img
         if inspect:
             box_img = prog_step.state[box_var+'_IMAGE']
-            html_str = self.html(img, out_img, output_var, box_img)
+            html_str = functools.partial(self.html, img, out_img, output_var, box_img)
             return out_img, html_str
 
         return out_img, None
@@ -676,7 +710,7 @@ class CropBelowInterpreter(CropInterpreter):
         prog_step.state[output_var] = out_img
         if inspect:
             box_img = prog_step.state[box_var+'_IMAGE']
-            html_str = self.html(img, out_img, output_var, box_img)
+            html_str = functools.partial(self.html, img, out_img, output_var, box_img)
             return out_img, html_str
 
         return out_img, None
@@ -700,14 +734,17 @@ class CropAheadInterpreter(CropInterpreter):
 
 class SegmentInterpreter():
     step_name = 'SEG'
+    signature = ('image',)
+    var_args = ('image',)
+    model_id = "facebook/maskformer-swin-base-coco"
 
     def __init__(self):
         print(f'Registering {self.step_name} step')
         self.device = "cuda:0" if torch.cuda.is_available() else "cpu"
         self.feature_extractor = MaskFormerFeatureExtractor.from_pretrained(
-            "facebook/maskformer-swin-base-coco")
+            self.model_id)
         self.model = MaskFormerForInstanceSegmentation.from_pretrained(
-            "facebook/maskformer-swin-base-coco").to(self.device)
+            self.model_id).to(self.device)
         self.model.eval()
 
     def parse(self,prog_step):
@@ -719,22 +756,28 @@ class SegmentInterpreter():
         return img_var,output_var
 
     def pred_seg(self,img):
-        inputs = self.feature_extractor(images=img, return_tensors="pt")
-        inputs = {k:v.to(self.device) for k,v in inputs.items()}
-        with torch.no_grad():
+        with span('preprocess'):
+            inputs = self.feature_extractor(images=img, return_tensors="pt")
+            inputs = {k:v.to(self.device) for k,v in inputs.items()}
+        with span('forward'), torch.no_grad():
             outputs = self.model(**inputs)
         outputs = self.feature_extractor.post_process_panoptic_segmentation(outputs)[0]
         instance_map = outputs['segmentation'].cpu().numpy()
-        objs = []
         print(outputs.keys())
-        for seg in outputs['segments_info']:
+        return self.instance_masks(
+            instance_map, outputs['segments_info'], self.model.config.id2label, img.size)
+
+    def instance_masks(self,instance_map,segments_info,id2label,img_size):
+        """Per-instance masks resized to img_size, with boxes and categories"""
+        objs = []
+        for seg in segments_info:
             inst_id = seg['id']
             label_id = seg['label_id']
-            category = self.model.config.id2label[label_id]
+            category = id2label[label_id]
             mask = (instance_map==inst_id).astype(float)
             resized_mask = np.array(
                 Image.fromarray(mask).resize(
-                    img.size,resample=Image.BILINEAR))
+                    img_size,resample=Image.BILINEAR))
             Y,X = np.where(resized_mask>0.5)
             x1,x2 = np.min(X), np.max(X)
             y1,y2 = np.min(Y), np.max(Y)
@@ -756,15 +799,17 @@ class SegmentInterpreter():
         output = html_embed_image(output,300)
         return f"""<div>{output_var}={step_name}({img_arg}={img_var})={output}</div>"""
 
+    def html_masks(self,img_var,output_var,img,objs):
+        labels = [str(obj['inst_id'])+':'+obj['category'] for obj in objs]
+        return self.html(img_var, output_var, vis_masks(img, objs, labels))
+
     def execute(self,prog_step,inspect=False):
         img_var,output_var = self.parse(prog_step)
         img = prog_step.state[img_var]
         objs = self.pred_seg(img)
         prog_step.state[output_var] = objs
         if inspect:
-            labels = [str(obj['inst_id'])+':'+obj['category'] for obj in objs]
-            obj_img = vis_masks(img, objs, labels)
-            html_str = self.html(img_var, output_var, obj_img)
+            html_str = functools.partial(self.html_masks, img_var, output_var, img, objs)
             return objs, html_str
 
         return objs, None
@@ -772,15 +817,18 @@ class SegmentInterpreter():
 
 class SelectInterpreter():
     step_name = 'SELECT'
+    signature = ('image', 'object', 'query', 'category')
+    var_args = ('image', 'object')
+    model_id = "openai/clip-vit-large-patch14"
 
     def __init__(self):
         print(f'Registering {self.step_name} step')
         self.device = "cuda:0" if torch.cuda.is_available() else "cpu"
         self.model = CLIPModel.from_pretrained(
-            "openai/clip-vit-large-patch14").to(self.device)
+            self.model_id).to(self.device)
         self.model.eval()
         self.processor = CLIPProcessor.from_pretrained(
-            "openai/clip-vit-large-patch14")
+            self.model_id)
 
     def parse(self,prog_step):
         parse_result = parse_step(prog_step.prog_str)
@@ -800,14 +848,19 @@ class SelectInterpreter():
         text_feats = text_feats / text_feats.norm(p=2, dim=-1, keepdim=True)
         return torch.matmul(img_feats,text_feats.t())
 
+    def similarity(self,images,text):
+        """images x text matrix of CLIP cosine similarities"""
+        with span('preprocess'):
+            inputs = self.processor(
+                text=text, images=images, return_tensors="pt", padding=True)
+            inputs = {k:v.to(self.device) for k,v in inputs.items()}
+        with span('forward'), torch.no_grad():
+            return self.calculate_sim(inputs).cpu().numpy()
+
     def query_obj(self,query,objs,img):
         images = [img.crop(obj['box']) for obj in objs]
         text = [f'a photo of {q}' for q in query]
-        inputs = self.processor(
-            text=text, images=images, return_tensors="pt", padding=True)
-        inputs = {k:v.to(self.device) for k,v in inputs.items()}
-        with torch.no_grad():
-            scores = self.calculate_sim(inputs).cpu().numpy()
+        scores = self.similarity(images, text)
             
         obj_ids = scores.argmax(0)
         return [objs[i] for i in obj_ids]
@@ -824,6 +877,9 @@ class SelectInterpreter():
         output = html_embed_image(output,300)
         return f"""<div>{output_var}={step_name}({image_arg}={image_var},{obj_arg}={obj_var},{query_arg}={query},{category_arg}={category})={output}</div>"""
 
+    def html_masks(self,img_var,obj_var,query,category,output_var,img,objs):
+        return self.html(img_var, obj_var, query, category, output_var, vis_masks(img, objs))
+
     def query_string_match(self,objs,q):
         obj_cats = [obj['category'] for obj in objs]
         q = q.lower()
@@ -858,8 +914,8 @@ class SelectInterpreter():
 
         prog_step.state[output_var] = select_objs
         if inspect:
-            select_obj_img = vis_masks(img, select_objs)
-            html_str = self.html(img_var, obj_var, query, category, output_var, select_obj_img)
+            html_str = functools.partial(
+                self.html_masks, img_var, obj_var, query, category, output_var, img, select_objs)
             return select_objs, html_str
 
         return select_objs, None
@@ -867,6 +923,8 @@ class SelectInterpreter():
 
 class ColorpopInterpreter():
     step_name = 'COLORPOP'
+    signature = ('image', 'object')
+    var_args = ('image', 'object')
 
     def __init__(self):
         print(f'Registering {self.step_name} step')
@@ -920,7 +978,7 @@ class ColorpopInterpreter():
         gimg = Image.fromarray(gimg)
         prog_step.state[output_var] = gimg
         if inspect:
-            html_str = self.html(img_var, obj_var, output_var, gimg)
+            html_str = functools.partial(self.html, img_var, obj_var, output_var, gimg)
             return gimg, html_str
 
         return gimg, None
@@ -928,6 +986,8 @@ class ColorpopInterpreter():
 
 class BgBlurInterpreter():
     step_name = 'BGBLUR'
+    signature = ('image', 'object')
+    var_args = ('image', 'object')
 
     def __init__(self):
         print(f'Registering {self.step_name} step')
@@ -987,7 +1047,7 @@ class BgBlurInterpreter():
         bgimg = Image.fromarray(bgimg)
         prog_step.state[output_var] = bgimg
         if inspect:
-            html_str = self.html(img_var, obj_var, output_var, bgimg)
+            html_str = functools.partial(self.html, img_var, obj_var, output_var, bgimg)
             return bgimg, html_str
 
         return bgimg, None
@@ -995,6 +1055,9 @@ class BgBlurInterpreter():
 
 class FaceDetInterpreter():
     step_name = 'FACEDET'
+    signature = ('image',)
+    var_args = ('image',)
+    model_id = "DSFDDetector(confidence_threshold=0.5,nms_iou_threshold=0.3)"
 
     def __init__(self):
         print(f'Registering {self.step_name} step')
@@ -1028,7 +1091,7 @@ class FaceDetInterpreter():
         return [x1,y1,x2,y2]
 
     def det_face(self,img):
-        with torch.no_grad():
+        with span('forward'), torch.no_grad():
             faces = self.model.detect(np.array(img))
         
         W,H = img.size
@@ -1062,7 +1125,7 @@ class FaceDetInterpreter():
         objs = self.det_face(img)
         prog_step.state[output_var] = objs
         if inspect:
-            html_str = self.html(img, output_var, objs)
+            html_str = functools.partial(self.html, img, output_var, objs)
             return objs, html_str
 
         return objs, None
@@ -1070,6 +1133,8 @@ class FaceDetInterpreter():
 
 class EmojiInterpreter():
     step_name = 'EMOJI'
+    signature = ('image', 'object', 'emoji')
+    var_args = ('image', 'object')
 
     def __init__(self):
         print(f'Registering {self.step_name} step')
@@ -1122,7 +1187,7 @@ class EmojiInterpreter():
         img = self.add_emoji(objs, emoji_name, img)
         prog_step.state[output_var] = img
         if inspect:
-            html_str = self.html(img_var, obj_var, emoji_name, output_var, img)
+            html_str = functools.partial(self.html, img_var, obj_var, emoji_name, output_var, img)
             return img, html_str
 
         return img, None
@@ -1130,6 +1195,9 @@ class EmojiInterpreter():
 
 class ListInterpreter():
     step_name = 'LIST'
+    signature = ('query', 'max')
+    var_args = ()
+    model_id = "text-davinci-002"
 
     prompt_template = """
 Create comma separated lists based on the query.
@@ -1186,7 +1254,7 @@ List:"""
         item_list = self.get_list(text,list_max)
         prog_step.state[output_var] = item_list
         if inspect:
-            html_str = self.html(text, list_max, item_list, output_var)
+            html_str = functools.partial(self.html, text, list_max, item_list, output_var)
             return item_list, html_str
 
         return item_list, None
@@ -1194,14 +1262,17 @@ List:"""
 
 class ClassifyInterpreter():
     step_name = 'CLASSIFY'
+    signature = ('image', 'object', 'categories')
+    var_args = ('image', 'object', 'categories')
+    model_id = "openai/clip-vit-large-patch14"
 
     def __init__(self):
         print(f'Registering {self.step_name} step')
         self.device = "cuda:0" if torch.cuda.is_available() else "cpu"
         self.model = CLIPModel.from_pretrained(
-            "openai/clip-vit-large-patch14").to(self.device)
+            self.model_id).to(self.device)
         self.model.eval()
-        self.processor = CLIPProcessor.from_pretrained("openai/clip-vit-large-patch14")
+        self.processor = CLIPProcessor.from_pretrained(self.model_id)
 
     def parse(self,prog_step):
         parse_result = parse_step(prog_step.prog_str)
@@ -1220,6 +1291,15 @@ class ClassifyInterpreter():
         text_feats = text_feats / text_feats.norm(p=2, dim=-1, keepdim=True)
         return torch.matmul(img_feats,text_feats.t())
 
+    def similarity(self,images,text):
+        """images x text matrix of CLIP cosine similarities"""
+        with span('preprocess'):
+            inputs = self.processor(
+                text=text, images=images, return_tensors="pt", padding=True)
+            inputs = {k:v.to(self.device) for k,v in inputs.items()}
+        with span('forward'), torch.no_grad():
+            return self.calculate_sim(inputs).cpu().numpy()
+
     def query_obj(self,query,objs,img):
         if len(objs)==0:
             images = [img]
@@ -1231,16 +1311,10 @@ class ClassifyInterpreter():
             query = query + ['other']
 
         text = [f'a photo of {q}' for q in query]
-        inputs = self.processor(
-            text=text, images=images, return_tensors="pt", padding=True)
-        inputs = {k:v.to(self.device) for k,v in inputs.items()}
-        with torch.no_grad():
-            sim = self.calculate_sim(inputs)
-            
+        scores = self.similarity(images, text)
 
         # if only one query then select the object with the highest score
         if len(query)==1:
-            scores = sim.cpu().numpy()
             obj_ids = scores.argmax(0)
             obj = objs[obj_ids[0]]
             obj['class']=query[0]
@@ -1248,7 +1322,6 @@ class ClassifyInterpreter():
             return [obj]
 
         # assign the highest scoring class to each object but this may assign same class to multiple objects
-        scores = sim.cpu().numpy()
         cat_ids = scores.argmax(1)
         for i,(obj,cat_id) in enumerate(zip(objs,cat_ids)):
             class_name = query[cat_id]
@@ -1301,7 +1374,7 @@ class ClassifyInterpreter():
         objs = self.query_obj(cats, objs, img)
         prog_step.state[output_var] = objs
         if inspect:
-            html_str = self.html(image_var,obj_var,objs,category_var,output_var)
+            html_str = functools.partial(self.html, image_var,obj_var,objs,category_var,output_var)
             return objs, html_str
 
         return objs, None
@@ -1309,6 +1382,8 @@ class ClassifyInterpreter():
 
 class TagInterpreter():
     step_name = 'TAG'
+    signature = ('image', 'object')
+    var_args = ('image', 'object')
 
     def __init__(self):
         print(f'Registering {self.step_name} step')
@@ -1359,7 +1434,7 @@ class TagInterpreter():
         img = self.tag_image(original_img, objs)
         prog_step.state[output_var] = img
         if inspect:
-            html_str = self.html(img_var, img, obj_var, output_var)
+            html_str = functools.partial(self.html, img_var, img, obj_var, output_var)
             return img, html_str
 
         return img, None
@@ -1370,13 +1445,15 @@ def dummy(images, **kwargs):
 
 class ReplaceInterpreter():
     step_name = 'REPLACE'
+    signature = ('image', 'object', 'prompt')
+    var_args = ('image', 'object')
+    model_id = "runwayml/stable-diffusion-inpainting"
 
     def __init__(self):
         print(f'Registering {self.step_name} step')
         device = "cuda"
-        model_name = "runwayml/stable-diffusion-inpainting"
         self.pipe = StableDiffusionInpaintPipeline.from_pretrained(
-            model_name,
+            self.model_id,
             revision="fp16",
             torch_dtype=torch.float16)
         self.pipe = self.pipe.to(device)
@@ -1416,16 +1493,18 @@ class ReplaceInterpreter():
         return new_img, W, H
 
     def predict(self,img,mask,prompt):
-        mask,_,_ = self.resize_and_pad(mask)
-        init_img,W,H = self.resize_and_pad(img)
-        new_img = self.pipe(
-            prompt=prompt,
-            image=init_img,
-            mask_image=mask,
-            # strength=0.98,
-            guidance_scale=7.5,
-            num_inference_steps=50 #200
-        ).images[0]
+        with span('preprocess'):
+            mask,_,_ = self.resize_and_pad(mask)
+            init_img,W,H = self.resize_and_pad(img)
+        with span('forward'):
+            new_img = self.pipe(
+                prompt=prompt,
+                image=init_img,
+                mask_image=mask,
+                # strength=0.98,
+                guidance_scale=7.5,
+                num_inference_steps=50 #200
+            ).images[0]
         return new_img.crop((0,0,W-1,H-1)).resize(img.size)
 
     def html(self,img_var,obj_var,prompt,output_var,output):
@@ -1447,19 +1526,22 @@ class ReplaceInterpreter():
         new_img = self.predict(img, mask, prompt)
         prog_step.state[output_var] = new_img
         if inspect:
-            html_str = self.html(img_var, obj_var, prompt, output_var, new_img)
+            html_str = functools.partial(self.html, img_var, obj_var, prompt, output_var, new_img)
             return new_img, html_str
         return new_img, None
 
 class FindInterpreter():
     step_name = 'FIND'
+    signature = ('image', 'object')
+    var_args = ('image',)
+    model_id = "google/owlvit-large-patch14"
     
     def __init__(self):
         print(f'Registering {self.step_name} step')
         self.device = "cuda:0" if torch.cuda.is_available() else "cpu"
         from transformers import OwlViTProcessor, OwlViTForObjectDetection
-        self.processor = OwlViTProcessor.from_pretrained("google/owlvit-large-patch14")
-        self.model = OwlViTForObjectDetection.from_pretrained("google/owlvit-large-patch14").to(self.device)
+        self.processor = OwlViTProcessor.from_pretrained(self.model_id)
+        self.model = OwlViTForObjectDetection.from_pretrained(self.model_id).to(self.device)
         self.model.eval()
     
     def parse(self, prog_step):
@@ -1484,16 +1566,14 @@ class FindInterpreter():
             if not image_or_regions:
                 raise ValueError(f"[FIND] Received empty region list from variable '{image_var}'")
             
-            # Get the base image to crop regions from
-            base_image = self._get_base_image(prog_step)
-            
             # Find objects within each region and combine results
             all_detections = []
             for region in image_or_regions:
                 if not isinstance(region, dict) or 'box' not in region:
                     raise ValueError(f"[FIND] Invalid region format: {region}")
                 
-                # Crop the region from base image
+                # Crop the region from the image it was found in
+                base_image = self._get_base_image(prog_step, region.get('image'))
                 x1, y1, x2, y2 = region['box']
                 cropped_image = base_image.crop((x1, y1, x2, y2))
                 
@@ -1510,6 +1590,8 @@ class FindInterpreter():
                         orig_box[2] + x1,
                         orig_box[3] + y1
                     ]
+                    if 'image' in region:
+                        detection['image'] = region['image']
                 
                 all_detections.extend(region_detections)
             
@@ -1520,10 +1602,7 @@ class FindInterpreter():
             # Handle string paths or direct PIL images
             if isinstance(image_or_regions, str):
                 try:
-                    from PIL import Image
-                    image_or_regions = Image.open(image_or_regions).convert('RGB')
-                    # Update state with loaded image
-                    prog_step.state[image_var] = image_or_regions
+                    image_or_regions = load_image(prog_step.state, image_or_regions)
                 except Exception as e:
                     raise ValueError(f"[FIND] Could not load image from path '{image_or_regions}': {e}")
             
@@ -1531,48 +1610,55 @@ class FindInterpreter():
                 raise ValueError(f"[FIND] Invalid image type: {type(image_or_regions)}")
                 
             detections = self.find(image_or_regions, object_query)
+            for detection in detections:
+                detection['image'] = image_var
         
         prog_step.state[output_var] = detections
         
         if inspect:
-            html_str = self.html(image_var, object_query, output_var, detections)
+            html_str = functools.partial(self.html, image_var, object_query, output_var, detections)
             return detections, html_str
         return detections, None
     
-    def _get_base_image(self, prog_step):
+    def _get_base_image(self, prog_step, img_var=None):
         """Get the base image for coordinate transformations"""
-        # Try common image variable names
-        for img_var in ['LEFT', 'RIGHT', 'IMAGE']:
+        # Try the region's own image first, then common image variable names
+        candidates = ['LEFT', 'RIGHT', 'IMAGE'] if img_var is None else [img_var]
+        for img_var in candidates:
             if img_var in prog_step.state:
-                base_img = prog_step.state[img_var]
-                if isinstance(base_img, str):
-                    from PIL import Image
-                    base_img = Image.open(base_img).convert('RGB')
-                    prog_step.state[img_var] = base_img
-                return base_img
+                return load_image(prog_step.state, prog_step.state[img_var])
         
         raise ValueError("[FIND] No base image found in program state for coordinate transformation")
     
     def find(self, image, object_query):
+        return self.find_batch([image], object_query)[0]
+
+    def find_batch(self, images, object_query):
+        """Detections of object_query in each image, from one batched forward pass"""
         if isinstance(object_query, str):
             object_query = [object_query]
         
-        inputs = self.processor(images=image, text=object_query, return_tensors="pt").to(self.device)
-        with torch.no_grad():
+        with span('preprocess'):
+            inputs = self.processor(
+                images=images, text=[object_query] * len(images), return_tensors="pt").to(self.device)
+        with span('forward'), torch.no_grad():
             outputs = self.model(**inputs)
         
-        target_sizes = torch.Tensor([image.size[::-1]]).to(self.device)
-        results = self.processor.post_process_object_detection(outputs, threshold=0.1, target_sizes=target_sizes)[0]
+        target_sizes = torch.Tensor([image.size[::-1] for image in images]).to(self.device)
+        results = self.processor.post_process_object_detection(outputs, threshold=0.1, target_sizes=target_sizes)
         
-        detections = []
-        for score, label, box in zip(results["scores"], results["labels"], results["boxes"]):
-            box = [int(x) for x in box.tolist()]  # Convert to integers
-            detections.append({
-                'box': box,
-                'category': object_query[label.item()],
-                'score': score.item()
-            })
-        return detections
+        batch_detections = []
+        for result in results:
+            detections = []
+            for score, label, box in zip(result["scores"], result["labels"], result["boxes"]):
+                box = [int(x) for x in box.tolist()]  # Convert to integers
+                detections.append({
+                    'box': box,
+                    'category': object_query[label.item()],
+                    'score': score.item()
+                })
+            batch_detections.append(detections)
+        return batch_detections
     
     def html(self, image_var, object_query, output_var, output):
         step_name = html_step_name(self.step_name)
@@ -1587,6 +1673,9 @@ class FindInterpreter():
 
 class FilterInterpreter():
     step_name = 'FILTER'
+    signature = ('region', 'attribute')
+    var_args = ('region',)
+    model_id = "Salesforce/blip-vqa-base"
 
     def __init__(self):
         print(f'Registering {self.step_name} step')
@@ -1613,13 +1702,13 @@ class FilterInterpreter():
         
         # Get the image - you might need to determine which image to use
         # For now, assuming LEFT image, but you may need to make this more flexible
-        image = prog_step.state["LEFT"]  
+        image = load_image(prog_step.state, prog_step.state["LEFT"])
 
         filtered = self.filter_regions(image, regions, attribute)
         prog_step.state[output_var] = filtered
         
         if inspect:
-            html_str = self.html(region_var, attribute, output_var, filtered)
+            html_str = functools.partial(self.html, region_var, attribute, output_var, filtered)
             return filtered, html_str
         return filtered, None
 
@@ -1655,6 +1744,8 @@ class FilterInterpreter():
 
 class ExistsInterpreter():
     step_name = 'EXISTS'
+    signature = ('region',)
+    var_args = ('region',)
 
     def __init__(self):
         print(f'Registering {self.step_name} step')
@@ -1678,7 +1769,7 @@ class ExistsInterpreter():
             output = False
         prog_step.state[output_var] = output
         if inspect:
-            html_str = self.html(region_var, output_var, output)
+            html_str = functools.partial(self.html, region_var, output_var, output)
             return output, html_str
         return output, None
 
@@ -1691,18 +1782,221 @@ class ExistsInterpreter():
         return f"""{output_var}={step_name}({region_arg}={region_var})={output}"""
 
 
+class ChangeInterpreter():
+    step_name = 'CHANGED'
+    signature = ('image',)
+    var_args = ('image',)
+
+    def __init__(self, threshold=0.3, min_area=50, pad=10, merge_gap=15, max_regions=None):
+        print(f'Registering {self.step_name} step')
+        self.threshold = threshold
+        self.min_area = min_area
+        self.pad = pad
+        self.merge_gap = merge_gap
+        self.max_regions = max_regions
+        self.model_id = (f'compute_difference(threshold={threshold},min_area={min_area},pad={pad},'
+                         f'merge_gap={merge_gap},max_regions={max_regions})')
+        self._last = None  # (left, right, mask) of the last image pair
+
+    def parse(self, prog_step):
+        parse_result = parse_step(prog_step.prog_str)
+        step_name = parse_result['step_name']
+        img_var = parse_result['args']['image']
+        output_var = parse_result['output_var']
+        assert step_name == self.step_name
+        return img_var, output_var
+
+    def diff_mask(self, prog_step):
+        """Binary difference mask of LEFT vs RIGHT; a precomputed state['DIFF_MASK'] takes precedence"""
+        if 'DIFF_MASK' in prog_step.state:
+            return prog_step.state['DIFF_MASK']
+
+        left = prog_step.state.get('LEFT')
+        right = prog_step.state.get('RIGHT')
+        if left is None or right is None:
+            raise ValueError("[CHANGED] Needs both LEFT and RIGHT images (or DIFF_MASK) in state")
+        if self._last is not None and self._last[0] is left and self._last[1] is right:
+            count('cache_hit')
+            return self._last[2]
+        count('cache_miss')
+
+        to_array = lambda img: np.array(load_image(prog_step.state, img))
+        with span('forward'):
+            mask = compute_difference(to_array(left), to_array(right), self.threshold)['masks'][self.threshold]
+        self._last = (left, right, mask)
+        return mask
+
+    def change_regions(self, prog_step, img_var):
+        img = prog_step.state[img_var]
+        img_size = load_image(prog_step.state, img).size
+        mask = self.diff_mask(prog_step)
+        regions = difference_regions(
+            mask, min_area=self.min_area, pad=self.pad,
+            merge_gap=self.merge_gap, max_regions=self.max_regions)
+        regions = scale_regions(regions, mask.shape[::-1], img_size)
+        for region in regions:
+            region['image'] = img_var
+        return regions
+
+    def html(self, img_var, output_var, regions):
+        step_name = html_step_name(self.step_name)
+        output_var = html_var_name(output_var)
+        image_arg = html_arg_name('image')
+        img_var = html_var_name(img_var)
+        output = html_output([region['box'] for region in regions])
+        return f"""<div>{output_var}={step_name}({image_arg}={img_var})={output}</div>"""
+
+    def execute(self, prog_step, inspect=False):
+        img_var, output_var = self.parse(prog_step)
+        if img_var not in prog_step.state:
+            raise KeyError(f"[CHANGED] Image variable '{img_var}' not found in state")
+
+        regions = self.change_regions(prog_step, img_var)
+        prog_step.state[output_var] = regions
+        if inspect:
+            html_str = functools.partial(self.html, img_var, output_var, regions)
+            return regions, html_str
+        return regions, None
+
+
+def box_iou(boxes_a, boxes_b):
+    """Pairwise IoU matrix of an (N, 4) and an (M, 4) array of x1,y1,x2,y2 boxes"""
+    a = np.asarray(boxes_a, dtype=float).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=float).reshape(-1, 4)
+    w = np.clip(np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0]), 0, None)
+    h = np.clip(np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1]), 0, None)
+    inter = w * h
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+class DiffInterpreter():
+    step_name = 'DIFF'
+    signature = ('object',)
+    var_args = ()
+    # State variables set next to the output, e.g. DIFF0_ADDED
+    side_outputs = ('_ADDED', '_REMOVED', '_MOVED', '_PERSISTING')
+
+    def __init__(self, find=None, iou_thresh=0.5, max_move=0.25, nms_thresh=0.5):
+        """
+        find: the FindInterpreter whose OwlViT model to share; a new one is loaded if None
+        iou_thresh: matched boxes overlapping at least this much are the same object in place
+        max_move: furthest an object may move, as a fraction of the image diagonal
+        """
+        print(f'Registering {self.step_name} step')
+        self.find = find if find is not None else FindInterpreter()
+        self.iou_thresh = iou_thresh
+        self.max_move = max_move
+        self.nms_thresh = nms_thresh
+        self.model_id = f'{self.find.model_id}+diff(iou_thresh={iou_thresh},max_move={max_move},nms_thresh={nms_thresh})'
+
+    def parse(self, prog_step):
+        parse_result = parse_step(prog_step.prog_str)
+        step_name = parse_result['step_name']
+        object_query = parse_result['args']['object']
+        output_var = parse_result['output_var']
+        assert step_name == self.step_name
+        return object_query, output_var
+
+    def detect(self, prog_step, object_query):
+        """Detections in LEFT and RIGHT from one batched OwlViT pass, each side NMS-filtered"""
+        for img_var in ['LEFT', 'RIGHT']:
+            if img_var not in prog_step.state:
+                raise KeyError(f"[DIFF] Image variable '{img_var}' not found in state")
+        images = [load_image(prog_step.state, prog_step.state[img_var]) for img_var in ['LEFT', 'RIGHT']]
+        sides = []
+        for img_var, detections in zip(['LEFT', 'RIGHT'], self.find.find_batch(images, object_query)):
+            boxes, _ = nms([d['box'] for d in detections], [d['score'] for d in detections], self.nms_thresh)
+            kept = {id(box) for box in boxes}
+            detections = [d for d in detections if id(d['box']) in kept]
+            for detection in detections:
+                detection['image'] = img_var
+            sides.append(detections)
+        return sides, [img.size for img in images]
+
+    def match(self, left_boxes, right_boxes, img_size):
+        """
+        Pair LEFT with RIGHT boxes, both in the same img_size frame: first by maximum
+        total IoU (pairs at or above iou_thresh persist), then the rest by minimum total
+        center distance (pairs within max_move of the diagonal moved). Returns
+        persisting and moved index pairs and the unmatched LEFT (removed) and RIGHT
+        (added) indices.
+        """
+        left = np.asarray(left_boxes, dtype=float).reshape(-1, 4)
+        right = np.asarray(right_boxes, dtype=float).reshape(-1, 4)
+        persisting, moved = [], []
+        rest_left, rest_right = np.arange(len(left)), np.arange(len(right))
+        if len(left) and len(right):
+            iou = box_iou(left, right)
+            rows, cols = linear_sum_assignment(-iou)
+            keep = iou[rows, cols] >= self.iou_thresh
+            persisting = list(zip(rows[keep].tolist(), cols[keep].tolist()))
+            rest_left = np.setdiff1d(rest_left, rows[keep])
+            rest_right = np.setdiff1d(rest_right, cols[keep])
+
+        if len(rest_left) and len(rest_right):
+            centers = lambda boxes: (boxes[:, :2] + boxes[:, 2:]) / 2
+            c_left = centers(left[rest_left])
+            c_right = centers(right[rest_right])
+            dist = np.linalg.norm(c_left[:, None] - c_right[None], axis=-1) / np.hypot(*img_size)
+            rows, cols = linear_sum_assignment(dist)
+            keep = dist[rows, cols] <= self.max_move
+            moved = list(zip(rest_left[rows[keep]].tolist(), rest_right[cols[keep]].tolist()))
+            rest_left = np.setdiff1d(rest_left, rest_left[rows[keep]])
+            rest_right = np.setdiff1d(rest_right, rest_right[cols[keep]])
+        return persisting, moved, rest_left.tolist(), rest_right.tolist()
+
+    def diff(self, prog_step, object_query):
+        """Regions by change kind; added/moved/persisting carry RIGHT boxes, removed LEFT boxes"""
+        (left, right), (left_size, right_size) = self.detect(prog_step, object_query)
+        # Compare in RIGHT's frame; regions keep the boxes of the image they were found in
+        scale = np.array([right_size[0] / left_size[0], right_size[1] / left_size[1]] * 2)
+        left_boxes = [np.asarray(d['box'], dtype=float) * scale for d in left]
+        persisting, moved, removed, added = self.match(
+            left_boxes, [d['box'] for d in right], right_size)
+        pair = lambda change, i, j: dict(right[j], change=change, left_box=left[i]['box'])
+        return dict(
+            ADDED=[dict(right[j], change='added') for j in added],
+            REMOVED=[dict(left[i], change='removed') for i in removed],
+            MOVED=[pair('moved', i, j) for i, j in moved],
+            PERSISTING=[pair('persisting', i, j) for i, j in persisting])
+
+    def html(self, object_query, output_var, changes):
+        step_name = html_step_name(self.step_name)
+        output_var = html_var_name(output_var)
+        object_arg = html_arg_name('object')
+        output = html_output({change.lower(): [region['box'] for region in regions]
+                              for change, regions in changes.items()})
+        return f"""<div>{output_var}={step_name}({object_arg}='{object_query}')={output}</div>"""
+
+    def execute(self, prog_step, inspect=False):
+        object_query, output_var = self.parse(prog_step)
+        changes = self.diff(prog_step, object_query)
+        for change, regions in changes.items():
+            prog_step.state[f'{output_var}_{change}'] = regions
+        # The step's own value is every region that differs, so EXISTS/COUNT apply directly
+        regions = changes['ADDED'] + changes['REMOVED'] + changes['MOVED']
+        prog_step.state[output_var] = regions
+        if inspect:
+            html_str = functools.partial(self.html, object_query, output_var, changes)
+            return regions, html_str
+        return regions, None
+
 
 def register_step_interpreters(dataset='nlvr'):
     if dataset=='nlvr':
+        find = FindInterpreter()
         return dict(
             VQA=VQAInterpreter(),
             EVAL=EvalInterpreter(),
             RESULT=ResultInterpreter(),
-            FIND=FindInterpreter(),
+            FIND=find,
             COUNT=CountInterpreter(),
             FILTER=FilterInterpreter(),
-            EXISTS=ExistsInterpreter()
-            
+            EXISTS=ExistsInterpreter(),
+            CHANGED=ChangeInterpreter(),
+            DIFF=DiffInterpreter(find)
         )
     elif dataset=='gqa':
         return dict(
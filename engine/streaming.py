@@ -0,0 +1,181 @@
+import json
+import queue
+import threading
+import time
+
+
+def iter_sse_content(response):
+    """Yield the text deltas of a streamed (stream=True) chat completion response"""
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith('data:'):
+            continue
+        data = line[len('data:'):].strip()
+        if data == '[DONE]':
+            break
+        chunk = json.loads(data)
+        for choice in chunk.get('choices', []):
+            content = choice.get('delta', {}).get('content')
+            if content:
+                yield content
+
+
+def iter_json_strings(chunks):
+    """
+    Incrementally parse a JSON document arriving in text chunks and yield every
+    string found inside an array as soon as its closing quote arrives.
+
+    Yields (key, value) pairs where key is the object key the array belongs to,
+    or None for a top-level array. This covers both the plain question list
+    ["q1", "q2", ...] and the follow-up map {"parent": ["q1", ...], ...}.
+    Anything outside the outermost bracket (markdown fences, prose) is ignored.
+    """
+    stack = []
+    keys = []
+    in_string = False
+    escaped = False
+    expect_key = False
+    buf = []
+
+    for chunk in chunks:
+        for ch in chunk:
+            if in_string:
+                if escaped:
+                    buf.append(ch)
+                    escaped = False
+                elif ch == '\\':
+                    buf.append(ch)
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+                    value = json.loads('"' + ''.join(buf) + '"')
+                    buf = []
+                    if stack[-1] == '{':
+                        if expect_key:
+                            keys[-1] = value
+                            expect_key = False
+                    else:
+                        yield (keys[-2] if len(keys) > 1 else None), value
+                else:
+                    buf.append(ch)
+                continue
+
+            if ch == '"' and stack:
+                in_string = True
+            elif ch in '[{':
+                stack.append(ch)
+                keys.append(None)
+                expect_key = ch == '{'
+            elif ch in ']}' and stack:
+                stack.pop()
+                keys.pop()
+                expect_key = False
+            elif ch == ',' and stack and stack[-1] == '{':
+                expect_key = True
+
+
+class StreamingPipeline:
+    """
+    Three-stage pipeline connected by bounded queues:
+
+        source items --> generate_fn (num_workers threads) --> execute_fn (caller thread)
+
+    Items are pulled from the source (e.g. questions parsed from a streamed LLM
+    response) while earlier items are still being generated or executed. The
+    queues hold at most max_pending items each, so a fast source blocks instead
+    of fanning out an unbounded number of generation requests.
+
+    execute_fn runs on the thread that iterates run(), so the interpreter and its
+    state never need to be thread-safe.
+    """
+    _DONE = object()
+
+    def __init__(self, generate_fn, execute_fn, num_workers=4, max_pending=8):
+        self.generate_fn = generate_fn
+        self.execute_fn = execute_fn
+        self.num_workers = num_workers
+        self.max_pending = max_pending
+        self.time_to_first_result = None
+
+    def _put(self, q, item, stop):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q, stop):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return self._DONE
+
+    def run(self, source):
+        """
+        Yield (item, output, error) in the order programs become ready. Exactly
+        one of output/error is None. Errors raised by the source are re-raised
+        once everything already accepted has been drained.
+        """
+        pending = queue.Queue(maxsize=self.max_pending)
+        ready = queue.Queue(maxsize=self.max_pending)
+        stop = threading.Event()
+        source_error = []
+        start = time.perf_counter()
+        self.time_to_first_result = None
+
+        def feed():
+            try:
+                for item in source:
+                    if not self._put(pending, item, stop):
+                        return
+            except Exception as e:
+                source_error.append(e)
+            finally:
+                for _ in range(self.num_workers):
+                    self._put(pending, self._DONE, stop)
+
+        def work():
+            while True:
+                item = self._get(pending, stop)
+                if item is self._DONE:
+                    self._put(ready, self._DONE, stop)
+                    return
+                try:
+                    msg = (item, self.generate_fn(item), None)
+                except Exception as e:
+                    msg = (item, None, e)
+                if not self._put(ready, msg, stop):
+                    return
+
+        threads = [threading.Thread(target=feed, daemon=True)]
+        threads += [threading.Thread(target=work, daemon=True) for _ in range(self.num_workers)]
+        for t in threads:
+            t.start()
+
+        try:
+            finished = 0
+            while finished < self.num_workers:
+                msg = ready.get()
+                if msg is self._DONE:
+                    finished += 1
+                    continue
+
+                item, generated, error = msg
+                output = None
+                if error is None:
+                    try:
+                        output = self.execute_fn(item, generated)
+                    except Exception as e:
+                        error = e
+
+                if self.time_to_first_result is None:
+                    self.time_to_first_result = time.perf_counter() - start
+                yield item, output, error
+        finally:
+            stop.set()
+
+        if source_error:
+            raise source_error[0]
@@ -0,0 +1,138 @@
+import os
+import json
+import html
+import hashlib
+import weakref
+import numpy as np
+from PIL import Image
+
+
+class TraceWriter:
+    """
+    Writes inspect traces to disk step by step instead of keeping them in memory.
+
+    out_dir/
+        index.jsonl      one JSON line per executed step
+        trace.html       the same steps as HTML, appended as they run
+        images/<sha1>.jpg, masks/<sha1>.png
+                         content-hashed sidecar files; an image that appears in
+                         many steps (e.g. LEFT) is hashed and written only once
+
+    Pass it to ProgramInterpreter.execute(..., trace_writer=writer).
+    """
+    def __init__(self, out_dir, max_image_size=512):
+        self.out_dir = out_dir
+        self.max_image_size = max_image_size
+        os.makedirs(os.path.join(out_dir, 'images'), exist_ok=True)
+        os.makedirs(os.path.join(out_dir, 'masks'), exist_ok=True)
+        self._index = open(os.path.join(out_dir, 'index.jsonl'), 'a')
+        self._html = open(os.path.join(out_dir, 'trace.html'), 'a')
+        if self._html.tell() == 0:
+            self._html.write('<html><body>\n')
+        self._refs = dict()  # id(image) -> sidecar path, dropped when the image is collected
+        self.num_programs = 0
+        self.num_steps = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if not self._index.closed:
+            self._html.write('</body></html>\n')
+            self._index.close()
+            self._html.close()
+
+    def _sidecar(self, obj, subdir, ext, save):
+        try:
+            return self._refs[id(obj)]
+        except KeyError:
+            pass
+
+        if isinstance(obj, Image.Image):
+            data = obj.mode.encode() + str(obj.size).encode() + obj.tobytes()
+        else:
+            data = str(obj.shape).encode() + np.ascontiguousarray(obj).tobytes()
+        rel_path = os.path.join(subdir, hashlib.sha1(data).hexdigest() + ext)
+        path = os.path.join(self.out_dir, rel_path)
+        if not os.path.exists(path):
+            save(path)
+
+        try:
+            weakref.finalize(obj, self._refs.pop, id(obj), None)
+            self._refs[id(obj)] = rel_path
+        except TypeError:
+            pass
+        return rel_path
+
+    def image_ref(self, img):
+        def save(path):
+            thumb = img.convert('RGB')
+            if self.max_image_size is not None:
+                thumb.thumbnail((self.max_image_size, self.max_image_size))
+            thumb.save(path, 'jpeg')
+        return self._sidecar(img, 'images', '.jpg', save)
+
+    def mask_ref(self, mask):
+        def save(path):
+            Image.fromarray((np.asarray(mask) > 0.5).astype(np.uint8) * 255).save(path)
+        return self._sidecar(mask, 'masks', '.png', save)
+
+    def serialize(self, value):
+        """JSON-friendly view of a state value with images and masks replaced by sidecar references"""
+        if isinstance(value, Image.Image):
+            return {'image': self.image_ref(value)}
+        if isinstance(value, np.ndarray):
+            if value.ndim == 2 and value.size > 64:
+                return {'mask': self.mask_ref(value)}
+            return value.tolist()
+        if isinstance(value, dict):
+            return {str(k): self.serialize(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self.serialize(v) for v in value]
+        if isinstance(value, (np.integer, np.floating, np.bool_)):
+            return value.item()
+        if value is None or isinstance(value, (str, int, float, bool)):
+            return value
+        return repr(value)
+
+    def _html_value(self, value):
+        if isinstance(value, dict) and set(value) == {'image'}:
+            return f'<img style="vertical-align:middle;max-height:150px" src="{value["image"]}">'
+        if isinstance(value, dict) and set(value) == {'mask'}:
+            return f'<img style="vertical-align:middle;max-height:150px" src="{value["mask"]}">'
+        return f'<code>{html.escape(json.dumps(value)[:500])}</code>'
+
+    def begin_program(self, prog_str, meta=None):
+        """Start a new program section and return its id"""
+        self.num_programs += 1
+        prog_id = self.num_programs
+        entry = dict(type='program', program=prog_id, prog_str=prog_str, meta=meta)
+        self._index.write(json.dumps(entry) + '\n')
+        self._html.write(f'<hr><h3>Program {prog_id}</h3><pre>{html.escape(prog_str)}</pre>\n')
+        return prog_id
+
+    def write_step(self, record, prog_id=None):
+        """Append one StepRecord to the index and the HTML report, then flush both"""
+        self.num_steps += 1
+        inputs = {arg: self.serialize(value) for arg, value in record.inputs.items()}
+        output = self.serialize(record.output)
+        entry = dict(
+            type='step',
+            program=prog_id,
+            step=record.prog_str,
+            step_name=record.step_name,
+            output_var=record.output_var,
+            inputs=inputs,
+            output=output,
+            elapsed=record.elapsed)
+        self._index.write(json.dumps(entry) + '\n')
+
+        args = ', '.join(f'{html.escape(arg)}={self._html_value(value)}' for arg, value in inputs.items())
+        self._html.write(
+            f'<div><b>{html.escape(record.output_var)}</b>={html.escape(record.step_name)}({args})'
+            f'={self._html_value(output)} <small>{record.elapsed * 1000:.1f} ms</small></div>\n')
+        self._index.flush()
+        self._html.flush()
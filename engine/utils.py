@@ -1,14 +1,26 @@
 import os
 from PIL import Image
-from openai import OpenAI
 import numpy as np
 import copy
+import math
+import time
+from types import MappingProxyType
+from collections import ChainMap
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
 
 from .step_interpreters import register_step_interpreters, parse_step
+from .analysis import compile_program
+from .lm_backends import OpenAIBackend
+from .image_store import load_image
+from .profiler import count
 
 # Set OpenAI API key
 OPENAI_API_KEY = "your API key"
 
+# Output of both sides of an execute_pair() whose subject lies outside every changed region
+NO_DIFFERENCE = 'no difference'
+
 class Program:
     def __init__(self, prog_str, init_state=None):
         self.prog_str = prog_str
@@ -16,15 +28,164 @@ class Program:
         self.instructions = self.prog_str.split('\n')
 
 
+def scoped_state(base):
+    """
+    Per-execution state layered over a shared, read-only base (images, DIFF_MASK, ...).
+    Steps read through to the base and write into a fresh overlay, so the base never
+    grows and many executions can share it concurrently; drop the result to discard
+    the intermediates.
+    """
+    return ChainMap(dict(), MappingProxyType(base))
+
+
+class LazyState(MutableMapping):
+    """
+    Program state that produces a variable the first time a step reads it. Reading (or
+    get()-ing) a variable that a not-yet-executed earlier step defines runs that step
+    first, recursively; `in` reports such variables as present without running anything.
+    Writes go to the wrapped state.
+    """
+    def __init__(self, base, compiled, run_step):
+        self.base = base
+        self.compiled = compiled
+        self.run_step = run_step
+        self.executing = [len(compiled.steps)]  # indices of the steps currently running
+        self.done = set()
+
+    def producer(self, key):
+        """Index of the last step before the running one that defines key"""
+        for i in range(self.executing[-1] - 1, -1, -1):
+            if key in self.compiled.defines[i]:
+                return i
+        return None
+
+    def run(self, i):
+        if i in self.done:
+            return
+        self.done.add(i)
+        self.executing.append(i)
+        try:
+            self.run_step(i)
+        finally:
+            self.executing.pop()
+
+    def __getitem__(self, key):
+        i = self.producer(key)
+        if i is not None:
+            self.run(i)
+        return self.base[key]
+
+    def __contains__(self, key):
+        return key in self.base or self.producer(key) is not None
+
+    def __setitem__(self, key, value):
+        self.base[key] = value
+
+    def __delitem__(self, key):
+        del self.base[key]
+
+    def __iter__(self):
+        return iter(self.base)
+
+    def __len__(self):
+        return len(self.base)
+
+
+class StepRecord:
+    """
+    Inspect-mode record of one executed step. Holds references to the step's
+    input and output values instead of rendered HTML; html() renders on demand.
+    """
+    def __init__(self, prog_str, step_name, output_var, inputs, output, render, elapsed):
+        self.prog_str = prog_str
+        self.step_name = step_name
+        self.output_var = output_var
+        self.inputs = inputs
+        self.output = output
+        self.render = render
+        self.elapsed = elapsed
+        self._html = None
+
+    def html(self):
+        if self._html is None:
+            self._html = self.render() if callable(self.render) else str(self.render)
+        return self._html
+
+
+class ExecutionTrace:
+    """
+    Step records of one inspect-mode execution. Nothing is rendered until html()
+    is called (or the trace is displayed in a notebook).
+    """
+    def __init__(self):
+        self.steps = []
+
+    def append(self, record):
+        self.steps.append(record)
+
+    def __iter__(self):
+        return iter(self.steps)
+
+    def __len__(self):
+        return len(self.steps)
+
+    def html(self):
+        return '<hr>' + ''.join(step.html() + '<hr>' for step in self.steps)
+
+    def _repr_html_(self):
+        return self.html()
+
+    def __str__(self):
+        return self.html()
+
+
 class ProgramInterpreter:
-    def __init__(self, dataset='nlvr'):
-        self.step_interpreters = register_step_interpreters(dataset)
+    def __init__(self, dataset='nlvr', verbose=True, step_interpreters=None, step_cache=None):
+        """
+        verbose: print each step name as it runs.
+        step_interpreters: step name -> interpreter dict to use instead of
+            register_step_interpreters(dataset), e.g. benchmarks.fake_backends.
+        step_cache: optional engine.step_cache.StepCache; equivalent model steps across
+            all programs this interpreter runs are then computed once. An
+            engine.result_cache.PersistentStepCache keeps them across runs instead.
+
+        Hooks are plain callables, e.g. engine.profiler.Profiler().attach(interpreter):
+            pre_program_hooks: hook(prog)
+            post_program_hooks: hook(prog, output)
+            pre_step_hooks: hook(prog_step, step_name)
+            post_step_hooks: hook(prog_step, step_name, output), output is None if the step raised
+        """
+        if step_interpreters is None:
+            step_interpreters = register_step_interpreters(dataset)
+        self.step_interpreters = step_interpreters
+        self.verbose = verbose
+        self.step_cache = step_cache
+        self.pre_program_hooks = []
+        self.post_program_hooks = []
+        self.pre_step_hooks = []
+        self.post_step_hooks = []
 
     def execute_step(self, prog_step, inspect):
         step_name = parse_step(prog_step.prog_str, partial=True)['step_name']
-        print(step_name)
-        result = self.step_interpreters[step_name].execute(prog_step, inspect)
-        
+        if self.verbose:
+            print(step_name)
+        for hook in self.pre_step_hooks:
+            hook(prog_step, step_name)
+        result = None
+        try:
+            interpreter = self.step_interpreters[step_name]
+            run = lambda: interpreter.execute(prog_step, inspect)
+            if self.step_cache is not None and step_name in self.step_cache.steps:
+                result = self.step_cache.execute(
+                    parse_step(prog_step.prog_str), prog_step.state, run, interpreter=interpreter,
+                    inspect=inspect)
+            else:
+                result = run()
+        finally:
+            output = result[0] if isinstance(result, tuple) else result
+            for hook in self.post_step_hooks:
+                hook(prog_step, step_name, output)
+
         if inspect:
             if not isinstance(result, tuple) or len(result) != 2:
                 raise ValueError(f"[execute_step] Expected (output, html_str) from '{step_name}', got: {result}")
@@ -32,43 +193,311 @@ class ProgramInterpreter:
         else:
             return result if not isinstance(result, tuple) else result[0]
 
-    def execute(self, prog, init_state, inspect=False):
+    def record_step(self, prog_step, inspect):
+        """Execute a step in inspect mode and return its StepRecord (rendering is deferred)"""
+        parse_result = parse_step(prog_step.prog_str)
+        inputs = {arg: prog_step.state[value] for arg, value in parse_result['args'].items()
+                  if isinstance(value, str) and value in prog_step.state}
+        start = time.perf_counter()
+        step_output, render = self.execute_step(prog_step, inspect)
+        return StepRecord(
+            prog_step.prog_str, parse_result['step_name'], parse_result['output_var'],
+            inputs, step_output, render, time.perf_counter() - start)
+
+    def provenance_step(self, prog_step, record, provenance, var_fps):
+        """
+        Execute a step unless provenance holds a value for its fingerprint, in which case
+        that value (and its side outputs) is restored into state instead. Returns the
+        step output, or its StepRecord when record is set.
+        """
+        parse_result = parse_step(prog_step.prog_str)
+        output_var = parse_result['output_var']
+        fingerprint = provenance.fingerprint(parse_result, prog_step.state, var_fps)
+        entry = provenance.get(fingerprint)
+        reused = entry is not None and not (record and entry[2] is None)  # inspect needs a render
+        if reused:
+            output, side_outputs, render = entry
+            prog_step.state[output_var] = output
+            for suffix, value in side_outputs.items():
+                prog_step.state[output_var + suffix] = value
+            result = StepRecord(prog_step.prog_str, parse_result['step_name'], output_var,
+                                dict(), output, render, 0.0) if record else output
+        else:
+            before = {name: id(value) for name, value in prog_step.state.items()
+                      if name.startswith(output_var + '_')}
+            if record:
+                result = self.record_step(prog_step, True)
+                output, render = result.output, result.render
+            else:
+                result = output = self.execute_step(prog_step, False)
+                render = None
+            side_outputs = {name[len(output_var):]: value for name, value in prog_step.state.items()
+                            if name.startswith(output_var + '_') and before.get(name) != id(value)}
+            provenance.put(fingerprint, output, side_outputs, render)
+
+        var_fps[output_var] = fingerprint
+        for suffix in side_outputs:
+            var_fps[output_var + suffix] = fingerprint + suffix
+        provenance.last_run.append((prog_step.prog_str, fingerprint, reused))
+        return result
+
+    def execute(self, prog, init_state, inspect=False, trace_writer=None, scoped=False,
+                keep_intermediates=True, provenance=None):
+        """
+        Execute a program step by step. Returns (final output, state), plus the
+        ExecutionTrace when inspect=True.
+
+        trace_writer: optional TraceWriter that receives each step record as soon as it
+        runs. Without inspect=True the records are not kept in memory.
+        scoped: execute on scoped_state(init_state) instead of writing the program's
+        variables into init_state; the returned state is the scoped one.
+        keep_intermediates: keep every variable in state until the end (the default).
+        With False each variable is dropped right after its last use, leaving only the
+        initial state and the final step's output; use it when the state is discarded
+        anyway and intermediate images or masks are large.
+        provenance: optional engine.provenance.Provenance shared by the versions of a
+        program; steps whose fingerprint matches an earlier execution are not run again.
+        """
+        steps = self.iter_execute(prog, init_state, inspect, trace_writer, scoped, keep_intermediates, provenance)
+        while True:
+            try:
+                next(steps)
+            except StopIteration as done:
+                return done.value
 
+    def iter_execute(self, prog, init_state, inspect=False, trace_writer=None, scoped=False,
+                     keep_intermediates=True, provenance=None):
+        """
+        Generator version of execute(), with the same arguments: yields
+        (prog_step, step_output, trace) after every step and returns what execute()
+        returns. Closing it early stops the program after the current step.
+        """
+        if scoped:
+            init_state = scoped_state(init_state)
         if isinstance(prog, str):
             prog = Program(prog, init_state)
         else:
             assert isinstance(prog, Program)
 
         prog_steps = [Program(instruction, init_state=prog.state) for instruction in prog.instructions]
+        if not keep_intermediates:
+            dead_after = compile_program(prog.prog_str).dead_after
+            init_vars = set(prog.state)
+        if trace_writer is not None:
+            prog_id = trace_writer.begin_program(prog.prog_str)
+        if provenance is not None:
+            provenance.last_run = []
+            var_fps = dict()
+
+        for hook in self.pre_program_hooks:
+            hook(prog)
+
+        trace = ExecutionTrace()
+        step_output = None
+        try:
+            for i, prog_step in enumerate(prog_steps):
+                if inspect or trace_writer is not None:
+                    if provenance is not None:
+                        record = self.provenance_step(prog_step, True, provenance, var_fps)
+                    else:
+                        record = self.record_step(prog_step, True)
+                    if trace_writer is not None:
+                        trace_writer.write_step(record, prog_id)
+                    if inspect:
+                        trace.append(record)
+                    step_output = record.output
+                elif provenance is not None:
+                    step_output = self.provenance_step(prog_step, False, provenance, var_fps)
+                else:
+                    step_output = self.execute_step(prog_step, inspect)
+
+                if not keep_intermediates:
+                    for var in dead_after[i]:
+                        if var not in init_vars:
+                            prog.state.pop(var, None)
+                yield prog_step, step_output, trace
+        finally:
+            for hook in self.post_program_hooks:
+                hook(prog, step_output)
+
+        if inspect:
+            return step_output, prog.state, trace
+        return step_output, prog.state
+
+    def execute_lazy(self, prog, init_state, inspect=False, scoped=False):
+        """
+        Demand-driven execute(): only the final step is requested, and every other step
+        runs the first time a later step reads its output. EVAL reads its operands lazily
+        and short-circuits and/or, so e.g. the VQA behind the second operand of a false
+        conjunction never runs, and steps RESULT cannot reach are never executed.
+        Returns the same values as execute().
+        """
+        if scoped:
+            init_state = scoped_state(init_state)
+        prog_str = prog.prog_str if isinstance(prog, Program) else prog
+        compiled = compile_program(prog_str)
+        instructions = prog_str.split('\n')
+        trace = ExecutionTrace()
+        outputs = dict()
 
-        html_str = '<hr>'
-        for prog_step in prog_steps:
+        def run_step(i):
+            prog_step = Program(instructions[i], init_state=state)
             if inspect:
-                step_output, step_html = self.execute_step(prog_step, inspect)
-                html_str += step_html + '<hr>'
+                record = self.record_step(prog_step, True)
+                trace.append(record)
+                outputs[i] = record.output
             else:
-                step_output = self.execute_step(prog_step, inspect)
+                outputs[i] = self.execute_step(prog_step, inspect)
+
+        state = LazyState(init_state, compiled, run_step)
+        prog = Program(prog_str, state)
+        for hook in self.pre_program_hooks:
+            hook(prog)
+
+        step_output = None
+        try:
+            state.run(len(instructions) - 1)
+            step_output = outputs[len(instructions) - 1]
+        finally:
+            for hook in self.post_program_hooks:
+                hook(prog, step_output)
+        if self.verbose:
+            print(f'Lazy evaluation ran {len(state.done)} of {len(instructions)} steps')
 
         if inspect:
-            return step_output, prog.state, html_str
-        return step_output, prog.state
+            return step_output, init_state, trace
+        return step_output, init_state
+
+    def execute_many(self, progs, init_state, inspect=False, num_workers=4, return_exceptions=False):
+        """
+        Execute several programs on the same shared init_state in parallel threads, each on
+        its own scoped state. Returns the execute() results in the order of progs; with
+        return_exceptions=True a failing program yields its exception instead of raising.
+        """
+        def run(prog):
+            try:
+                return self.execute(prog, init_state, inspect=inspect, scoped=True)
+            except Exception as e:
+                if return_exceptions:
+                    return e
+                raise
+
+        if num_workers <= 1 or len(progs) <= 1:
+            return [run(prog) for prog in progs]
+        with ThreadPoolExecutor(max_workers=min(num_workers, len(progs))) as pool:
+            return list(pool.map(run, progs))
+
+    def execute_pair(self, prog_left, prog_right, init_state, inspect=False, gate=True):
+        """
+        Execute the LEFT and RIGHT versions of a question's program in lockstep, one step
+        of each side at a time in parallel, each on its own scoped state. Returns the two
+        execute() results.
+
+        With gate=True, as soon as both sides have run their first FIND step the boxes are
+        checked against the difference mask: if both sides found the same number of boxes
+        and none of them touches a changed pixel, the rest of both programs (the VQA and
+        FILTER calls on unchanged regions) is skipped and both outputs are NO_DIFFERENCE.
+        """
+        runs = [self.iter_execute(prog, init_state, inspect=inspect, scoped=True)
+                for prog in (prog_left, prog_right)]
+        results = [None, None]
+        finds = [None, None]  # (state, regions) of each side's first FIND
+        latest = [None, None]  # (state, trace) after each side's latest step
+
+        def advance(side):
+            try:
+                prog_step, step_output, trace = next(runs[side])
+            except StopIteration as done:
+                results[side] = done.value
+                return
+            latest[side] = (prog_step.state, trace)
+            if finds[side] is None and parse_step(prog_step.prog_str, partial=True)['step_name'] == 'FIND':
+                finds[side] = (prog_step.state, step_output)
+
+        # one single-worker pool per side, so each program runs (and is closed) on one
+        # thread throughout; per-thread program hooks such as the Profiler rely on it
+        pools = [ThreadPoolExecutor(max_workers=1) for _ in (0, 1)]
+        try:
+            while results[0] is None or results[1] is None:
+                futures = [pools[side].submit(advance, side) for side in (0, 1) if results[side] is None]
+                for future in futures:
+                    future.result()
+                if gate and finds[0] is not None and finds[1] is not None:
+                    gate = False
+                    if not self.finds_touch_changes(finds):
+                        break
+
+            if results[0] is None or results[1] is None:
+                count('pair_gated')
+                if self.verbose:
+                    print('No FIND box touches the difference mask; skipping the rest of both programs')
+                for side in (0, 1):
+                    pools[side].submit(runs[side].close).result()
+                    state, trace = latest[side]
+                    results[side] = (NO_DIFFERENCE, state, trace) if inspect else (NO_DIFFERENCE, state)
+        finally:
+            for pool in pools:
+                pool.shutdown()
+        return results[0], results[1]
+
+    def diff_mask(self, state):
+        """state['DIFF_MASK'], else the CHANGED step's LEFT/RIGHT difference mask, else None"""
+        if 'DIFF_MASK' in state:
+            return np.asarray(state['DIFF_MASK'])
+        changed = self.step_interpreters.get('CHANGED')
+        if changed is None:
+            return None
+        try:
+            return np.asarray(changed.diff_mask(Program('', state)))
+        except ValueError:
+            return None
+
+    def finds_touch_changes(self, finds):
+        """Whether the FIND results of the two sides may differ given the difference mask"""
+        (_, regions_left), (_, regions_right) = finds
+        if not isinstance(regions_left, list) or not isinstance(regions_right, list):
+            return True
+        if len(regions_left) != len(regions_right):
+            return True
+        mask = self.diff_mask(finds[0][0])
+        if mask is None:
+            return True
+        h, w = mask.shape[:2]
+        for state, regions in finds:
+            for region in regions:
+                source = state.get(region.get('image', 'LEFT'))
+                if source is None:
+                    return True  # the image the boxes refer to is gone; assume they may differ
+                W, H = load_image(state, source).size
+                x1, y1, x2, y2 = region['box']
+                rows = slice(int(y1 * h / H), max(int(y1 * h / H) + 1, math.ceil(y2 * h / H)))
+                cols = slice(int(x1 * w / W), max(int(x1 * w / W) + 1, math.ceil(x2 * w / W)))
+                if mask[rows, cols].any():
+                    return True
+        return False
 
 
 class ProgramGenerator():
-    def __init__(self, prompter):
+    def __init__(self, prompter, backend=None):
+        """
+        prompter: inputs -> prompt, e.g. partial(prompts.nlvr.create_prompt, method='all')
+        backend: anything with complete(prompts) -> programs, e.g. an
+            engine.lm_backends.LocalLMBackend; defaults to OpenAI gpt-3.5-turbo.
+        """
         self.prompter = prompter
-        self.client = OpenAI(
-            api_key=OPENAI_API_KEY,
-            project="proj_1mWjP874mS8VC8zmtH4ri4KV"
-        )
+        if backend is None:
+            backend = OpenAIBackend(
+                api_key=OPENAI_API_KEY,
+                project="proj_1mWjP874mS8VC8zmtH4ri4KV"
+            )
+        self.backend = backend
 
     def generate(self, inputs):
         prompt = self.prompter(inputs)
-        response = self.client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0,
-            max_tokens=1024
-        )
-        prog = response.choices[0].message.content.strip()
+        prog = self.backend.complete([prompt])[0]
         return prog, prompt
+
+    def generate_many(self, inputs_list):
+        """generate() for many inputs at once; local backends batch them"""
+        prompts = [self.prompter(inputs) for inputs in inputs_list]
+        return list(zip(self.backend.complete(prompts), prompts))
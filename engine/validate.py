@@ -0,0 +1,202 @@
+import ast
+
+from .expr import compile_expression
+from .step_interpreters import parse_step
+
+# Initial-state variables programs may read without defining them
+DEFAULT_INIT_VARS = ('LEFT', 'RIGHT', 'IMAGE', 'DIFF_MASK')
+
+
+class ProgramValidationError(ValueError):
+    def __init__(self, prog_str, errors):
+        self.prog_str = prog_str
+        self.errors = errors
+        super().__init__('Invalid program:\n' + '\n'.join(errors))
+
+
+class ValidationResult:
+    """The (possibly repaired) program, the errors left in it and the repairs applied"""
+    def __init__(self, prog_str, errors, repairs):
+        self.prog_str = prog_str
+        self.errors = errors
+        self.repairs = repairs
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def __repr__(self):
+        return f'ValidationResult(ok={self.ok}, errors={self.errors}, repairs={self.repairs})'
+
+
+def _arg_source(node):
+    """Source for a repaired argument: names stay names, everything else a literal"""
+    if isinstance(node, ast.Name):
+        return node.id
+    return ast.unparse(node)
+
+
+def _eval_expression(node, defined):
+    """EVAL expression text for a Python expression over program variables"""
+    class Wrap(ast.NodeTransformer):
+        def visit_Name(self, name):
+            if name.id in defined:
+                return ast.Set(elts=[name])
+            return name
+    return ast.unparse(Wrap().visit(node))
+
+
+def _eval_line(output_var, expr):
+    """
+    An EVAL line whose expr arg parse_step reads back as exactly expr, or None. The
+    plain double-quoted form the prompts use breaks on quotes inside the expression.
+    """
+    for quoted in (f'"{expr}"', repr(expr), f"'''{expr}'''"):
+        line = f'{output_var}=EVAL(expr={quoted})'
+        try:
+            if parse_step(line)['args'].get('expr') == expr:
+                return line
+        except (ValueError, SyntaxError):
+            continue
+    return None
+
+
+class ProgramValidator:
+    """
+    Checks a whole generated program against the registered step interpreters before
+    anything runs: every line must be `VAR=STEP(arg=value, ...)` for a registered STEP,
+    pass exactly the args in the interpreter's `signature`, and only read variables
+    that the initial state or an earlier line defines (var_args, and the {VAR}s of an
+    EVAL expression). A step also defines its interpreter's side_outputs (e.g. DIFF0_ADDED).
+    Interpreters without a signature only get the variable checks.
+
+    With repair=True cheap fixes are applied first: blank, comment and markdown fence
+    lines are dropped, step names are upper-cased, positional args are named in
+    signature order, and a plain expression line such as
+    `is_yellow = (fruit_color == "yellow")` becomes an EVAL step. Unknown args are
+    always errors: dropping one (e.g. color= on EXISTS) would change the question.
+    Every line must also read back through parse_step, which is what runs it.
+    """
+    def __init__(self, step_interpreters, init_vars=DEFAULT_INIT_VARS, repair=True):
+        self.step_interpreters = step_interpreters
+        self.init_vars = set(init_vars)
+        self.repair = repair
+
+    def validate(self, prog_str, init_vars=None):
+        defined = set(self.init_vars if init_vars is None else init_vars)
+        errors, repairs, lines = [], [], []
+        for lineno, line in enumerate(prog_str.split('\n'), 1):
+            stripped = line.strip()
+            if not stripped or stripped.startswith('#') or stripped.startswith('```'):
+                if self.repair:
+                    repairs.append(f'line {lineno}: dropped {stripped!r}' if stripped else f'line {lineno}: dropped blank line')
+                    continue
+                errors.append(f'line {lineno}: not a step: {stripped!r}')
+                lines.append(line)
+                continue
+            line, line_errors, line_repairs = self.validate_line(stripped, defined)
+            errors += [f'line {lineno}: {e}' for e in line_errors]
+            repairs += [f'line {lineno}: {r}' for r in line_repairs]
+            lines.append(line)
+        if not lines:
+            errors.append('empty program')
+        return ValidationResult('\n'.join(lines), errors, repairs)
+
+    def validate_line(self, line, defined):
+        """(line, errors, repairs) for one step; defines its output in defined if it parses"""
+        try:
+            tree = ast.parse(line, mode='exec')
+        except SyntaxError as e:
+            return line, [f'syntax error: {e.msg}: {line!r}'], []
+        if len(tree.body) != 1 or not isinstance(tree.body[0], ast.Assign) \
+                or len(tree.body[0].targets) != 1 or not isinstance(tree.body[0].targets[0], ast.Name):
+            return line, [f'expected VAR=STEP(...): {line!r}'], []
+
+        assign = tree.body[0]
+        output_var = assign.targets[0].id
+        value = assign.value
+        errors, repairs = [], []
+
+        if not (isinstance(value, ast.Call) and isinstance(value.func, ast.Name)):
+            # A plain expression over program variables is what EVAL is for
+            if self.repair and 'EVAL' in self.step_interpreters:
+                expr = _eval_expression(value, defined)
+                new_line = _eval_line(output_var, expr)
+                if new_line is None:
+                    errors.append(f'cannot write {expr!r} as an EVAL step: {line!r}')
+                else:
+                    repairs.append(f'rewrote {line!r} as {new_line!r}')
+                    line, errors = new_line, self.check_eval(expr, defined)
+            else:
+                errors.append(f'expected VAR=STEP(...): {line!r}')
+            defined.add(output_var)
+            return line, errors, repairs
+
+        step_name = value.func.id
+        if step_name not in self.step_interpreters and self.repair \
+                and step_name.upper() in self.step_interpreters:
+            repairs.append(f'renamed step {step_name} to {step_name.upper()}')
+            step_name = step_name.upper()
+        interpreter = self.step_interpreters.get(step_name)
+        if interpreter is None:
+            defined.add(output_var)
+            return line, [f'unknown step {step_name}'], []
+
+        signature = getattr(interpreter, 'signature', None)
+        kwargs = [(kw.arg, kw.value) for kw in value.keywords]
+        if value.args:
+            if self.repair and signature is not None and len(value.args) <= len(signature):
+                named = [arg for arg in signature if arg not in dict(kwargs)]
+                kwargs = list(zip(named, value.args)) + kwargs
+                repairs.append(f'named positional args of {step_name}')
+            else:
+                errors.append(f'{step_name} takes keyword args only')
+        if signature is not None:
+            unknown = [arg for arg, _ in kwargs if arg not in signature]
+            if unknown:
+                errors.append(f'unknown args {unknown} for {step_name}{signature}')
+            given = [arg for arg, _ in kwargs]
+            missing = [arg for arg in signature if arg not in given]
+            if missing:
+                errors.append(f'{step_name} is missing args {missing}')
+
+        for arg, node in kwargs:
+            if arg in getattr(interpreter, 'var_args', ()) and isinstance(node, ast.Name) \
+                    and node.id not in defined:
+                errors.append(f'{step_name} reads undefined variable {node.id} ({arg}=...)')
+            if step_name == 'EVAL' and arg == 'expr' and isinstance(node, ast.Constant):
+                errors += self.check_eval(node.value, defined)
+
+        if repairs:
+            args = ','.join(f'{arg}={_arg_source(node)}' for arg, node in kwargs)
+            line = f'{output_var}={step_name}({args})'
+        try:
+            parse_step(line)
+        except Exception as e:
+            errors.append(f'unreadable step: {str(e).splitlines()[0]}: {line!r}')
+        defined.add(output_var)
+        defined.update(output_var + suffix for suffix in getattr(interpreter, 'side_outputs', ()))
+        return line, errors, repairs
+
+    def check_eval(self, expr, defined):
+        try:
+            names = compile_expression(expr).names
+        except ValueError as e:
+            return [str(e)]
+        return [f'EVAL reads undefined variable {name}' for name in names if name not in defined]
+
+    def check(self, prog_str, init_vars=None, regenerate=None, max_attempts=2):
+        """
+        Validated (and repaired) program text, or ProgramValidationError. When the
+        program stays invalid and regenerate is given, regenerate(prog_str, errors)
+        is asked for a new program, up to max_attempts times.
+        """
+        result = self.validate(prog_str, init_vars)
+        for _ in range(max_attempts if regenerate is not None else 0):
+            if result.ok:
+                break
+            prog_str = regenerate(prog_str, result.errors)
+            result = self.validate(prog_str, init_vars)
+        if not result.ok:
+            raise ProgramValidationError(prog_str, result.errors)
+        return result.prog_str
@@ -1,13 +1,19 @@
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
 
-def preprocess_image(img):
+def preprocess_image(img, value_range=None):
     """
     Preprocess image with noise reduction and enhancement
+    value_range: (min, max) of the whole image when img is only a tile of it
     """
     # Convert to float32 and normalize to 0-1
-    img_norm = cv2.normalize(img.astype(np.float32), None, 0, 1, cv2.NORM_MINMAX)
+    if value_range is None:
+        img_norm = cv2.normalize(img.astype(np.float32), None, 0, 1, cv2.NORM_MINMAX)
+    else:
+        # Same arithmetic as cv2.NORM_MINMAX, with the min/max of the full image
+        lo, hi = float(value_range[0]), float(value_range[1])
+        scale = 1.0 / (hi - lo) if hi - lo > np.finfo(np.float64).eps else 0.0
+        img_norm = img.astype(np.float32) * np.float32(scale) + np.float32(-lo * scale)
     
     # Apply slight Gaussian blur to reduce noise
     img_blur = cv2.GaussianBlur(img_norm, (3, 3), 0.5)
@@ -34,15 +40,10 @@ def align_and_resize_images(img1, img2):
     
     return img1_resized, img2_resized
 
-def generate_difference_heatmap(image_path1, image_path2, threshold=0.3):
+def load_image_pair(image_path1, image_path2):
     """
-    Generate a heatmap showing differences between two images
-    Args:
-        image_path1: Path to first image
-        image_path2: Path to second image
-        threshold: Minimum difference threshold (0-1 range, default 0.3)
+    Read two images from disk as RGB uint8 arrays
     """
-    # Read the images
     img1 = cv2.imread(image_path1)
     img2 = cv2.imread(image_path2)
     
@@ -52,13 +53,23 @@ def generate_difference_heatmap(image_path1, image_path2, threshold=0.3):
     # Convert to RGB (from BGR)
     img1 = cv2.cvtColor(img1, cv2.COLOR_BGR2RGB)
     img2 = cv2.cvtColor(img2, cv2.COLOR_BGR2RGB)
-    
+    return img1, img2
+
+def compute_difference_map(img1, img2, value_ranges=(None, None)):
+    """
+    Combined colour/structure difference of two RGB images, smoothed but not thresholded.
+    Returns (diff_map, img1_aligned, img2_aligned); diff_map is float32 in the 0-1 range.
+    value_ranges: per-image (min, max) when img1/img2 are already aligned tiles of larger images
+    """
     # Align and resize images
-    img1_aligned, img2_aligned = align_and_resize_images(img1, img2)
+    if img1.shape[:2] == img2.shape[:2]:
+        img1_aligned, img2_aligned = img1, img2
+    else:
+        img1_aligned, img2_aligned = align_and_resize_images(img1, img2)
     
     # Preprocess images
-    img1_processed, img1_gray = preprocess_image(img1_aligned)
-    img2_processed, img2_gray = preprocess_image(img2_aligned)
+    img1_processed, img1_gray = preprocess_image(img1_aligned, value_ranges[0])
+    img2_processed, img2_gray = preprocess_image(img2_aligned, value_ranges[1])
     
     # Calculate color difference
     color_diff = np.abs(img1_processed - img2_processed)
@@ -70,16 +81,80 @@ def generate_difference_heatmap(image_path1, image_path2, threshold=0.3):
     # Combine differences with weights
     combined_diff = 0.7 * color_diff_mean + 0.3 * struct_diff
     
-    # Apply threshold with slight smoothing to reduce noise
+    # Slight smoothing to reduce noise
     diff_smooth = cv2.GaussianBlur(combined_diff, (3, 3), 0)
+    return diff_smooth.astype(np.float32, copy=False), img1_aligned, img2_aligned
+
+def difference_heatmap(diff_map, threshold=0.3, gamma=0.7):
+    """
+    Threshold, gamma-enhance and normalize a difference map to the 0-1 range
+    """
+    diff_smooth = diff_map.copy()
     diff_smooth[diff_smooth < threshold] = 0
     
     # Enhance differences using gamma correction
-    gamma = 0.7  # Increased gamma to reduce sensitivity to small differences
-    diff_enhanced = np.power(diff_smooth, gamma)
+    diff_enhanced = np.power(diff_smooth, np.float32(gamma))
     
     # Normalize the difference to 0-1 range
-    diff_normalized = cv2.normalize(diff_enhanced, None, 0, 1, cv2.NORM_MINMAX)
+    return cv2.normalize(diff_enhanced, None, 0, 1, cv2.NORM_MINMAX)
+
+def binary_difference_mask(diff_map, threshold=0.3):
+    """
+    Boolean mask of the pixels that survive the threshold. Equivalent to
+    difference_heatmap(diff_map, threshold) > 0 without the gamma/normalize passes.
+    """
+    return (diff_map >= threshold) & (diff_map > 0)
+
+def compute_difference(image1, image2, thresholds=(0.3,)):
+    """
+    In-memory difference computation. image1/image2 are file paths or RGB arrays.
+    Computes the difference map once and one binary mask per threshold.
+    Returns dict(diff_map, masks={threshold: bool mask}, image1, image2) with the aligned images.
+    """
+    if isinstance(image1, str) and isinstance(image2, str):
+        image1, image2 = load_image_pair(image1, image2)
+    if np.isscalar(thresholds):
+        thresholds = (thresholds,)
+
+    diff_map, img1_aligned, img2_aligned = compute_difference_map(image1, image2)
+    masks = {threshold: binary_difference_mask(diff_map, threshold) for threshold in thresholds}
+    return dict(diff_map=diff_map, masks=masks, image1=img1_aligned, image2=img2_aligned)
+
+def highlight_differences(img, mask, color=(255, 0, 0)):
+    """
+    Copy of an RGB image with the masked pixels painted in color (red by default)
+    """
+    highlighted = img.copy()
+    highlighted[mask] = color
+    return highlighted
+
+def encode_png(img):
+    """
+    PNG bytes for a bool/float 0-1 mask, a uint8 grayscale image or an RGB image
+    """
+    if img.dtype == bool:
+        img = img.astype(np.uint8) * 255
+    elif img.dtype != np.uint8:
+        img = (np.clip(img, 0, 1) * 255).astype(np.uint8)
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+    ok, buf = cv2.imencode('.png', img)
+    if not ok:
+        raise ValueError("Could not encode image as PNG")
+    return buf.tobytes()
+
+def generate_difference_heatmap(image_path1, image_path2, threshold=0.3):
+    """
+    Generate a heatmap showing differences between two images
+    Args:
+        image_path1: Path to first image
+        image_path2: Path to second image
+        threshold: Minimum difference threshold (0-1 range, default 0.3)
+    """
+    import matplotlib.pyplot as plt
+
+    diff_map, img1_aligned, img2_aligned = compute_difference_map(*load_image_pair(image_path1, image_path2))
+    diff_normalized = difference_heatmap(diff_map, threshold)
     
     # Create figure with subplots
     plt.figure(figsize=(20, 5))
@@ -114,9 +189,7 @@ def generate_difference_heatmap(image_path1, image_path2, threshold=0.3):
     plt.close()
     
     # Save additional visualization showing only significant differences
-    diff2 = img2_aligned.copy()
-    mask = diff_normalized > 0
-    diff2[mask] = [255, 0, 0]  # Highlight differences in red
+    diff2 = highlight_differences(img2_aligned, diff_normalized > 0)
     plt.figure(figsize=(10, 5))
     plt.imshow(diff2)
     plt.axis('off')
@@ -126,24 +199,474 @@ def generate_difference_heatmap(image_path1, image_path2, threshold=0.3):
     
     return output_path
 
+def _merge_overlapping(boxes, areas):
+    """
+    Repeatedly merge boxes that overlap until none do. Boxes are [x1,y1,x2,y2] lists.
+    """
+    merged = True
+    while merged:
+        merged = False
+        out_boxes, out_areas = [], []
+        for box, area in zip(boxes, areas):
+            for i, other in enumerate(out_boxes):
+                if box[0] <= other[2] and other[0] <= box[2] and box[1] <= other[3] and other[1] <= box[3]:
+                    out_boxes[i] = [min(box[0], other[0]), min(box[1], other[1]),
+                                    max(box[2], other[2]), max(box[3], other[3])]
+                    out_areas[i] += area
+                    merged = True
+                    break
+            else:
+                out_boxes.append(box)
+                out_areas.append(area)
+        boxes, areas = out_boxes, out_areas
+    return boxes, areas
+
+def difference_regions(mask, min_area=50, pad=10, merge_gap=15, max_regions=None):
+    """
+    Change-region proposals from a binary difference mask.
+    Connected components closer than merge_gap pixels are grouped, groups with fewer
+    than min_area changed pixels are dropped, and the remaining boxes are padded by
+    pad pixels and merged where they overlap.
+    Returns a Regions list (like FIND outputs), largest change first:
+        [dict(box=[x1,y1,x2,y2], category='change', area=num_changed_pixels), ...]
+    """
+    mask = mask.astype(bool, copy=False)
+    h, w = mask.shape
+    ys, xs = np.nonzero(mask)
+    if len(xs) == 0:
+        return []
+
+    mask_u8 = mask.astype(np.uint8)
+    if merge_gap > 0:
+        kernel = np.ones((2 * merge_gap + 1, 2 * merge_gap + 1), np.uint8)
+        mask_u8 = cv2.dilate(mask_u8, kernel)
+    n, labels = cv2.connectedComponents(mask_u8, connectivity=8)
+
+    # Boxes and areas of the original (undilated) pixels of each group
+    lab = labels[ys, xs]
+    areas = np.bincount(lab, minlength=n)
+    x1 = np.full(n, w, dtype=np.int64)
+    y1 = np.full(n, h, dtype=np.int64)
+    x2 = np.zeros(n, dtype=np.int64)
+    y2 = np.zeros(n, dtype=np.int64)
+    np.minimum.at(x1, lab, xs)
+    np.minimum.at(y1, lab, ys)
+    np.maximum.at(x2, lab, xs)
+    np.maximum.at(y2, lab, ys)
+
+    boxes, box_areas = [], []
+    for i in range(1, n):
+        if areas[i] < min_area:
+            continue
+        boxes.append([max(0, int(x1[i]) - pad), max(0, int(y1[i]) - pad),
+                      min(w - 1, int(x2[i]) + pad), min(h - 1, int(y2[i]) + pad)])
+        box_areas.append(int(areas[i]))
+
+    boxes, box_areas = _merge_overlapping(boxes, box_areas)
+    regions = [dict(box=box, category='change', area=area) for box, area in zip(boxes, box_areas)]
+    regions = sorted(regions, key=lambda r: r['area'], reverse=True)
+    if max_regions is not None:
+        regions = regions[:max_regions]
+    return regions
+
+def scale_regions(regions, from_size, to_size):
+    """
+    Rescale region boxes from one (width, height) image size to another
+    """
+    sx = to_size[0] / from_size[0]
+    sy = to_size[1] / from_size[1]
+    scaled = []
+    for region in regions:
+        x1, y1, x2, y2 = region['box']
+        region = dict(region)
+        region['box'] = [int(x1 * sx), int(y1 * sy),
+                         min(to_size[0] - 1, int(np.ceil(x2 * sx))),
+                         min(to_size[1] - 1, int(np.ceil(y2 * sy)))]
+        scaled.append(region)
+    return scaled
+
+def iter_tiles(height, width, tile_size):
+    """
+    Yield (y0, y1, x0, x1) bounds of the tile_size x tile_size grid covering an image
+    """
+    for y0 in range(0, height, tile_size):
+        for x0 in range(0, width, tile_size):
+            yield y0, min(y0 + tile_size, height), x0, min(x0 + tile_size, width)
+
+def tile_difference_map(img1, img2, bounds, value_ranges, overlap=16):
+    """
+    Difference map of one tile of two aligned images. The tile is read with overlap
+    pixels of context on each side so the blurs match the full-image computation.
+    """
+    y0, y1, x0, x1 = bounds
+    h, w = img1.shape[:2]
+    ty0, ty1 = max(0, y0 - overlap), min(h, y1 + overlap)
+    tx0, tx1 = max(0, x0 - overlap), min(w, x1 + overlap)
+    diff, _, _ = compute_difference_map(
+        np.asarray(img1[ty0:ty1, tx0:tx1]), np.asarray(img2[ty0:ty1, tx0:tx1]), value_ranges)
+    return diff[y0 - ty0:y1 - ty0, x0 - tx0:x1 - tx0]
+
+def compute_difference_mask_tiled(img1, img2, threshold=0.3, tile_size=1024, overlap=16, out=None):
+    """
+    Binary difference mask of two aligned images of the same size, computed tile by tile so
+    only one tile of float intermediates is alive at a time. img1/img2 may be np.memmap arrays;
+    out may be a preallocated (e.g. memory-mapped) bool array to write the mask into.
+    """
+    if img1.shape != img2.shape:
+        raise ValueError("Tiled difference needs aligned images of the same size")
+    h, w = img1.shape[:2]
+    if out is None:
+        out = np.zeros((h, w), dtype=bool)
+    value_ranges = ((img1.min(), img1.max()), (img2.min(), img2.max()))
+
+    for bounds in iter_tiles(h, w, tile_size):
+        y0, y1, x0, x1 = bounds
+        diff = tile_difference_map(img1, img2, bounds, value_ranges, overlap)
+        out[y0:y1, x0:x1] = binary_difference_mask(diff, threshold)
+    return out
+
+def _change_bound(value_ranges):
+    """
+    (gain, offset) such that the combined difference at any pixel is at most
+    gain * max|img1 - img2| + offset over its 2-pixel neighbourhood: both blurs are
+    averages and the grayscale conversion only adds rounding error.
+    """
+    (lo1, hi1), (lo2, hi2) = [(float(lo), float(hi)) for lo, hi in value_ranges]
+    s1 = 1.0 / (hi1 - lo1) if hi1 > lo1 else 0.0
+    s2 = 1.0 / (hi2 - lo2) if hi2 > lo2 else 0.0
+    offset = abs(s1 - s2) * hi2 + abs(lo1 * s1 - lo2 * s2) + 2.0 / 255 + 1e-6
+    return s1, offset
+
+def downscale_strips(img, factor, strip_rows=1024):
+    """
+    img shrunk by factor with area interpolation, one strip of rows at a time so a
+    memory-mapped image is never read whole
+    """
+    h, w = img.shape[:2]
+    rows = max(factor, strip_rows - strip_rows % factor)
+    strips = []
+    for y0 in range(0, h, rows):
+        y1 = min(h, y0 + rows)
+        strips.append(cv2.resize(np.asarray(img[y0:y1]), (max(1, w // factor), max(1, (y1 - y0) // factor)),
+                                 interpolation=cv2.INTER_AREA))
+    return np.concatenate(strips)
+
+def compute_difference_mask_pyramid(img1, img2, threshold=0.3, factor=8, tile_size=256,
+                                    overlap=16, coarse_threshold=None, exact=True, out=None):
+    """
+    Coarse-to-fine binary difference mask for large image pairs.
+    The combined colour/structure difference is first computed on a copy downscaled by
+    factor; tiles whose coarse difference reaches coarse_threshold (default threshold/2)
+    are recomputed at full resolution, every other tile is left unchanged.
+    With exact=True, tiles the coarse level rejected are also checked against a cheap
+    upper bound from the raw absolute difference, so a change too small to survive
+    downscaling is never dropped and the mask equals the full-resolution one.
+    img1/img2 may be aligned np.memmap arrays and out a preallocated (e.g. memory-mapped)
+    bool mask; the coarse copies are built strip by strip.
+    Returns (mask, fraction of tiles recomputed at full resolution).
+    """
+    if img1.shape[:2] != img2.shape[:2]:
+        img1, img2 = align_and_resize_images(img1, img2)
+    h, w = img1.shape[:2]
+    if coarse_threshold is None:
+        coarse_threshold = threshold / 2
+    value_ranges = ((img1.min(), img1.max()), (img2.min(), img2.max()))
+
+    coarse, _, _ = compute_difference_map(downscale_strips(img1, factor), downscale_strips(img2, factor))
+    sy, sx = coarse.shape[0] / h, coarse.shape[1] / w
+    gain, offset = _change_bound(value_ranges)
+
+    mask = np.zeros((h, w), dtype=bool) if out is None else out
+    tiles = list(iter_tiles(h, w, tile_size))
+    refined = 0
+    for bounds in tiles:
+        y0, y1, x0, x1 = bounds
+        # Coarse cells covering the tile, with one cell of margin
+        cy0, cy1 = max(0, int(y0 * sy) - 1), int(np.ceil(y1 * sy)) + 1
+        cx0, cx1 = max(0, int(x0 * sx) - 1), int(np.ceil(x1 * sx)) + 1
+        changed = coarse[cy0:cy1, cx0:cx1].max() >= coarse_threshold
+        if not changed and exact:
+            ry0, ry1, rx0, rx1 = max(0, y0 - 2), min(h, y1 + 2), max(0, x0 - 2), min(w, x1 + 2)
+            max_abs = cv2.absdiff(img1[ry0:ry1, rx0:rx1], img2[ry0:ry1, rx0:rx1]).max()
+            changed = gain * float(max_abs) + offset >= threshold
+        if changed:
+            diff = tile_difference_map(img1, img2, bounds, value_ranges, overlap)
+            mask[y0:y1, x0:x1] = binary_difference_mask(diff, threshold)
+            refined += 1
+
+    return mask, refined / len(tiles)
+
+def image_size(path):
+    """
+    (width, height) of an image file, read from its header without decoding the pixels
+    """
+    from PIL import Image
+
+    with Image.open(path) as im:
+        return im.size
+
+def read_aligned_tiled(path, out, tile_size=1024):
+    """
+    Decode an image into out, an (h, w, 3) uint8 array (e.g. a memmap), tile by tile,
+    Lanczos-resizing it to out's size on the way. Only the decoded source and one tile
+    are in memory at a time; no full-size aligned or float copy is made.
+    """
+    from PIL import Image
+
+    h, w = out.shape[:2]
+    with Image.open(path) as im:
+        if im.mode != 'RGB':
+            im = im.convert('RGB')
+        sx, sy = im.width / w, im.height / h
+        for y0, y1, x0, x1 in iter_tiles(h, w, tile_size):
+            if im.size == (w, h):
+                tile = im.crop((x0, y0, x1, y1))
+            else:
+                tile = im.resize((x1 - x0, y1 - y0), Image.LANCZOS, box=(x0 * sx, y0 * sy, x1 * sx, y1 * sy))
+            out[y0:y1, x0:x1] = np.asarray(tile)
+    if hasattr(out, 'flush'):
+        out.flush()
+    return out
+
+def write_mask_png(mask, path, rows=1024):
+    """
+    Write a binary mask as an 8-bit grayscale PNG, rows lines at a time, so a
+    memory-mapped mask is never loaded whole
+    """
+    import zlib
+    import struct
+
+    def chunk(f, tag, data):
+        f.write(struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data)))
+
+    h, w = mask.shape
+    compressor = zlib.compressobj(6)
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        chunk(f, b'IHDR', struct.pack('>IIBBBBB', w, h, 8, 0, 0, 0, 0))
+        for y0 in range(0, h, rows):
+            strip = np.asarray(mask[y0:y0 + rows])
+            # Every scanline starts with its filter type byte, 0 (none)
+            scanlines = np.zeros((strip.shape[0], w + 1), dtype=np.uint8)
+            scanlines[:, 1:] = strip.astype(np.uint8) * 255
+            data = compressor.compress(scanlines.tobytes())
+            if data:
+                chunk(f, b'IDAT', data)
+        chunk(f, b'IDAT', compressor.flush())
+        chunk(f, b'IEND', b'')
+
+def difference_regions_tiled(mask, min_area=50, pad=10, merge_gap=15, max_regions=None, tile_size=1024):
+    """
+    difference_regions for a mask too large to label at once (e.g. a memmap): groups are
+    found tile by tile, then groups within merge_gap of each other across tile edges
+    are joined by box before the min_area filter, padding and overlap merge.
+    """
+    h, w = mask.shape
+    boxes, areas = [], []
+    for y0, y1, x0, x1 in iter_tiles(h, w, tile_size):
+        for region in difference_regions(np.asarray(mask[y0:y1, x0:x1]), min_area=1, pad=0, merge_gap=merge_gap):
+            bx0, by0, bx1, by1 = region['box']
+            boxes.append([bx0 + x0, by0 + y0, bx1 + x0, by1 + y0])
+            areas.append(region['area'])
+
+    # Boxes grown by half the gap overlap exactly when the groups are within merge_gap
+    half = (merge_gap + 1) // 2
+    grown, areas = _merge_overlapping([[x0 - half, y0 - half, x1 + half, y1 + half]
+                                       for x0, y0, x1, y1 in boxes], areas)
+
+    boxes, box_areas = [], []
+    for (x0, y0, x1, y1), area in zip(grown, areas):
+        if area < min_area:
+            continue
+        boxes.append([max(0, x0 + half - pad), max(0, y0 + half - pad),
+                      min(w - 1, x1 - half + pad), min(h - 1, y1 - half + pad)])
+        box_areas.append(area)
+
+    boxes, box_areas = _merge_overlapping(boxes, box_areas)
+    regions = [dict(box=box, category='change', area=area) for box, area in zip(boxes, box_areas)]
+    regions = sorted(regions, key=lambda r: r['area'], reverse=True)
+    if max_regions is not None:
+        regions = regions[:max_regions]
+    return regions
+
+def process_image_pair(job):
+    """
+    Batch worker: diff one image pair, write its mask PNG and return its index entry.
+    Pairs larger than max_pixels are decoded and aligned tile by tile into memory-mapped
+    scratch files, diffed tile by tile (or coarse-to-fine with pyramid), and their mask
+    PNG and regions are computed from the memory-mapped mask, so no full-size array is
+    ever held in RAM.
+    """
+    import os
+    import tempfile
+
+    from PIL import Image
+
+    # Huge pairs are what the tiled path is for; don't let PIL's decompression-bomb guard refuse them
+    Image.MAX_IMAGE_PIXELS = None
+    name, path1, path2, opts = job
+    (w1, h1), (w2, h2) = image_size(path1), image_size(path2)
+    w, h = max(w1, w2), max(h1, h2)
+
+    if h * w > opts['max_pixels']:
+        with tempfile.TemporaryDirectory(dir=opts.get('scratch_dir')) as scratch:
+            img1, img2 = [
+                read_aligned_tiled(path, np.lib.format.open_memmap(
+                    os.path.join(scratch, f'image{i}.npy'), mode='w+', dtype=np.uint8, shape=(h, w, 3)),
+                    opts['tile_size'])
+                for i, path in ((1, path1), (2, path2))]
+            mask = np.lib.format.open_memmap(
+                os.path.join(scratch, 'mask.npy'), mode='w+', dtype=bool, shape=(h, w))
+            if opts.get('pyramid'):
+                compute_difference_mask_pyramid(
+                    img1, img2, opts['threshold'], tile_size=opts['tile_size'], overlap=opts['tile_overlap'],
+                    out=mask)
+            else:
+                compute_difference_mask_tiled(
+                    img1, img2, opts['threshold'], opts['tile_size'], opts['tile_overlap'], out=mask)
+            del img1, img2
+            return _index_entry(name, path1, path2, mask, opts, tiled=True)
+
+    img1, img2 = load_image_pair(path1, path2)
+    img1, img2 = align_and_resize_images(img1, img2) if img1.shape[:2] != img2.shape[:2] else (img1, img2)
+    if opts.get('pyramid'):
+        mask, _ = compute_difference_mask_pyramid(
+            img1, img2, opts['threshold'], tile_size=opts['tile_size'], overlap=opts['tile_overlap'])
+    else:
+        diff_map, _, _ = compute_difference_map(img1, img2)
+        mask = binary_difference_mask(diff_map, opts['threshold'])
+    return _index_entry(name, path1, path2, mask, opts)
+
+def _index_entry(name, path1, path2, mask, opts, tiled=False):
+    import os
+
+    h, w = mask.shape
+    mask_path = os.path.join(opts['out_dir'], f'{name}_mask.png')
+    region_opts = dict(min_area=opts['min_area'], pad=opts['pad'], merge_gap=opts['merge_gap'])
+    if tiled:
+        write_mask_png(mask, mask_path, rows=opts['tile_size'])
+        regions = difference_regions_tiled(mask, tile_size=opts['tile_size'], **region_opts)
+    else:
+        cv2.imwrite(mask_path, mask.astype(np.uint8) * 255)
+        regions = difference_regions(mask, **region_opts)
+    return dict(
+        name=name,
+        image1=path1,
+        image2=path2,
+        size=[w, h],
+        mask=mask_path,
+        changed_fraction=np.count_nonzero(mask) / mask.size,
+        regions=regions)
+
+IMAGE_EXTENSIONS =('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.webp')
+
+def find_image_pairs(directory):
+    """
+    Pair up images in a directory named <name>1.<ext> / <name>2.<ext> (e.g. camel1.png, camel2.png)
+    """
+    import os
+
+    files = {}
+    for fname in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(fname)
+        if ext.lower() in IMAGE_EXTENSIONS and stem[-1:] in ('1', '2'):
+            files.setdefault(stem[:-1], {})[stem[-1]] = os.path.join(directory, fname)
+
+    return [(name.rstrip('_-') or name, paths['1'], paths['2'])
+            for name, paths in files.items() if '1' in paths and '2' in paths]
+
+def read_manifest(path):
+    """
+    Read image pairs from a manifest with one "image1,image2[,name]" entry per line.
+    Relative paths are resolved against the manifest's directory; # starts a comment.
+    """
+    import os
+
+    base = os.path.dirname(os.path.abspath(path))
+    pairs = []
+    with open(path) as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            parts = [p.strip() for p in line.replace('\t', ',').split(',')]
+            path1, path2 = [os.path.join(base, p) for p in parts[:2]]
+            name = parts[2] if len(parts) > 2 else os.path.splitext(os.path.basename(path1))[0]
+            pairs.append((name, path1, path2))
+    return pairs
+
+def batch_difference_heatmaps(pairs, out_dir, threshold=0.3, workers=None, max_pixels=16_000_000,
+                              tile_size=1024, tile_overlap=16, min_area=50, pad=10, merge_gap=15,
+                              scratch_dir=None, pyramid=False):
+    """
+    Diff many (name, image1, image2) pairs across a process pool. Writes <name>_mask.png per pair
+    and an index.json of changed regions to out_dir; returns the index entries.
+    pyramid=True uses compute_difference_mask_pyramid instead of the full/tiled diff.
+    """
+    import os
+    import json
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    os.makedirs(out_dir, exist_ok=True)
+    opts = dict(out_dir=out_dir, threshold=threshold, max_pixels=max_pixels, tile_size=tile_size,
+                tile_overlap=tile_overlap, min_area=min_area, pad=pad, merge_gap=merge_gap,
+                scratch_dir=scratch_dir, pyramid=pyramid)
+
+    index, errors = [], []
+    with ProcessPoolExecutor(max_workers=workers, initializer=cv2.setNumThreads, initargs=(1,)) as pool:
+        futures = {pool.submit(process_image_pair, (name, p1, p2, opts)): name for name, p1, p2 in pairs}
+        for future in as_completed(futures):
+            try:
+                index.append(future.result())
+            except Exception as e:
+                errors.append(dict(name=futures[future], error=str(e)))
+                print(f"Error on {futures[future]}: {e}")
+
+    index = sorted(index, key=lambda entry: entry['name'])
+    with open(os.path.join(out_dir, 'index.json'), 'w') as f:
+        json.dump(dict(threshold=threshold, pairs=index, errors=errors), f, indent=2)
+    return index
+
 if __name__ == "__main__":
+    import os
     import sys
     import argparse
     
-    image1 = "visprog_new/assets/difflive1.png"
-    image2 = "visprog_new/assets/difflive2.png"
-    parser = argparse.ArgumentParser(description='Compare two images and generate difference heatmap')
-    # parser.add_argument('image1', help='Path to first image')
-    # parser.add_argument('image2', help='Path to second image')
+    parser = argparse.ArgumentParser(description='Compare image pairs and generate difference heatmaps')
+    parser.add_argument('inputs', nargs='*',
+                      help='Two image paths (single heatmap), or a directory of <name>1/<name>2 '
+                           'image pairs / a manifest file of "image1,image2[,name]" lines (batch mode)')
     parser.add_argument('--threshold', type=float, default=0.3,
                       help='Minimum difference threshold (0-1 range, default: 0.3)')
+    parser.add_argument('--out', default='heatmaps', help='Batch output directory (default: heatmaps)')
+    parser.add_argument('--workers', type=int, default=None, help='Batch worker processes (default: CPU count)')
+    parser.add_argument('--max-pixels', type=int, default=16_000_000,
+                      help='Pairs larger than this are diffed in memory-mapped tiles (default: 16M)')
+    parser.add_argument('--tile-size', type=int, default=1024, help='Tile size in pixels (default: 1024)')
+    parser.add_argument('--tile-overlap', type=int, default=16, help='Tile overlap in pixels (default: 16)')
+    parser.add_argument('--min-area', type=int, default=50, help='Minimum changed pixels per region (default: 50)')
+    parser.add_argument('--pad', type=int, default=10, help='Region padding in pixels (default: 10)')
+    parser.add_argument('--merge-gap', type=int, default=15, help='Merge regions closer than this (default: 15)')
+    parser.add_argument('--pyramid', action='store_true',
+                      help='Coarse-to-fine mode: only recompute tiles that change at low resolution')
     
     args = parser.parse_args()
     
     try:
-        output_path = generate_difference_heatmap(image1, image2, args.threshold)
-        print(f"Heatmap saved as: {output_path}")
-        print("Additional visualization saved as: difference2.png")
+        if len(args.inputs) == 1:
+            source = args.inputs[0]
+            pairs = find_image_pairs(source) if os.path.isdir(source) else read_manifest(source)
+            index = batch_difference_heatmaps(
+                pairs, args.out, threshold=args.threshold, workers=args.workers,
+                max_pixels=args.max_pixels, tile_size=args.tile_size, tile_overlap=args.tile_overlap,
+                min_area=args.min_area, pad=args.pad, merge_gap=args.merge_gap, pyramid=args.pyramid)
+            print(f"Processed {len(index)}/{len(pairs)} pairs; index saved as: {os.path.join(args.out, 'index.json')}")
+        else:
+            image1, image2 = args.inputs if len(args.inputs) == 2 else (
+                "visprog_new/assets/difflive1.png", "visprog_new/assets/difflive2.png")
+            output_path = generate_difference_heatmap(image1, image2, args.threshold)
+            print(f"Heatmap saved as: {output_path}")
+            print("Additional visualization saved as: difference2.png")
     except Exception as e:
         print(f"Error: {str(e)}")
-        sys.exit(1) 
\ No newline at end of file
+        sys.exit(1)
@@ -1,5 +1,7 @@
 import random
 
+from prompts.retrieval import ExampleIndex
+
 GQA_CURATED_EXAMPLES=[
 """Question: Is the vehicle in the top of the image?
 Program:
@@ -172,12 +174,17 @@ FINAL_RESULT=RESULT(var=ANSWER1)
 """,
 ]
 
-def create_prompt(inputs,num_prompts=8,method='random',seed=42,group=0):
+# Built once; method='retrieval' picks the examples closest to each question
+GQA_EXAMPLE_INDEX = ExampleIndex(GQA_CURATED_EXAMPLES)
+
+def create_prompt(inputs,num_prompts=8,method='random',seed=42,group=0,max_tokens=None):
     if method=='all':
         prompt_examples = GQA_CURATED_EXAMPLES
     elif method=='random':
         random.seed(seed)
         prompt_examples = random.sample(GQA_CURATED_EXAMPLES,num_prompts)
+    elif method=='retrieval':
+        prompt_examples = GQA_EXAMPLE_INDEX.select(inputs['question'],k=num_prompts,max_tokens=max_tokens)
     else:
         raise NotImplementedError
 
@@ -1,5 +1,7 @@
 import random
 
+from prompts.retrieval import ExampleIndex
+
 NLVR_CURATED_EXAMPLES=[
 """Statement: An image shows one bare hand with the thumb on the right holding up a belly-first, head-up crab, with water in the background.
 Program:
@@ -104,12 +106,17 @@ FINAL_ANSWER=RESULT(var=ANSWER2)
 """
 ]
 
-def create_prompt(inputs,num_prompts=8,method='random',seed=42,group=0):
+# Built once; method='retrieval' picks the examples closest to each statement
+NLVR_EXAMPLE_INDEX = ExampleIndex(NLVR_CURATED_EXAMPLES)
+
+def create_prompt(inputs,num_prompts=8,method='random',seed=42,group=0,max_tokens=None):
     if method=='random':
         random.seed(seed)
         prompt_examples = random.sample(NLVR_CURATED_EXAMPLES,num_prompts)
     elif method=='all':
         prompt_examples = NLVR_CURATED_EXAMPLES
+    elif method=='retrieval':
+        prompt_examples = NLVR_EXAMPLE_INDEX.select(inputs['statement'],k=num_prompts,max_tokens=max_tokens)
     else:
         raise NotImplementedError
 
@@ -0,0 +1,87 @@
+import math
+import re
+from collections import Counter
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+a an the is are was were be been of in on at to for with and or there this that these those
+image images picture one each both it its does do did has have any some what which who how
+""".split())
+
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def stem(token):
+    # Plural-insensitive matching is most of what stemming buys on these questions
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def approx_tokens(text):
+    """Rough LLM token count (about 4 characters per token)"""
+    return math.ceil(len(text) / 4)
+
+
+class ExampleIndex:
+    """
+    BM25 index over curated few-shot examples. Each example is indexed by its first
+    line (the Statement/Question) and the questions its program asks, so a new
+    question retrieves the examples with the most similar wording.
+
+        index = ExampleIndex(NLVR_CURATED_EXAMPLES)
+        index.select('There are two dogs in the left image', k=4, max_tokens=600)
+    """
+    def __init__(self, examples, k1=1.2, b=0.75, count_tokens=approx_tokens):
+        self.examples = list(examples)
+        self.k1 = k1
+        self.b = b
+        self.count_tokens = count_tokens
+        self.docs = [Counter(stem(t) for t in tokenize(self.index_text(ex))) for ex in self.examples]
+        self.lengths = [sum(doc.values()) for doc in self.docs]
+        self.avg_length = sum(self.lengths) / max(1, len(self.lengths))
+        df = Counter(term for doc in self.docs for term in doc)
+        n = len(self.docs)
+        self.idf = {term: math.log(1 + (n - f + 0.5) / (f + 0.5)) for term, f in df.items()}
+        self.sizes = [count_tokens(ex) for ex in self.examples]
+
+    @staticmethod
+    def index_text(example):
+        lines = example.strip().split('\n')
+        asked = re.findall(r"question=['\"](.*?)['\"]", example)
+        return ' '.join([lines[0]] + asked)
+
+    def scores(self, query):
+        terms = [stem(t) for t in tokenize(query)]
+        scores = []
+        for doc, length in zip(self.docs, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / self.avg_length)
+            score = 0.0
+            for term in terms:
+                tf = doc.get(term, 0)
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            scores.append(score)
+        return scores
+
+    def select(self, query, k=8, max_tokens=None):
+        """
+        Up to k examples most similar to query whose total size stays within max_tokens,
+        ordered from least to most similar so the closest example sits next to the query.
+        Ties keep the curated order.
+        """
+        scores = self.scores(query)
+        ranked = sorted(range(len(self.examples)), key=lambda i: -scores[i])
+        chosen, used = [], 0
+        for i in ranked:
+            if len(chosen) == k:
+                break
+            if max_tokens is not None and used + self.sizes[i] > max_tokens:
+                continue
+            chosen.append(i)
+            used += self.sizes[i]
+        return [self.examples[i] for i in reversed(chosen)]
@@ -3,6 +3,7 @@ import base64
 import numpy as np
 from io import BytesIO
 import math
+import weakref
 
 def image_formatter(img_path,size=224,vertical_align='middle'):
     img = Image.open(img_path)
@@ -13,13 +14,27 @@ def image_formatter(img_path,size=224,vertical_align='middle'):
     return f'<img style="vertical-align:{vertical_align}" src="data:image/jpeg;base64,{base64_img}">'
 
 
+# Rendered <img> tags keyed by image identity, then thumbnail size. Entries are
+# dropped when the image is garbage collected, so ids are never reused stale.
+_embed_cache = dict()
+
 def html_embed_image(img,size=100):
-    img =  img.copy()
-    img.thumbnail((size,size), Image.ANTIALIAS)
-    with BytesIO() as buffer:
-        img.save(buffer, 'jpeg')
-        base64_img = base64.b64encode(buffer.getvalue()).decode()
-    return f'<img style="vertical-align:middle" src="data:image/jpeg;base64,{base64_img}">'
+    try:
+        cached = _embed_cache.get(id(img))
+        if cached is None:
+            cached = _embed_cache[id(img)] = dict()
+            weakref.finalize(img, _embed_cache.pop, id(img), None)
+    except TypeError:
+        cached = dict()
+
+    if size not in cached:
+        thumb = img.copy()
+        thumb.thumbnail((size,size), Image.ANTIALIAS)
+        with BytesIO() as buffer:
+            thumb.save(buffer, 'jpeg')
+            base64_img = base64.b64encode(buffer.getvalue()).decode()
+        cached[size] = f'<img style="vertical-align:middle" src="data:image/jpeg;base64,{base64_img}">'
+    return cached[size]
 
 def html_colored_span(content,color):
     return f"<span style='color: {color};'>{content}</span>"